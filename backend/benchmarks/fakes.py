@@ -0,0 +1,301 @@
+# In-process stand-ins for the upstream services a Hike talks to.
+#
+# FakeGPT, FakePerplexity and FakeSupabase expose the methods Hike, GraphLoader
+# and WriteBuffer call on the real clients, sleep for a configurable latency on
+# every call, and count the calls they receive. Responses are deterministic, so
+# two runs with the same settings build the same hikes.
+#
+# FakeLuma serves Luma's generations API to a real AsyncLumaAI client through
+# an httpx MockTransport, for ImagePipeline.
+
+import asyncio
+import json
+import random
+import time
+import typing
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Type
+
+import httpx
+from lumaai import AsyncLumaAI
+from pydantic import BaseModel
+
+
+class Latency:
+    """
+    Simulated latency: `mean` seconds, spread uniformly by +/- `jitter` of it.
+    """
+    def __init__(self, mean: float = 0.0, jitter: float = 0.2, seed: int = 0):
+        self.mean = mean
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+
+    async def wait(self):
+        if self.mean > 0:
+            await asyncio.sleep(self.mean * self.rng.uniform(1 - self.jitter, 1 + self.jitter))
+        else:
+            # Still yield, so concurrency behaves as it would against a network
+            await asyncio.sleep(0)
+
+
+def fake_value(annotation, label: str, counter: int, list_size: int):
+    """
+    A plausible value for one field of a structured-output schema.
+    """
+    if typing.get_origin(annotation) is list:
+        (item,) = typing.get_args(annotation) or (str,)
+        if item is int:
+            return []
+        return [f"{label} {counter}.{i}" for i in range(list_size)]
+    if annotation is bool:
+        return False
+    if annotation is int:
+        return 0
+    if annotation is float:
+        return 0.5
+    return f"{label} {counter}"
+
+
+class FakeGPT:
+    """
+    Stands in for gpt.AsyncGPTInterface. Every list field of a structured
+    response gets `topics_per_call` fresh, unique topics.
+    """
+    def __init__(self, latency: Latency = None, topics_per_call: int = 3):
+        self.model = "fake-gpt"
+        self.latency = latency or Latency()
+        self.topics_per_call = topics_per_call
+        self.calls = Counter()
+        self.responses = 0
+
+    async def run_prompt(self, prompt: str, data: Any, schema_model: Type[BaseModel], system_role: str = None) -> BaseModel:
+        self.calls["run_prompt"] += 1
+        await self.latency.wait()
+        self.responses += 1
+        return schema_model(**{
+            name: fake_value(field.annotation, "topic", self.responses, self.topics_per_call)
+            for name, field in schema_model.model_fields.items()
+        })
+
+    async def chat_completion(self, chat_history) -> dict:
+        self.calls["chat_completion"] += 1
+        await self.latency.wait()
+        return {"role": "assistant", "content": f"Reply to {len(chat_history)} messages"}
+
+    async def stream_prompt(self, prompt: str, data: Any, system_role: str = None):
+        self.calls["stream_prompt"] += 1
+        await self.latency.wait()
+        for word in "This is a streamed reply".split():
+            yield word + " "
+
+
+class FakePerplexity:
+    """
+    Stands in for perplexity.AsyncPerplexityInterface, returning the raw JSON
+    content of a structured response.
+    """
+    def __init__(self, latency: Latency = None):
+        self.latency = latency or Latency()
+        self.calls = Counter()
+
+    async def run_prompt(self, prompt: str, schema_model: Type[BaseModel], system_role: str = None) -> str:
+        self.calls["run_prompt"] += 1
+        await self.latency.wait()
+        return json.dumps({
+            name: fake_value(field.annotation, "resource", self.calls["run_prompt"], 2)
+            for name, field in schema_model.model_fields.items()
+        })
+
+
+class FakeResponse:
+    def __init__(self, data: List[dict]):
+        self.data = data
+
+
+class FakeQuery:
+    """
+    The subset of the postgrest query builder the backend uses.
+    """
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.operation = "select"
+        self.columns = None
+        self.payload = None
+        self.on_conflict = None
+        self.filters = []
+        self.bounds = None
+        self.order_by = []
+
+    def select(self, columns: str = "*", **kwargs):
+        self.operation = "select"
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.operation, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "id", **kwargs):
+        self.operation, self.payload = "upsert", payload
+        self.on_conflict = [c.strip() for c in on_conflict.split(",")]
+        return self
+
+    def update(self, payload, **kwargs):
+        self.operation, self.payload = "update", payload
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column: str, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def is_(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is None if value == "null" else row.get(column) == value)
+        return self
+
+    def range(self, start: int, end: int):
+        self.bounds = (start, end + 1)
+        return self
+
+    def limit(self, count: int):
+        self.bounds = (0, count)
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs):
+        # Chained calls sort by several columns, like postgrest-py
+        self.order_by.append((column, desc))
+        return self
+
+    async def execute(self) -> FakeResponse:
+        self.db.round_trips[f"{self.operation}:{self.table}"] += 1
+        await self.db.latency.wait()
+        rows = self.db.tables.setdefault(self.table, [])
+
+        if self.operation in ("insert", "upsert"):
+            payload = self.payload if isinstance(self.payload, list) else [self.payload]
+            written = [{"id": str(uuid.uuid4()), **row} for row in payload]
+            if self.operation == "upsert":
+                keys = {tuple(row.get(c) for c in self.on_conflict) for row in written}
+                rows[:] = [row for row in rows if tuple(row.get(c) for c in self.on_conflict) not in keys]
+            rows.extend(written)
+            return FakeResponse([dict(row) for row in written])
+
+        matched = [row for row in rows if all(f(row) for f in self.filters)]
+        if self.operation == "update":
+            for row in matched:
+                row.update(self.payload)
+            return FakeResponse([dict(row) for row in matched])
+        if self.operation == "delete":
+            matched_ids = {id(row) for row in matched}
+            rows[:] = [row for row in rows if id(row) not in matched_ids]
+            return FakeResponse(matched)
+
+        # Stable sorts, least significant column first
+        for column, desc in reversed(self.order_by):
+            matched.sort(key=lambda row: row.get(column) or "", reverse=desc)
+        if self.bounds:
+            matched = matched[self.bounds[0]:self.bounds[1]]
+        if self.db.max_rows is not None:
+            matched = matched[:self.db.max_rows]
+        if self.columns:
+            return FakeResponse([{c: row.get(c) for c in self.columns} for row in matched])
+        return FakeResponse([dict(row) for row in matched])
+
+
+class FakeSupabase:
+    """
+    Stands in for supabase.AsyncClient, keeping every table in memory. Every
+    `execute()` is one round trip, counted per operation and table. Like
+    PostgREST's db-max-rows, selects silently return at most `max_rows` rows.
+    """
+    def __init__(self, latency: Latency = None, max_rows: int = 1000):
+        self.latency = latency or Latency()
+        self.max_rows = max_rows
+        self.tables: Dict[str, List[dict]] = {}
+        self.round_trips = Counter()
+
+    def from_(self, table: str) -> FakeQuery:
+        return FakeQuery(self, table)
+
+    table = from_
+
+    def reset_counts(self):
+        self.round_trips.clear()
+
+
+class FakeLuma:
+    """
+    Stands in for Luma's generations API. `client` is an AsyncLumaAI whose
+    requests are answered in process. A generation completes on its
+    `polls`-th poll, except that prompts containing "fail" fail there and
+    prompts containing "stall" never finish. Tracks how many generations are
+    unfinished at once and when each one was polled.
+    """
+    def __init__(self, latency: Latency = None, polls: int = 2):
+        self.latency = latency or Latency()
+        self.polls = polls
+        # generation ID -> {"prompt", "state", "created_at", "polled_at": [...]}
+        self.generations: Dict[str, dict] = {}
+        self.active = 0
+        self.peak_active = 0
+        self.client = AsyncLumaAI(
+            auth_token="fake",
+            base_url="http://luma.fake/dream-machine/v1",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.handle)),
+            max_retries=0,
+        )
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await self.latency.wait()
+        path = request.url.path.removeprefix("/dream-machine/v1")
+
+        if request.method == "POST" and path == "/generations/image":
+            generation_id = str(uuid.uuid4())
+            self.generations[generation_id] = {
+                "prompt": json.loads(request.content)["prompt"],
+                "state": "queued",
+                "created_at": time.monotonic(),
+                "polled_at": [],
+            }
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            return httpx.Response(201, json=self.to_dict(generation_id))
+
+        if request.method == "GET" and path.startswith("/generations/"):
+            generation_id = path.rsplit("/", 1)[-1]
+            generation = self.generations.get(generation_id)
+            if generation is None:
+                return httpx.Response(404, json={"detail": "Generation not found"})
+
+            generation["polled_at"].append(time.monotonic())
+            if generation["state"] in ("queued", "dreaming"):
+                generation["state"] = "dreaming"
+                if len(generation["polled_at"]) >= self.polls and "stall" not in generation["prompt"]:
+                    generation["state"] = "failed" if "fail" in generation["prompt"] else "completed"
+                    self.active -= 1
+            return httpx.Response(200, json=self.to_dict(generation_id))
+
+        return httpx.Response(404, json={"detail": "Not found"})
+
+    def to_dict(self, generation_id: str) -> dict:
+        generation = self.generations[generation_id]
+        completed = generation["state"] == "completed"
+        return {
+            "id": generation_id,
+            "generation_type": "image",
+            "state": generation["state"],
+            "failure_reason": "Fake failure" if generation["state"] == "failed" else None,
+            "assets": {"image": f"https://luma.fake/{generation_id}.jpg"} if completed else None,
+            "model": "photon-1",
+            "request": {"prompt": generation["prompt"]},
+        }
@@ -0,0 +1,302 @@
+# Offline benchmarks for the Hike build and read paths.
+#
+# Runs entirely against the fakes in benchmarks/fakes.py, so no API keys or
+# network are needed and results are comparable between runs. Measures:
+#   - hike_build: wall time of generate_initial_node + generate_trails, with
+#     upstream call counts and database round trips,
+#   - get_trails: round trips and wall time to load hikes of growing size,
+#   - traversal: find_node_parents / find_node_children (at their default
+#     depths) and a full descendant walk on synthetic trails of 10 to 100k
+#     nodes, for both Trail and CSRTrail.
+#
+# Results are written as JSON. With --baseline, counts that grew or timings
+# that slowed by more than --tolerance are reported and the exit code is 1.
+#
+# Usage (from backend/):
+#   python -m benchmarks.run --output bench.json
+#   python -m benchmarks.run --baseline bench.json
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from typing import Dict, List
+
+# The default OpenAI embedder would need an API key just to construct a Hike
+os.environ.setdefault("VECTOR_EMBEDDER", "hashing")
+
+from graph import CSRTrail, Node, Trail
+from hike import Hike
+from resource_index import ResourceIndex
+from vector_index import HashingEmbedder, VectorIndex
+
+from benchmarks.fakes import FakeGPT, FakePerplexity, FakeSupabase, Latency
+
+TRAVERSAL_SIZES = (10, 100, 1000, 10000, 100000)
+GET_TRAILS_SIZES = (10, 100, 1000, 5000)
+# Each traversal is repeated until it has run for at least this long
+TIMING_MIN_SECONDS = 0.05
+# Fields that identify an entry of a list-valued result, for --baseline
+SIZE_FIELDS = {"get_trails": ("nodes_per_trail",), "traversal": ("nodes", "graph")}
+
+USER_RESPONSE = SimpleNamespace(
+    topic="Poker Skills Improvement",
+    topic_description="Learn how to play poker!",
+    satisfied_prereqs=["Basic poker rules", "Hand rankings knowledge"],
+    objective="To get good at poker for fun.",
+    additional_info="Learner prefers heavy brain usage.",
+    preferred_media_types=["podcasts"],
+    preferred_difficulty="medium",
+    notes="Learner is familiar with betting strategies but has not practiced them yet.",
+)
+
+
+def make_hike(db: FakeSupabase, gpt: FakeGPT = None, perplexity: FakePerplexity = None) -> Hike:
+    hike = Hike(db, gpt or FakeGPT(), perplexity or FakePerplexity())
+    # Fresh indexes, so runs do not share warm caches through the module singletons
+    hike.resource_index = ResourceIndex()
+    hike.vector_index = VectorIndex(HashingEmbedder())
+    hike.topic = USER_RESPONSE.topic
+    hike.preferred_media = USER_RESPONSE.preferred_media_types
+    hike.preferred_difficulty = USER_RESPONSE.preferred_difficulty
+    return hike
+
+
+async def bench_hike_build(args) -> Dict:
+    runs = []
+    for run in range(args.repeat):
+        db = FakeSupabase(Latency(args.db_latency, seed=run), max_rows=args.db_max_rows)
+        gpt = FakeGPT(Latency(args.gpt_latency, seed=run), topics_per_call=args.topics)
+        perplexity = FakePerplexity(Latency(args.perplexity_latency, seed=run))
+        hike = make_hike(db, gpt, perplexity)
+
+        start = time.perf_counter()
+        await hike.generate_initial_node(USER_RESPONSE)
+        await hike.generate_trails(USER_RESPONSE)
+        runs.append({
+            "seconds": time.perf_counter() - start,
+            "trails": len(hike.trails),
+            "nodes": len(hike.nodes),
+            "gpt_calls": sum(gpt.calls.values()),
+            "perplexity_calls": sum(perplexity.calls.values()),
+            "db_round_trips": sum(db.round_trips.values()),
+            "db_round_trips_by_query": dict(sorted(db.round_trips.items())),
+        })
+
+    return {
+        "latency": {"gpt": args.gpt_latency, "perplexity": args.perplexity_latency, "db": args.db_latency},
+        "topics_per_call": args.topics,
+        "seconds_median": statistics.median(run["seconds"] for run in runs),
+        "seconds_min": min(run["seconds"] for run in runs),
+        # Counts are deterministic, so the last run stands for all of them
+        **{key: value for key, value in runs[-1].items() if key != "seconds"},
+    }
+
+
+def seed_hike(db: FakeSupabase, trails: int, nodes_per_trail: int) -> str:
+    """
+    Write a trailhead with `trails` tree-shaped trails straight into the fake tables.
+    """
+    trailhead_id = "trailhead"
+    resources = [{"id": trailhead_id, "title": "Trailhead", "description": "Root", "image_url": None}]
+    db.tables["resources"] = resources
+    db.tables["trails"] = []
+    db.tables["edges"] = []
+
+    for t in range(trails):
+        trail_id = f"trail-{t}"
+        db.tables["trails"].append({"id": trail_id, "trail_title": f"Trail {t}", "trailhead_id": trailhead_id})
+        node_ids = [trailhead_id] + [f"node-{t}-{i}" for i in range(1, nodes_per_trail)]
+        for i, node_id in enumerate(node_ids[1:], start=1):
+            resources.append({"id": node_id, "title": f"Topic {t}.{i}", "description": "x" * 200, "image_url": None})
+            db.tables["edges"].append({"id_a": node_ids[(i - 1) // 3], "id_b": node_id, "trail_id": trail_id})
+    return trailhead_id
+
+
+async def bench_get_trails(args) -> List[Dict]:
+    results = []
+    for size in args.get_trails_sizes:
+        db = FakeSupabase(Latency(args.db_latency), max_rows=args.db_max_rows)
+        trailhead_id = seed_hike(db, args.trails, size)
+        hike = make_hike(db)
+        hike.trailhead_id = trailhead_id
+
+        db.reset_counts()
+        start = time.perf_counter()
+        trails = await hike.get_trails()
+        # A loader that stops at the row cap still "succeeds", just with less of the graph
+        expected_nodes = 1 + args.trails * (size - 1)
+        if len(hike.nodes) != expected_nodes:
+            raise RuntimeError(f"get_trails loaded {len(hike.nodes)} of {expected_nodes} nodes at {size} nodes per trail")
+        results.append({
+            "nodes_per_trail": size,
+            "trails": len(trails),
+            "nodes": len(hike.nodes),
+            "seconds": time.perf_counter() - start,
+            "db_round_trips": sum(db.round_trips.values()),
+        })
+    return results
+
+
+def synthetic_trail(size: int, seed: int = 0) -> Trail:
+    """
+    A DAG of `size` nodes: a tree with fan-out 3, plus a cross edge from an
+    earlier node into every tenth node, like merged topics.
+    """
+    rng = random.Random(seed)
+    trail = Trail(f"synthetic-{size}", f"Synthetic {size}")
+    for i in range(1, size):
+        trail.add_edge(f"n{(i - 1) // 3}", f"n{i}")
+        if i % 10 == 0 and i > 1:
+            trail.add_edge(f"n{rng.randrange(0, i // 2)}", f"n{i}")
+    return trail
+
+
+def time_call(fn) -> float:
+    """
+    Seconds per call of `fn`, repeated until TIMING_MIN_SECONDS have passed.
+    """
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= TIMING_MIN_SECONDS:
+            return elapsed / calls
+
+
+def bench_traversal(args, hike: Hike) -> List[Dict]:
+    results = []
+    for size in args.traversal_sizes:
+        trail = synthetic_trail(size)
+        start = time.perf_counter()
+        csr = CSRTrail.from_trail(trail)
+        pack_seconds = time.perf_counter() - start
+
+        # The last node is the deepest; an early node has a wide subtree below it
+        leaf = Node(f"n{size - 1}", "leaf", "")
+        middle = Node(f"n{size // 30}", "middle", "")
+        for name, graph in (("trail", trail), ("csr", csr)):
+            results.append({
+                "nodes": size,
+                "graph": name,
+                "parents_seconds": time_call(lambda: hike.find_node_parents(leaf, graph)),
+                "children_seconds": time_call(lambda: hike.find_node_children(middle, graph)),
+                "parents_found": len(hike.find_node_parents(leaf, graph)),
+                "children_found": len(hike.find_node_children(middle, graph)),
+                # Unbounded depth: the whole trail below the root, where size shows
+                "all_descendants_seconds": time_call(lambda: graph.descendants("n0")),
+                **({"pack_seconds": pack_seconds} if name == "csr" else {}),
+            })
+    return results
+
+
+async def run_benchmarks(args) -> Dict:
+    results = {}
+    if "hike_build" in args.only:
+        results["hike_build"] = await bench_hike_build(args)
+    if "get_trails" in args.only:
+        results["get_trails"] = await bench_get_trails(args)
+    if "traversal" in args.only:
+        results["traversal"] = bench_traversal(args, make_hike(FakeSupabase()))
+    return results
+
+
+def flatten(results: Dict) -> Dict[str, float]:
+    """
+    Flatten results into "benchmark.[size].metric" keys. List entries are keyed
+    by their SIZE_FIELDS, so runs with different size lists still line up.
+    """
+    flat = {}
+    for benchmark, value in results.items():
+        entries = value if isinstance(value, list) else [value]
+        for entry in entries:
+            label = ",".join(f"{field}={entry[field]}" for field in SIZE_FIELDS.get(benchmark, ()))
+            prefix = f"{benchmark}.[{label}]" if label else benchmark
+            for key, metric in entry.items():
+                if isinstance(metric, (int, float)) and not isinstance(metric, bool):
+                    flat[f"{prefix}.{key}"] = metric
+    return flat
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Regressions against a baseline run: any timing more than `tolerance`
+    slower, and any call or round-trip count that grew.
+    """
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    for key, value in sorted(current.items()):
+        old = previous.get(key)
+        if old is None:
+            continue
+        if "seconds" in key:
+            if old > 0 and value > old * (1 + tolerance):
+                regressions.append(f"{key}: {old:.6g}s -> {value:.6g}s ({value / old - 1:+.0%})")
+        elif ("calls" in key or "round_trips" in key) and value > old:
+            regressions.append(f"{key}: {old} -> {value}")
+    return regressions
+
+
+def parse_sizes(value: str) -> List[int]:
+    return [int(size) for size in value.split(",") if size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline Hike benchmarks.")
+    parser.add_argument("--only", default="hike_build,get_trails,traversal",
+                        help="Comma-separated benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=3, help="Hike builds to run")
+    parser.add_argument("--topics", type=int, default=3, help="Topics in every fake GPT list response")
+    parser.add_argument("--gpt-latency", type=float, default=0.05, help="Seconds per fake GPT call")
+    parser.add_argument("--perplexity-latency", type=float, default=0.1, help="Seconds per fake Perplexity call")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="Seconds per fake database round trip")
+    parser.add_argument("--db-max-rows", type=int, default=1000, help="Rows per fake select, like PostgREST's db-max-rows")
+    parser.add_argument("--trails", type=int, default=3, help="Trails per hike in get_trails")
+    parser.add_argument("--get-trails-sizes", type=parse_sizes, default=list(GET_TRAILS_SIZES))
+    parser.add_argument("--traversal-sizes", type=parse_sizes, default=list(TRAVERSAL_SIZES))
+    parser.add_argument("--output", help="Write results here instead of stdout")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a timing counts as a regression")
+    args = parser.parse_args()
+    args.only = set(args.only.split(","))
+
+    # Hike logs its progress with print; keep stdout for the results
+    with redirect_stdout(sys.stderr):
+        results = asyncio.run(run_benchmarks(args))
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {key: sorted(value) if isinstance(value, set) else value for key, value in vars(args).items()},
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as fout:
+            json.dump(report, fout, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as fin:
+            regressions = compare(results, json.load(fin)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Process-wide registry of upstream clients.
+#
+# Building an OpenAI, Perplexity, Supabase or Luma client per request means a
+# new HTTP connection pool (and a new TLS handshake) every time. Everything in
+# the backend should get its clients from here instead, so connections are kept
+# alive and shared across requests. Pool sizes are configured from the env.
+
+import os
+import httpx
+from dotenv import load_dotenv
+from lumaai import AsyncLumaAI
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
+
+from gpt import AsyncGPTInterface
+from llm_cache import LLMCache
+from perplexity import AsyncPerplexityInterface
+from resilience import UpstreamCaller, get_breaker
+from vector_index import HashingEmbedder, OpenAIEmbedder, VectorIndex
+
+load_dotenv()
+
+POOL_MAX_CONNECTIONS = int(os.getenv("CLIENT_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("CLIENT_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("CLIENT_POOL_KEEPALIVE_EXPIRY", "30"))
+CLIENT_TIMEOUT = float(os.getenv("CLIENT_TIMEOUT", "120"))
+
+# The LLM response cache is opt-in; LLM_CACHE_PATH adds the SQLite tier
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")
+
+# "openai" or "hashing" (deterministic, offline); VECTOR_INDEX_PATH persists the index
+VECTOR_EMBEDDER = os.getenv("VECTOR_EMBEDDER", "openai")
+VECTOR_EMBEDDING_MODEL = os.getenv("VECTOR_EMBEDDING_MODEL", "text-embedding-3-small")
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH")
+
+_http_clients = {}
+_clients = {}
+
+
+def pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """
+    Return the keep-alive connection pool for one upstream service.
+    Each service gets its own pool so one slow provider cannot starve the others.
+    """
+    if name not in _http_clients:
+        _http_clients[name] = httpx.AsyncClient(limits=pool_limits(), timeout=CLIENT_TIMEOUT)
+    return _http_clients[name]
+
+
+def get_llm_cache() -> LLMCache:
+    if not LLM_CACHE_ENABLED:
+        return None
+    if "llm_cache" not in _clients:
+        _clients["llm_cache"] = LLMCache(path=LLM_CACHE_PATH)
+    return _clients["llm_cache"]
+
+
+def get_gpt(model: str = "gpt-4o-mini") -> AsyncGPTInterface:
+    key = ("gpt", model)
+    if key not in _clients:
+        _clients[key] = AsyncGPTInterface(
+            api_key=os.getenv("OPENAI_KEY"),
+            model=model,
+            http_client=get_http_client("openai"),
+            cache=get_llm_cache(),
+            caller=UpstreamCaller(get_breaker("openai")),
+        )
+    return _clients[key]
+
+
+def get_perplexity(model: str = "sonar") -> AsyncPerplexityInterface:
+    key = ("perplexity", model)
+    if key not in _clients:
+        _clients[key] = AsyncPerplexityInterface(
+            api_key=os.getenv("PERPLEXITY_KEY"),
+            model=model,
+            http_client=get_http_client("perplexity"),
+            caller=UpstreamCaller(get_breaker("perplexity")),
+        )
+    return _clients[key]
+
+
+def get_vector_index() -> VectorIndex:
+    if "vector_index" not in _clients:
+        if VECTOR_EMBEDDER == "hashing":
+            embedder = HashingEmbedder()
+        else:
+            embedder = OpenAIEmbedder(get_gpt().client, VECTOR_EMBEDDING_MODEL, UpstreamCaller(get_breaker("openai")))
+        _clients["vector_index"] = VectorIndex(embedder, path=VECTOR_INDEX_PATH)
+    return _clients["vector_index"]
+
+
+async def get_db(url: str = None, key: str = None) -> AsyncClient:
+    url = url or os.getenv("SUPABASE_URL")
+    key = key or os.getenv("SUPABASE_KEY")
+
+    cache_key = ("supabase", url, key)
+    if cache_key not in _clients:
+        options = AsyncClientOptions(httpx_client=get_http_client(f"supabase:{url}"))
+        db = await acreate_client(url, key, options=options)
+        # Another request may have raced us while we awaited; keep the first one.
+        _clients.setdefault(cache_key, db)
+    return _clients[cache_key]
+
+
+def get_async_luma() -> AsyncLumaAI:
+    # LUMAAI_BASE_URL points this at another generations API, e.g. a local fake
+    if "async_luma" not in _clients:
+        _clients["async_luma"] = AsyncLumaAI(http_client=get_http_client("luma"))
+    return _clients["async_luma"]
+
+
+async def close_clients():
+    """
+    Close every pooled connection. Hooked into the FastAPI app lifespan.
+    """
+    vector_index = _clients.get("vector_index")
+    if vector_index is not None:
+        vector_index.save()
+
+    llm_cache = _clients.get("llm_cache")
+    if llm_cache is not None:
+        llm_cache.close()
+
+    for http_client in _http_clients.values():
+        await http_client.aclose()
+
+    _http_clients.clear()
+    _clients.clear()
@@ -0,0 +1,110 @@
+# Token-budgeted prompt context for extend_topic / extend_summit.
+#
+# Those prompts describe the topics a user has already covered. Sending every
+# ancestor with its full Perplexity-generated description makes prompt size
+# grow with trail depth, so the builder below fits the description list into a
+# fixed token budget: every included node first gets a short (cached) summary,
+# nearest nodes first, and leftover budget is spent upgrading the nearest ones
+# back to their full description.
+
+import os
+import re
+from functools import lru_cache
+from typing import List
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "40"))
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """
+    Count tokens with tiktoken when it is installed, else estimate ~4 characters per token.
+    """
+    if tiktoken is None:
+        return (len(text) + 3) // 4
+    return len(get_encoding(model).encode(text))
+
+
+@lru_cache(maxsize=4096)
+def summarize(description: str, max_tokens: int = CONTEXT_SUMMARY_TOKENS) -> str:
+    """
+    Shorten a node description to its leading sentences, at most `max_tokens` long.
+    """
+    # Keep link text but drop URLs and citation markers, which cost tokens and add nothing here
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", description or "")
+    text = re.sub(r"https?://\S+|\[\s*\d+\s*\]", "", text)
+    text = " ".join(text.split())
+
+    summary = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        candidate = f"{summary} {sentence}".strip()
+        if count_tokens(candidate) > max_tokens:
+            break
+        summary = candidate
+
+    if not summary and text:
+        # The first sentence alone is over budget; cut it down until it fits
+        summary = text
+        while summary and count_tokens(summary + "...") > max_tokens:
+            summary = summary[:len(summary) * 3 // 4]
+        summary = summary.rstrip() + "..."
+
+    return summary
+
+
+class ContextBuilder:
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, summary_tokens: int = CONTEXT_SUMMARY_TOKENS):
+        self.budget = budget
+        self.summary_tokens = summary_tokens
+
+    @staticmethod
+    def describe(title: str, description: str) -> str:
+        return f"The next topic is called {title}, which is about {description}."
+
+    def build(self, nodes: List, budget: int = None) -> List[str]:
+        """
+        Describe `nodes` within a token budget.
+
+        Args:
+            nodes (List[Node]): Nodes ranked most relevant (nearest) first.
+            budget (int): Token budget for this call; defaults to the builder's budget.
+
+        Returns:
+            List[str]: One description per included node, in rank order. Nodes
+                that do not fit even as a summary are left out, farthest first.
+        """
+        remaining = self.budget if budget is None else budget
+
+        # First pass: a short summary for as many nodes as fit, nearest first
+        lines = []
+        for node in nodes:
+            line = self.describe(node.title, summarize(node.description or "", self.summary_tokens))
+            cost = count_tokens(line)
+            if cost > remaining:
+                break
+            lines.append([node, line, cost])
+            remaining -= cost
+
+        # Second pass: spend what is left restoring full descriptions, nearest first
+        for entry in lines:
+            node, line, cost = entry
+            full = self.describe(node.title, node.description)
+            extra = count_tokens(full) - cost
+            if 0 < extra <= remaining:
+                entry[1] = full
+                remaining -= extra
+
+        return [line for _, line, _ in lines]
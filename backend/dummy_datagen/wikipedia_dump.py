@@ -0,0 +1,291 @@
+# Build seed graphs from a local Wikipedia XML dump instead of scraping HTML.
+#
+# Works offline against a pages-articles dump (plain, .bz2 or .gz), or a small
+# fixture in the same format, and emits the same {"nodes", "edges"} graph as
+# wikipedia_scraper.py. The dump is read once, streamed with iterparse, into a
+# SQLite index next to it holding each page's redirect target, first paragraph
+# and outgoing article links. The graph is then built breadth first with
+# lookups against that index, so neither depth nor redirects cost another pass
+# over the dump, and later runs with other seeds reuse the index.
+
+import argparse
+import bz2
+import gzip
+import json
+import os
+import re
+import sqlite3
+import uuid
+import xml.etree.ElementTree as ET
+
+WIKIPEDIA_URL = "https://en.wikipedia.org"
+# Redirect chains longer than this are dropped
+MAX_REDIRECT_HOPS = 3
+# Pages written to the index per transaction
+INDEX_BATCH_SIZE = 10000
+MEDIA_LINK = re.compile(r"\[\[\s*(?:File|Image|Category)\s*:", re.I)
+
+def open_dump(path: str):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+def normalize_title(title: str) -> str:
+    """
+    Canonical article title: underscores to spaces, no section anchor, first letter capitalized.
+    """
+    title = " ".join(title.replace("_", " ").split("#")[0].split())
+    return title[:1].upper() + title[1:]
+
+def iter_pages(path: str):
+    """
+    Stream (title, redirect target or None, wikitext) for every main-namespace page.
+    """
+    with open_dump(path) as fin:
+        context = ET.iterparse(fin, events=("start", "end"))
+        _, root = next(context)
+
+        for event, elem in context:
+            if event != "end" or not elem.tag.endswith("}page") and elem.tag != "page":
+                continue
+
+            fields = {}
+            for child in elem.iter():
+                tag = child.tag.rsplit("}", 1)[-1]
+                if tag == "redirect":
+                    fields["redirect"] = child.get("title")
+                elif tag in ("title", "ns", "text") and tag not in fields:
+                    fields[tag] = child.text or ""
+
+            if fields.get("ns", "0") == "0":
+                yield fields.get("title", ""), fields.get("redirect"), fields.get("text", "")
+
+            # Drop the page we just read so memory stays flat however long the dump is
+            elem.clear()
+            root.clear()
+
+def strip_nested(text: str, start: str, end: str) -> str:
+    """
+    Remove possibly nested `start ... end` blocks such as {{templates}} and {| tables |}.
+    """
+    pattern = re.compile(re.escape(start) + r"(?:(?!" + re.escape(start) + r").)*?" + re.escape(end), re.S)
+    while True:
+        text, count = pattern.subn("", text)
+        if count == 0:
+            return text
+
+def strip_media_links(text: str) -> str:
+    """
+    Remove [[File:...]], [[Image:...]] and [[Category:...]] links, whose captions may contain links of their own.
+    """
+    pieces = []
+    position = 0
+    for match in MEDIA_LINK.finditer(text):
+        if match.start() < position:
+            continue
+        pieces.append(text[position:match.start()])
+
+        # Walk forward to the "]]" that closes this link, counting nested "[[" on the way
+        depth = 0
+        position = match.start()
+        while position < len(text):
+            if text.startswith("[[", position):
+                depth += 1
+                position += 2
+            elif text.startswith("]]", position):
+                depth -= 1
+                position += 2
+                if depth == 0:
+                    break
+            else:
+                position += 1
+
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+def first_paragraph(wikitext: str) -> str:
+    text = re.sub(r"<!--.*?-->", "", wikitext, flags=re.S)
+    text = re.sub(r"<ref[^>]*/>|<ref[^>]*>.*?</ref>", "", text, flags=re.S)
+    text = strip_nested(text, "{{", "}}")
+    text = strip_nested(text, "{|", "|}")
+    text = strip_media_links(text)
+
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        # Skip headings, lists, indents and leftover markup
+        if not paragraph:
+            continue
+        if paragraph[0] in "=*#:;|!{" or paragraph[0] == "[" and not paragraph.startswith("[["):
+            continue
+
+        paragraph = re.sub(r"\[\[(?:[^|\]]*\|)?([^\]]*)\]\]", r"\1", paragraph)
+        paragraph = re.sub(r"\[https?://\S+\s*([^\]]*)\]", r"\1", paragraph)
+        paragraph = re.sub(r"'{2,}", "", paragraph)
+        paragraph = re.sub(r"<[^>]+>", "", paragraph)
+        return " ".join(paragraph.split())
+
+    return ""
+
+def article_links(wikitext: str, max_degree: int = None) -> list:
+    """
+    The first `max_degree` unique article titles linked from the page body, or all of them.
+    """
+    text = re.sub(r"<!--.*?-->", "", wikitext, flags=re.S)
+    text = strip_nested(text, "{{", "}}")
+    text = strip_media_links(text)
+
+    found_titles = []
+    for target in re.findall(r"\[\[([^|\[\]]+)(?:\|[^\[\]]*)?\]\]", text):
+        # Links with a namespace prefix (File:, Category:, ...) are not articles
+        if ":" in target:
+            continue
+        linked_title = normalize_title(target)
+        if linked_title and linked_title not in found_titles:
+            found_titles.append(linked_title)
+        if max_degree is not None and len(found_titles) >= max_degree:
+            break
+    return found_titles
+
+def dump_signature(path: str) -> str:
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+def build_index(path: str, index_path: str):
+    """
+    Read the dump once into a SQLite index of (title, redirect, description, links).
+    """
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    index = sqlite3.connect(index_path)
+    index.execute("CREATE TABLE pages (title TEXT PRIMARY KEY, redirect TEXT, description TEXT, links TEXT)")
+    index.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    batch = []
+    count = 0
+    for title, redirect, wikitext in iter_pages(path):
+        if redirect:
+            batch.append((title, normalize_title(redirect), None, None))
+        else:
+            batch.append((title, None, first_paragraph(wikitext), json.dumps(article_links(wikitext))))
+
+        if len(batch) >= INDEX_BATCH_SIZE:
+            index.executemany("INSERT OR IGNORE INTO pages VALUES (?, ?, ?, ?)", batch)
+            index.commit()
+            count += len(batch)
+            batch = []
+            print(f"Indexed {count} pages")
+
+    index.executemany("INSERT OR IGNORE INTO pages VALUES (?, ?, ?, ?)", batch)
+    # Written last, so an interrupted build is rebuilt rather than trusted
+    index.execute("INSERT INTO meta VALUES ('dump', ?)", (dump_signature(path),))
+    index.commit()
+    return index
+
+def open_index(path: str, index_path: str = None) -> sqlite3.Connection:
+    """
+    The index for `path`, built first if it is missing, incomplete or older than the dump.
+    """
+    index_path = index_path or path + ".sqlite"
+    if os.path.exists(index_path):
+        index = sqlite3.connect(index_path)
+        try:
+            row = index.execute("SELECT value FROM meta WHERE key = 'dump'").fetchone()
+        except sqlite3.DatabaseError:
+            row = None
+        if row is not None and row[0] == dump_signature(path):
+            return index
+        index.close()
+
+    print(f"Indexing {path} into {index_path}")
+    return build_index(path, index_path)
+
+def lookup_article(index: sqlite3.Connection, title: str):
+    """
+    (title, description, links) of the article `title` names, following up to
+    MAX_REDIRECT_HOPS redirects, or None if it is not in the dump.
+    """
+    for _ in range(MAX_REDIRECT_HOPS + 1):
+        row = index.execute("SELECT redirect, description, links FROM pages WHERE title = ?", (title,)).fetchone()
+        if row is None:
+            return None
+        redirect, description, links = row
+        if not redirect:
+            return title, description, json.loads(links)
+        title = redirect
+    return None
+
+def build_graph_from_dump(path: str, seed_title: str, max_depth: int, max_degree: int, index_path: str = None) -> dict:
+    """
+    Build a graph breadth first from `seed_title`, reading articles from the dump's index.
+
+    Nodes and edges have the same shape as wikipedia_scraper.build_wikipedia_graph:
+    difficulty is depth / max_depth and edges are [parent_id, child_id] pairs.
+    """
+    graph = {"nodes": [], "edges": []}
+    visited = {}  # key: article title, value: node_id
+
+    index = open_index(path, index_path)
+    # title -> parent node IDs waiting on that article
+    frontier = {normalize_title(seed_title): []}
+    depth = 0
+
+    try:
+        while frontier:
+            print(f"Looking up {len(frontier)} titles at depth={depth}")
+            next_frontier = {}
+
+            for title, parent_ids in frontier.items():
+                # Titles missing from the dump are dropped
+                article = lookup_article(index, title)
+                if article is None:
+                    continue
+                title, description, links = article
+
+                # Articles reached again, directly or through a redirect, only need an edge
+                if title in visited:
+                    graph["edges"] += [[parent_id, visited[title]] for parent_id in parent_ids]
+                    continue
+
+                node_id = str(uuid.uuid4())
+                graph["nodes"].append({
+                    "id": node_id,
+                    "title": title,
+                    "description": description,
+                    "link": WIKIPEDIA_URL + "/wiki/" + title.replace(" ", "_"),
+                    "difficulty": depth / max_depth if max_depth > 0 else 0.0,
+                    "resource_type": "wikipedia"
+                })
+                visited[title] = node_id
+                graph["edges"] += [[parent_id, node_id] for parent_id in parent_ids]
+
+                if depth < max_depth:
+                    for linked_title in links[:max_degree]:
+                        next_frontier.setdefault(linked_title, []).append(node_id)
+
+            frontier = next_frontier
+            depth += 1
+    finally:
+        index.close()
+
+    return graph
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a seed graph from a local Wikipedia XML dump.")
+    parser.add_argument("dump", help="pages-articles XML dump (.xml, .xml.bz2 or .xml.gz)")
+    parser.add_argument("seed", help="title of the starting article")
+    parser.add_argument("--max-depth", type=int, default=5)
+    parser.add_argument("--max-degree", type=int, default=3)
+    parser.add_argument("--output", default="./data.json", help="data.json, or .ndjson for one record per line")
+    parser.add_argument("--index", help="SQLite index of the dump, built on first use (default: <dump>.sqlite)")
+    args = parser.parse_args()
+
+    graph = build_graph_from_dump(args.dump, args.seed, args.max_depth, args.max_degree, args.index)
+    with open(args.output, "w") as fout:
+        if args.output.endswith(".ndjson"):
+            # Streamed by wikipedia_dumper.py: node objects first, then [parent_id, child_id] edges
+            for record in graph["nodes"] + graph["edges"]:
+                fout.write(json.dumps(record) + "\n")
+        else:
+            json.dump(graph, fout)
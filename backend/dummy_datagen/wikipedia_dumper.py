@@ -1,21 +1,243 @@
-# Dump into the supabase table
+# Dump a seed graph into the supabase tables
+#
+# Reads the graph written by wikipedia_scraper.py / wikipedia_dump.py, either a
+# data.json file ({"nodes", "edges"}) or NDJSON with one record per line (a
+# node object, or an edge as a [parent_id, child_id] pair). NDJSON is streamed,
+# so memory stays flat however large the crawl was.
+#
+# Rows are written in fixed-size chunks with a bounded number of requests in
+# flight: resources first, then one trail for the whole graph, then its rows in
+# the normalized "edges" table that Hike.get_trails reads. Resources and the
+# trail are upserts keyed on deterministic IDs. The edges table has no unique
+# key to upsert on, so edges are deduplicated and sorted in a temporary SQLite
+# file (keeping memory flat here too), then inserted after clearing whatever
+# an earlier run of the same load left behind. Either way
+# re-running a load is safe, and progress is checkpointed so an interrupted
+# load resumes where it stopped.
 
+import argparse
 import json
+import os
+import sqlite3
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 load_dotenv("../.env")
 
 from supabase import create_client, Client
 
-with open("./data.json") as fin:
-    data = json.load(fin)
+# Seed trails get IDs derived from their trailhead, so a reload hits the same row
+SEED_TRAIL_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://github.com/womogenes/trailhead/seed-trails")
+# Bumped when the meaning of a checkpointed chunk index changes
+CHECKPOINT_VERSION = 2
+# Edges written to the dedupe spool per executemany
+EDGE_SPOOL_BATCH = 10000
 
-import os
-supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
-
-supabase.table("resources").upsert(data["nodes"]).execute()
-supabase.table("trails").insert({
-    "resources": [node["id"] for node in data["nodes"]],
-    "edges": data["edges"],
-    "trailhead_id": data["nodes"][0]["id"]
-}).execute()
+def graph_records(path: str):
+    """
+    A function returning a fresh iterator of ("node", dict) and ("edge",
+    [parent_id, child_id]) records from a graph file each time it is called.
+    """
+    if path.endswith(".json"):
+        # Legacy format: one JSON document, which has to be loaded whole, so it is parsed once and kept
+        with open(path) as fin:
+            data = json.load(fin)
+        return lambda: iter_graph(data)
+    return lambda: iter_ndjson(path)
+
+def iter_graph(data: dict):
+    for node in data["nodes"]:
+        yield "node", node
+    for edge in data["edges"]:
+        yield "edge", edge
+
+def iter_ndjson(path: str):
+    with open(path) as fin:
+        for line in fin:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            yield ("edge" if isinstance(record, list) else "node"), record
+
+class UniqueEdges:
+    """
+    The distinct (parent_id, child_id) pairs among `records`, spooled to a
+    temporary SQLite file rather than held in memory. They iterate sorted, so
+    every run chunks them the same way and a chunk covers a contiguous key range.
+    """
+    def __init__(self, records):
+        # An empty path is a private on-disk database, deleted on close
+        self.db = sqlite3.connect("")
+        self.db.execute("CREATE TABLE edges (id_a TEXT, id_b TEXT, PRIMARY KEY (id_a, id_b)) WITHOUT ROWID")
+        edges = ((record[0], record[1]) for kind, record in records if kind == "edge")
+        for batch in iter_chunks(edges, EDGE_SPOOL_BATCH):
+            self.db.executemany("INSERT OR IGNORE INTO edges VALUES (?, ?)", batch)
+        self.db.commit()
+        self.count = self.db.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self):
+        return iter(self.db.execute("SELECT id_a, id_b FROM edges ORDER BY id_a, id_b"))
+
+    def at(self, position: int) -> tuple:
+        return self.db.execute(
+            "SELECT id_a, id_b FROM edges ORDER BY id_a, id_b LIMIT 1 OFFSET ?", (position,)
+        ).fetchone()
+
+    def close(self):
+        self.db.close()
+
+def iter_chunks(rows, chunk_size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class SeedLoader:
+    """
+    Chunked, concurrent, resumable upload of one seed graph.
+    """
+    def __init__(self,
+                 supabase: Client,
+                 chunk_size: int = 500,
+                 max_workers: int = 4,
+                 checkpoint_path: str = None):
+        self.supabase = supabase
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.checkpoint_path = checkpoint_path
+
+    def load_checkpoint(self, path: str) -> dict:
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as fin:
+                state = json.load(fin)
+            if state["source"] == path and state["chunk_size"] == self.chunk_size \
+                    and state.get("version") == CHECKPOINT_VERSION:
+                print(f"Resuming load: {state['done']}")
+                return state
+            print("Ignoring checkpoint from a different load.")
+        return {
+            "source": path,
+            "chunk_size": self.chunk_size,
+            "version": CHECKPOINT_VERSION,
+            "done": {"resources": 0, "edges": 0},
+        }
+
+    def save_checkpoint(self, state: dict):
+        if not self.checkpoint_path:
+            return
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as fout:
+            json.dump(state, fout)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def write_chunk(self, table: str, rows: list, on_conflict: str) -> int:
+        if on_conflict:
+            self.supabase.table(table).upsert(rows, on_conflict=on_conflict).execute()
+        else:
+            self.supabase.table(table).insert(rows).execute()
+        return len(rows)
+
+    def clear_edges(self, trail_id: str, edges: UniqueEdges, done_chunks: int):
+        """
+        Delete the trail's edges that the checkpoint does not vouch for, so
+        inserting the remaining chunks cannot duplicate rows. That is every
+        edge on a fresh load, or on a resumed one the edges sorting after the
+        last checkpointed chunk, which chunks in flight may have written.
+        """
+        query = self.supabase.table("edges").delete().eq("trail_id", trail_id)
+        if done_chunks > 0 and len(edges) > 0:
+            # UUIDs compare in the same order in Postgres as their lowercase strings
+            id_a, id_b = edges.at(min(done_chunks * self.chunk_size, len(edges)) - 1)
+            query = query.or_(f"id_a.gt.{id_a},and(id_a.eq.{id_a},id_b.gt.{id_b})")
+        query.execute()
+
+    def upload(self, pool: ThreadPoolExecutor, table: str, chunks, state: dict, on_conflict: str = "id"):
+        """
+        Write `chunks` into `table`, skipping the ones a previous run already
+        wrote. Rows are upserted on `on_conflict`, or inserted if it is None.
+
+        Chunks are sent concurrently, but the checkpoint only advances past a
+        chunk once it and every chunk before it have been written.
+        """
+        start = time.monotonic()
+        skip = state["done"][table]
+        written = 0
+        in_flight = deque()
+
+        def settle_oldest():
+            nonlocal written
+            written += in_flight.popleft().result()
+            state["done"][table] += 1
+            self.save_checkpoint(state)
+
+        for i, chunk in enumerate(chunks):
+            if i < skip:
+                continue
+            in_flight.append(pool.submit(self.write_chunk, table, chunk, on_conflict))
+            if len(in_flight) >= self.max_workers * 2:
+                settle_oldest()
+        while in_flight:
+            settle_oldest()
+
+        elapsed = time.monotonic() - start
+        print(f"Wrote {written} rows into {table} in {elapsed:.1f}s ({written / max(elapsed, 1e-9):.0f} rows/s)")
+
+    def load(self, path: str) -> str:
+        """
+        Load the graph in `path`. The first node is the trailhead.
+
+        Returns:
+            str: The ID of the trail holding the graph's edges.
+        """
+        state = self.load_checkpoint(path)
+        records = graph_records(path)
+
+        trailhead = next((record for kind, record in records() if kind == "node"), None)
+        if trailhead is None:
+            print("No nodes to load.")
+            return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            nodes = (record for kind, record in records() if kind == "node")
+            self.upload(pool, "resources", iter_chunks(nodes, self.chunk_size), state)
+
+            trail_id = str(uuid.uuid5(SEED_TRAIL_NAMESPACE, trailhead["id"]))
+            self.supabase.table("trails").upsert({
+                "id": trail_id,
+                "trail_title": trailhead["title"],
+                "trailhead_id": trailhead["id"],
+            }).execute()
+
+            edges = UniqueEdges(records())
+            try:
+                self.clear_edges(trail_id, edges, state["done"]["edges"])
+                rows = ({"id_a": id_a, "id_b": id_b, "trail_id": trail_id} for id_a, id_b in edges)
+                self.upload(pool, "edges", iter_chunks(rows, self.chunk_size), state, on_conflict=None)
+            finally:
+                edges.close()
+
+        return trail_id
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a seed graph into supabase.")
+    parser.add_argument("input", nargs="?", default="./data.json", help="data.json or NDJSON graph file")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--checkpoint", default="./load_checkpoint.json")
+    args = parser.parse_args()
+
+    supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+    loader = SeedLoader(supabase, args.chunk_size, args.workers, args.checkpoint)
+    trail_id = loader.load(args.input)
+    print(f"Loaded trail_id={trail_id}")
@@ -1,87 +1,169 @@
 # Script geneated by o3-mini lol
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode, urlparse
+import argparse
+import gzip
+import hashlib
+import os
+import threading
+import time
 import uuid
 import re
-from functools import lru_cache
 import json
 
+WIKIPEDIA_URL = "https://en.wikipedia.org"
+USER_AGENT = "trailhead-seed-crawler/0.1 (https://github.com/womogenes/trailhead)"
+
 def is_disambiguation_page(soup: BeautifulSoup) -> bool:
     """
     Checks if the given BeautifulSoup object represents a disambiguation page.
     """
     return soup.find("table", id="disambigbox") is not None
 
-def build_wikipedia_graph(query: str, max_depth: int, max_degree: int) -> dict:
+def make_session(pool_size: int) -> requests.Session:
     """
-    Searches Wikipedia for the given query, then builds a graph by recursively
-    parsing each article to extract links to other Wikipedia articles.
-    
-    For each article:
-      - Only up to 3 unique linked articles are processed.
-      - Recursion stops when a maximum depth of 10 is reached.
-    
-    Each node in the graph is a dict with:
-      - id: a UUID (v4) string
-      - title: article title
-      - description: first paragraph text (if available)
-      - link: full Wikipedia URL for the article
-      - difficulty: float in [0.0, 1.0] computed as (current_depth/max_depth)
-      
-    Edges are represented as a list of two UUID strings [parent_id, child_id].
+    A pooled session shared by all crawler threads, with retries on transient errors.
     """
-    graph = {"nodes": [], "edges": []}
-    # Use a dict to avoid processing the same URL twice:
-    visited = {}  # key: article URL, value: node_id
-    
-    # STEP 1: Search for the article using Wikipedia’s API.
-    search_url = "https://en.wikipedia.org/w/api.php"
-    params = {
-        "action": "query",
-        "list": "search",
-        "srsearch": query,
-        "format": "json"
-    }
-    
-    resp = requests.get(search_url, params=params)
-    data = resp.json()
-    
-    # If no results are found, return an empty graph.
-    if "query" not in data or "search" not in data["query"] or len(data["query"]["search"]) == 0:
-        print("No article found for the query.")
-        return graph
-    
-    # Take the first search result.
-    start_title = data["query"]["search"][0]["title"]
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+class RateLimiter:
+    """
+    Spaces out requests to each host so they are at least 1 / rate seconds apart.
+    """
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self.next_allowed = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host: str):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_allowed.get(host, now))
+            self.next_allowed[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class ResponseCache:
+    """
+    On-disk cache of successful GET responses, one gzipped file per URL.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key + ".gz")
+
+    def get(self, url: str):
+        try:
+            with gzip.open(self.path(url), "rt", encoding="utf-8") as fin:
+                return fin.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, url: str, text: str):
+        path = self.path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so a crash never leaves a truncated entry behind
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as fout:
+            fout.write(text)
+        os.replace(tmp_path, path)
+
+class WikipediaCrawler:
+    """
+    Breadth-first Wikipedia crawler.
+
+    Articles of one depth level are fetched concurrently by a bounded thread
+    pool over a single pooled session, politely rate limited per host. Responses
+    are cached on disk, and the crawl state (graph so far plus frontier) is
+    checkpointed so an interrupted crawl resumes where it stopped. The
+    checkpoint is deleted once the crawl finishes.
+    """
+    def __init__(self,
+                 base_url: str = WIKIPEDIA_URL,
+                 max_workers: int = 8,
+                 requests_per_second: float = 10.0,
+                 cache_dir: str = None,
+                 checkpoint_path: str = None,
+                 checkpoint_every: int = 50,
+                 timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.session = make_session(max_workers)
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.timeout = timeout
 
-    @lru_cache(None)
-    def process_article(title: str, depth: int) -> str:
+    def get(self, url: str):
         """
-        Processes a single Wikipedia article.
-        
-        Returns the UUID (string) of the created node or the existing one if already visited.
+        GET a URL through the cache and rate limiter. Returns the body, or None on a non-200 response.
         """
-        # Build the full article URL (replace spaces with underscores)
-        article_url = "https://en.wikipedia.org/wiki/" + title.replace(" ", "_")
-        
-        # If already visited, just return its UUID.
-        if article_url in visited:
-            return visited[article_url]
-        
-        # Fetch the article page.
-        response = requests.get(article_url)
+        if self.cache:
+            text = self.cache.get(url)
+            if text is not None:
+                return text
+
+        self.rate_limiter.wait(urlparse(url).netloc)
+        response = self.session.get(url, timeout=self.timeout)
         if response.status_code != 200:
             return None
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
+
+        if self.cache:
+            self.cache.set(url, response.text)
+        return response.text
+
+    def article_url(self, title: str) -> str:
+        # Build the full article URL (replace spaces with underscores)
+        return self.base_url + "/wiki/" + title.replace(" ", "_")
+
+    def search(self, query: str):
+        """
+        Searches for the article using Wikipedia’s API and returns the first result's title.
+        """
+        params = {
+            "action": "query",
+            "list": "search",
+            "srsearch": query,
+            "format": "json"
+        }
+        text = self.get(self.base_url + "/w/api.php?" + urlencode(params))
+        data = json.loads(text) if text else {}
+
+        if "query" not in data or "search" not in data["query"] or len(data["query"]["search"]) == 0:
+            return None
+        return data["query"]["search"][0]["title"]
+
+    def fetch_article(self, title: str, max_degree: int):
+        """
+        Fetches and parses one article. Runs on a worker thread.
+
+        Returns (description, linked titles), or None if the article should be skipped.
+        """
+        text = self.get(self.article_url(title))
+        if text is None:
+            return None
+
+        soup = BeautifulSoup(text, 'html.parser')
+
         # Skip disambiguation pages.
         if is_disambiguation_page(soup) or "disambiguation" in title.lower():
             return None
-        
-        print(f"Processing title={title}, depth={depth}")
-        
+
         # Try to get the article description from the first paragraph in the main content.
         description = ""
         content_div = soup.find("div", class_="mw-parser-output")
@@ -89,28 +171,10 @@ def build_wikipedia_graph(query: str, max_depth: int, max_degree: int) -> dict:
             p = content_div.find("p")
             if p:
                 description = p.get_text().strip()
-        
-        # Compute difficulty as a function of depth.
-        difficulty = depth / max_depth if max_depth > 0 else 0.0
-        
-        # Create a new node.
-        node_id = str(uuid.uuid4())
-        node = {
-            "id": node_id,
-            "title": title,
-            "description": description,
-            "link": article_url,
-            "difficulty": difficulty,
-            "resource_type": "wikipedia"
-        }
-        graph["nodes"].append(node)
-        visited[article_url] = node_id
-
-        # Only proceed with recursion if we haven't reached the maximum depth.
-        if depth < max_depth and content_div:
-            # Find all valid Wikipedia links in the article content.
-            # Only consider <a> tags where href starts with "/wiki/" and does not contain ":".
-            found_titles = []
+
+        # Only consider <a> tags where href starts with "/wiki/" and does not contain ":".
+        found_titles = []
+        if content_div:
             for a in content_div.find_all("a", href=True):
                 href = a['href']
                 if href.startswith("/wiki/") and not re.search(":", href):
@@ -122,21 +186,158 @@ def build_wikipedia_graph(query: str, max_depth: int, max_degree: int) -> dict:
                 if len(found_titles) >= max_degree:
                     break
 
-            # Process each found link recursively.
-            for linked_title in found_titles:
-                child_node_id = process_article(linked_title, depth + 1)
-                if child_node_id:
-                    # Add an edge from the current node to the child node.
-                    graph["edges"].append([node_id, child_node_id])
-        return node_id
+        return description, found_titles
+
+    def load_checkpoint(self, query: str, max_depth: int, max_degree: int):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as fin:
+            state = json.load(fin)
+        if (state["query"], state["max_depth"], state["max_degree"]) != (query, max_depth, max_degree):
+            print("Ignoring checkpoint from a crawl with different parameters.")
+            return None
+        print(f"Resuming crawl at depth={state['depth']} with {len(state['graph']['nodes'])} nodes.")
+        return state
+
+    def save_checkpoint(self, state: dict):
+        if not self.checkpoint_path:
+            return
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as fout:
+            json.dump(state, fout)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        # A finished crawl must not be "resumed" by the next run of the same query
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def crawl(self, query: str, max_depth: int, max_degree: int) -> dict:
+        """
+        Searches Wikipedia for the given query, then builds a graph by following
+        links from each article, level by level.
+
+        For each article:
+          - Only up to max_degree unique linked articles are followed.
+          - Articles deeper than max_depth are not fetched.
+
+        Each node in the graph is a dict with:
+          - id: a UUID (v4) string
+          - title: article title
+          - description: first paragraph text (if available)
+          - link: full Wikipedia URL for the article
+          - difficulty: float in [0.0, 1.0] computed as (current_depth/max_depth)
+
+        Edges are represented as a list of two UUID strings [parent_id, child_id].
+        """
+        state = self.load_checkpoint(query, max_depth, max_degree)
+        if state is None:
+            start_title = self.search(query)
+            # If no results are found, return an empty graph.
+            if start_title is None:
+                print("No article found for the query.")
+                return {"nodes": [], "edges": []}
 
-    # Start the recursion from the starting article.
-    process_article(start_title, 0)
-    return graph
+            state = {
+                "query": query,
+                "max_depth": max_depth,
+                "max_degree": max_degree,
+                "graph": {"nodes": [], "edges": []},
+                # key: article title, value: node_id (None if the article was skipped)
+                "visited": {},
+                "depth": 0,
+                # [title, parent_id] pairs for the current level and the next one
+                "frontier": [[start_title, None]],
+                "next_frontier": [],
+            }
+
+        graph = state["graph"]
+        visited = state["visited"]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while state["frontier"]:
+                depth = state["depth"]
+                pending = list(dict.fromkeys(title for title, _ in state["frontier"] if title not in visited))
+                futures = {pool.submit(self.fetch_article, title, max_degree): title for title in pending}
+
+                for i, future in enumerate(as_completed(futures)):
+                    title = futures[future]
+                    try:
+                        result = future.result()
+                    except requests.RequestException as e:
+                        print(f"Failed to fetch title={title}: {e}")
+                        result = None
+
+                    if result is None:
+                        visited[title] = None
+                        continue
+
+                    print(f"Processing title={title}, depth={depth}")
+                    description, found_titles = result
+
+                    # Create a new node.
+                    node_id = str(uuid.uuid4())
+                    graph["nodes"].append({
+                        "id": node_id,
+                        "title": title,
+                        "description": description,
+                        "link": self.article_url(title),
+                        # Compute difficulty as a function of depth.
+                        "difficulty": depth / max_depth if max_depth > 0 else 0.0,
+                        "resource_type": "wikipedia"
+                    })
+                    visited[title] = node_id
+
+                    # Only proceed deeper if we haven't reached the maximum depth.
+                    if depth < max_depth:
+                        state["next_frontier"] += [[linked_title, node_id] for linked_title in found_titles]
+
+                    if (i + 1) % self.checkpoint_every == 0:
+                        self.save_checkpoint(state)
+
+                # Add an edge from each parent to every child that produced a node.
+                for title, parent_id in state["frontier"]:
+                    if parent_id and visited.get(title):
+                        graph["edges"].append([parent_id, visited[title]])
+
+                state["frontier"] = state["next_frontier"]
+                state["next_frontier"] = []
+                state["depth"] = depth + 1
+                self.save_checkpoint(state)
+
+        self.clear_checkpoint()
+        return graph
+
+def build_wikipedia_graph(query: str, max_depth: int, max_degree: int, **crawler_options) -> dict:
+    """
+    Build a {"nodes", "edges"} graph around the top search result for `query`.
+    Keyword arguments are passed to WikipediaCrawler.
+    """
+    return WikipediaCrawler(**crawler_options).crawl(query, max_depth, max_degree)
 
 # Example usage:
 if __name__ == "__main__":
-    query = "Python programming"
-    graph = build_wikipedia_graph(query, 5, 3)
-    with open("./data.json", "w") as fout:
+    parser = argparse.ArgumentParser(description="Crawl Wikipedia into a seed graph.")
+    parser.add_argument("query", nargs="?", default="Python programming")
+    parser.add_argument("--max-depth", type=int, default=5)
+    parser.add_argument("--max-degree", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=10.0, help="requests per second per host")
+    parser.add_argument("--base-url", default=WIKIPEDIA_URL)
+    parser.add_argument("--cache-dir", default="./.wikipedia_cache")
+    parser.add_argument("--checkpoint", default="./crawl_checkpoint.json")
+    parser.add_argument("--output", default="./data.json")
+    args = parser.parse_args()
+
+    graph = build_wikipedia_graph(
+        args.query,
+        args.max_depth,
+        args.max_degree,
+        base_url=args.base_url,
+        max_workers=args.workers,
+        requests_per_second=args.rate,
+        cache_dir=args.cache_dir,
+        checkpoint_path=args.checkpoint,
+    )
+    with open(args.output, "w") as fout:
         json.dump(graph, fout)
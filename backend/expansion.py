@@ -0,0 +1,166 @@
+# On-demand growth of trails, one node at a time.
+#
+# A hike is only built a level deep up front. When a user opens a node, the
+# expand endpoint generates that node's children (extend_trail to depth 1) if
+# it has none yet, and returns them. Expanding the same node twice at once runs
+# one expansion, and a node that already has children is answered from the
+# cached hike without any LLM calls.
+#
+# After each expansion, the children most likely to be opened next are
+# expanded speculatively as low-priority background jobs, so clicking one level
+# deeper is usually instant. Only a few children are prefetched, and prefetched
+# expansions do not prefetch further, so the cost stays bounded.
+
+import asyncio
+import os
+from typing import Dict, List, Tuple
+
+import clients
+import metrics
+from hike import Hike
+from hike_cache import hike_cache
+from jobs import JobManager
+
+# Speculative expansions running at once; they never hold up hike builds
+EXPAND_PREFETCH_WORKERS = int(os.getenv("EXPAND_PREFETCH_WORKERS", "2"))
+# Children of an opened node that are expanded ahead of time (0 disables prefetching)
+EXPAND_PREFETCH_WIDTH = int(os.getenv("EXPAND_PREFETCH_WIDTH", "2"))
+
+
+class TrailNotFound(LookupError):
+    pass
+
+
+class TrailExpander:
+    def __init__(self, prefetch_width: int = EXPAND_PREFETCH_WIDTH, max_workers: int = EXPAND_PREFETCH_WORKERS):
+        self.prefetch_width = prefetch_width
+        self.prefetch_jobs = JobManager(max_workers=max_workers)
+        # (trail_id, node_id) -> expansion in progress, shared by everyone who asks for it
+        self.in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.stats = {"expanded": 0, "already_expanded": 0, "prefetched": 0}
+
+    async def load(self, trail_id: str) -> Tuple[Hike, object]:
+        """
+        The (cached) hike a trail belongs to, and the trail itself.
+
+        Raises:
+            TrailNotFound: If there is no such trail.
+        """
+        trailhead_id = hike_cache.trailhead_of(trail_id)
+        if trailhead_id is None:
+            db = await clients.get_db()
+            response = await db.from_("trails").select("id, trailhead_id").eq("id", trail_id).execute()
+            if not response.data:
+                raise TrailNotFound(f"Trail {trail_id} not found")
+            trailhead_id = response.data[0]["trailhead_id"]
+
+        hike = await hike_cache.get(trailhead_id)
+        trail = next((trail for trail in hike.trails if trail.trail_id == trail_id), None) if hike else None
+        if trail is None:
+            raise TrailNotFound(f"Trail {trail_id} not found")
+        return hike, trail
+
+    async def expand(self, trail_id: str, node_id: str, prefetch: bool = True) -> dict:
+        """
+        Make sure `node_id` has children on the trail, generating them if needed.
+
+        Returns:
+            dict: The node's children and the edges to them, and which children
+                are being expanded speculatively.
+
+        Raises:
+            TrailNotFound: If the trail does not exist or does not contain the node.
+        """
+        key = (trail_id, node_id)
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self.expand_once(trail_id, node_id))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+        # Shielded, so a client disconnecting does not cancel an expansion others wait on
+        hike, trail, generated = await asyncio.shield(task)
+
+        children = sorted(trail.get_children(node_id))
+        prefetching = self.prefetch(hike, trail, node_id) if prefetch else []
+        return {
+            "trailId": trail_id,
+            "nodeId": node_id,
+            "generated": generated,
+            "children": [
+                {
+                    "id": child_id,
+                    "title": hike.nodes[child_id].title,
+                    "hasImage": bool(hike.nodes[child_id].image_url),
+                    "expanded": bool(trail.get_children(child_id)),
+                }
+                for child_id in children if child_id in hike.nodes
+            ],
+            "edges": [[node_id, child_id] for child_id in children],
+            "prefetching": prefetching,
+        }
+
+    async def expand_once(self, trail_id: str, node_id: str) -> tuple:
+        with metrics.span("expand_node"):
+            hike, trail = await self.load(trail_id)
+            if not trail.contains_node(node_id) or node_id not in hike.nodes:
+                raise TrailNotFound(f"Node {node_id} is not on trail {trail_id}")
+
+            # Includes nodes a speculative expansion got to first
+            already_expanded = bool(trail.get_children(node_id))
+            metrics.record_cache("expansion", already_expanded)
+            if already_expanded:
+                self.stats["already_expanded"] += 1
+                return hike, trail, False
+
+            if not hike.preferred_media:
+                await hike.restore_preferences(list(trail.edges))
+            await hike_cache.extend_trail(hike, hike.nodes[node_id], trail, 1)
+            self.stats["expanded"] += 1
+            return hike, trail, True
+
+    def rank_children(self, hike: Hike, node_id: str, children: List[str]) -> List[str]:
+        """
+        Order unexpanded children by how likely they are to be opened next: the
+        closest in meaning to the opened node first, since that is the natural
+        next step. Children missing from the vector index go last, by title.
+        """
+        def score(child_id: str):
+            similarity = hike.vector_index.similarity(node_id, child_id)
+            return (similarity is None, -(similarity or 0.0), hike.nodes[child_id].title or "")
+
+        return sorted(children, key=score)
+
+    def prefetch(self, hike: Hike, trail, node_id: str) -> List[str]:
+        """
+        Queue speculative expansions of the children most likely to be opened next.
+        """
+        if self.prefetch_width <= 0:
+            return []
+
+        candidates = [
+            child_id for child_id in trail.get_children(node_id)
+            if child_id in hike.nodes and not trail.get_children(child_id)
+            and (trail.trail_id, child_id) not in self.in_flight
+        ]
+        chosen = self.rank_children(hike, node_id, candidates)[:self.prefetch_width]
+        for child_id in chosen:
+            job_id = f"expand:{trail.trail_id}:{child_id}"
+            job = self.prefetch_jobs.get(job_id)
+            # Everyone waiting on the same expansion asks for the same prefetches
+            if job is not None and not job.done:
+                continue
+            self.stats["prefetched"] += 1
+            self.prefetch_jobs.submit(
+                job_id,
+                "expand",
+                lambda child_id=child_id: self.expand(trail.trail_id, child_id, prefetch=False),
+            )
+        return chosen
+
+    async def shutdown(self):
+        await self.prefetch_jobs.shutdown()
+
+
+# Shared by every request in the process, so concurrent expansions are deduplicated
+trail_expander = TrailExpander()
@@ -1,6 +1,10 @@
-from typing import Type, Any, Dict
+from typing import Type, Any, AsyncIterator, Dict, List
 from pydantic import BaseModel
 from openai import OpenAI as GPTClient
+from openai import AsyncOpenAI as AsyncGPTClient
+from llm_cache import LLMCache, make_key
+from resilience import UpstreamCaller
+import metrics
 # from lib.status_checker import StatusChecker
 # from lib.doppler_secrets_backend import DopplerSecretsBackend
 
@@ -11,10 +15,39 @@ load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+DEFAULT_SYSTEM_ROLE = "You are working to help break down learning tasks into simpler subtasks."
+
+
+def build_messages(prompt: str, data: Any, system_role: str) -> List[Dict]:
+    return [
+        {"role": "system", "content": system_role},
+        {"role": "user", "content": f"Ask: {prompt} Analyze the following data: {data}"}
+    ]
+
+
+def build_prompt_request(prompt: str, data: Any, schema_model: Type[BaseModel], system_role: str) -> Dict:
+    """
+    Build the keyword arguments for a structured-output chat completion.
+    Shared by the sync and async interfaces so both send identical requests.
+    """
+    # Generate the JSON schema from the Pydantic model
+    json_schema = schema_model.model_json_schema()
+    json_schema_with_name = {"name": schema_model.__name__, "schema": json_schema}
+
+    return {
+        "messages": build_messages(prompt, data, system_role),
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": json_schema_with_name
+        },
+    }
+
+
 class GPTInterface:
-    def __init__(self, api_key: str = None, model: str = "gpt-4o-mini"):
+    def __init__(self, api_key: str = None, model: str = "gpt-4o-mini", cache: LLMCache = None):
         self.client = GPTClient(api_key=api_key)
         self.model = model
+        self.cache = cache
 
     def chat_completion(self, chat_history):
         response = self.client.chat.completions.create(
@@ -28,7 +61,7 @@ class GPTInterface:
                    prompt: str, 
                    data: Any, 
                    schema_model: Type[BaseModel], 
-                   system_role: str = "You are working to help break down learning tasks into simpler subtasks.") -> BaseModel:
+                   system_role: str = DEFAULT_SYSTEM_ROLE) -> BaseModel:
         """
         Run a GPT prompt with a specified schema model and return parsed results.
 
@@ -41,23 +74,116 @@ class GPTInterface:
         Returns:
             BaseModel: Parsed results as per the schema model.
         """
-        # Generate the JSON schema from the Pydantic model
-        json_schema = schema_model.model_json_schema()
-        json_schema_with_name = {"name": schema_model.__name__, "schema": json_schema}
+        # Identical requests are answered from the cache when one is configured
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_key(self.model, system_role, prompt, data, schema_model)
+            cached = self.cache.get(cache_key)
+            metrics.record_cache("llm", cached is not None)
+            if cached is not None:
+                return schema_model.parse_raw(cached)
 
         # Send the request to GPT
         response = self.client.chat.completions.create(
             model=self.model,
             # reasoning_effort="low",
-            messages=[
-                {"role": "system", "content": system_role},
-                {"role": "user", "content": f"Ask: {prompt} Analyze the following data: {data}"}
-            ],
-            response_format={
-                "type": "json_schema",
-                "json_schema": json_schema_with_name
-            }
+            **build_prompt_request(prompt, data, schema_model, system_role)
         )
+        content = response.choices[0].message.content
+        if cache_key is not None:
+            self.cache.set(cache_key, content)
 
         # Parse and return the response
-        return schema_model.parse_raw(response.choices[0].message.content)
+        return schema_model.parse_raw(content)
+
+
+class AsyncGPTInterface:
+    """
+    Async counterpart of GPTInterface. Use this from FastAPI handlers and the
+    Hike build path so that upstream calls do not block the event loop.
+    """
+    def __init__(self, api_key: str = None, model: str = "gpt-4o-mini", http_client=None, cache: LLMCache = None,
+                 caller: UpstreamCaller = None):
+        # With a caller, retries are its job; the SDK's own retries would multiply them
+        self.client = AsyncGPTClient(api_key=api_key, http_client=http_client,
+                                     **({"max_retries": 0} if caller else {}))
+        self.model = model
+        self.cache = cache
+        self.caller = caller
+
+    async def create(self, **kwargs):
+        """
+        chat.completions.create, through the caller's retry and deadline policy if there is one.
+        """
+        if self.caller is None:
+            return await self.client.chat.completions.create(**kwargs)
+        return await self.caller.call(lambda: self.client.chat.completions.create(**kwargs))
+
+    async def chat_completion(self, chat_history):
+        response = await self.create(
+            model=self.model,
+            reasoning_effort="low",
+            messages=chat_history
+        )
+        return response.choices[0].message.to_dict()
+
+    async def run_prompt(self, 
+                         prompt: str, 
+                         data: Any, 
+                         schema_model: Type[BaseModel], 
+                         system_role: str = DEFAULT_SYSTEM_ROLE) -> BaseModel:
+        """
+        Run a GPT prompt with a specified schema model and return parsed results.
+
+        Args:
+            prompt (str): The prompt to guide the GPT response.
+            data (Any): Data to include in the analysis.
+            schema_model (Type[BaseModel]): Pydantic model to parse the response.
+            system_role (str): Role of the GPT assistant.
+
+        Returns:
+            BaseModel: Parsed results as per the schema model.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_key(self.model, system_role, prompt, data, schema_model)
+            cached = await self.cache.get_async(cache_key)
+            metrics.record_cache("llm", cached is not None)
+            if cached is not None:
+                return schema_model.parse_raw(cached)
+
+        response = await self.create(
+            model=self.model,
+            **build_prompt_request(prompt, data, schema_model, system_role)
+        )
+        content = response.choices[0].message.content
+        if cache_key is not None:
+            await self.cache.set_async(cache_key, content)
+
+        return schema_model.parse_raw(content)
+
+    async def stream_prompt(self,
+                            prompt: str,
+                            data: Any,
+                            system_role: str = DEFAULT_SYSTEM_ROLE) -> AsyncIterator[str]:
+        """
+        Run a GPT prompt and yield the plain-text reply as it is generated.
+
+        Args:
+            prompt (str): The prompt to guide the GPT response.
+            data (Any): Data to include in the analysis.
+            system_role (str): Role of the GPT assistant.
+
+        Yields:
+            str: Chunks of the reply, in order.
+        """
+        # Only opening the stream is retried; tokens already sent cannot be taken back
+        stream = await self.create(
+            model=self.model,
+            messages=build_messages(prompt, data, system_role),
+            stream=True,
+        )
+
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
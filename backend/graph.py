@@ -0,0 +1,195 @@
+# Graph primitives shared by Hike and the loaders that build it.
+
+from array import array
+from collections import deque
+from typing import Dict, List
+
+class Node:
+    def __init__(self, node_id: str, title: str, description: str, image_url: str = None):
+        self.id = node_id
+        self.title = title
+        self.description = description
+        self.image_url = image_url
+
+
+def bfs_distances(adjacency, node_id: str, depth: int = None) -> Dict[str, int]:
+    """
+    Breadth-first search from `node_id` over `adjacency` (node -> neighbours).
+    Each reachable node is visited once, even if several paths lead to it.
+
+    Returns:
+        Dict[str, int]: Reached nodes mapped to their hop distance, nearest first.
+            The start node itself is not included.
+    """
+    distances = {node_id: 0}
+    q = deque([node_id])
+
+    while q:
+        current_node = q.popleft()
+        distance = distances[current_node]
+        if depth is not None and distance >= depth:
+            continue
+
+        for next_node in adjacency(current_node):
+            if next_node not in distances:
+                distances[next_node] = distance + 1
+                q.append(next_node)
+
+    del distances[node_id]
+    return distances
+
+
+class Trail:
+    def __init__(self, trail_id: str, title: str):
+        self.trail_id = trail_id
+        self.title = title
+
+        # Forward (parent -> children) and reverse (child -> parents) adjacency
+        self.edges = {}
+        self.parents = {}
+
+    def contains_node(self, node_id: str) -> bool:
+        return node_id in self.edges
+
+    def get_number_nodes(self):
+        return len(self.edges)
+
+    def add_edge(self, start_node: str, end_node: str):
+        if start_node not in self.edges:
+            self.edges[start_node] = {end_node}
+        else:
+            self.edges[start_node].add(end_node)
+
+        if end_node not in self.edges:
+            self.edges[end_node] = set()
+
+        self.parents.setdefault(start_node, set())
+        self.parents.setdefault(end_node, set()).add(start_node)
+
+    def get_children(self, node_id: str) -> set:
+        return self.edges.get(node_id, set())
+
+    def get_parents(self, node_id: str) -> set:
+        return self.parents.get(node_id, set())
+
+    def ancestors(self, node_id: str, depth: int = None) -> Dict[str, int]:
+        """
+        Every node with a path to `node_id`, mapped to its distance, nearest first.
+        """
+        return bfs_distances(self.get_parents, node_id, depth)
+
+    def descendants(self, node_id: str, depth: int = None) -> Dict[str, int]:
+        """
+        Every node reachable from `node_id`, mapped to its distance, nearest first.
+        """
+        return bfs_distances(self.get_children, node_id, depth)
+
+    def topological_order(self) -> List[str]:
+        """
+        Order the nodes so every parent comes before its children (Kahn's algorithm).
+        """
+        in_degree = {node_id: len(self.get_parents(node_id)) for node_id in self.edges}
+        q = deque(node_id for node_id, degree in in_degree.items() if degree == 0)
+        order = []
+
+        while q:
+            node_id = q.popleft()
+            order.append(node_id)
+            for child in self.edges[node_id]:
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    q.append(child)
+
+        if len(order) != len(self.edges):
+            raise ValueError(f"Trail {self.trail_id} contains a cycle")
+        return order
+
+    def breadth_first_order(self) -> List[str]:
+        """
+        Every node once, breadth first from the roots. Unlike topological_order
+        this works on trails with cycles; nodes only reachable through a cycle
+        follow, starting from the first of them that was added.
+        """
+        order = []
+        seen = set()
+        roots = [node_id for node_id in self.edges if not self.get_parents(node_id)]
+        for start in roots + list(self.edges):
+            if start in seen:
+                continue
+            seen.add(start)
+            order.append(start)
+            for node_id in self.descendants(start):
+                if node_id not in seen:
+                    seen.add(node_id)
+                    order.append(node_id)
+        return order
+
+    def to_csr(self) -> "CSRTrail":
+        return CSRTrail.from_trail(self)
+
+
+class CSRTrail:
+    """
+    Compact, read-only snapshot of a Trail in compressed sparse row form.
+
+    Node IDs are interned to integers, and the forward and reverse adjacency
+    are stored as flat typed arrays: the neighbours of node i are
+    targets[offsets[i]:offsets[i + 1]]. This uses a fraction of the memory of
+    dict-of-sets adjacency for large trails.
+    """
+    def __init__(self, trail_id: str, title: str, node_ids: List[str],
+                 offsets: array, targets: array, reverse_offsets: array, reverse_targets: array):
+        self.trail_id = trail_id
+        self.title = title
+        self.node_ids = node_ids
+        self.index = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.offsets = offsets
+        self.targets = targets
+        self.reverse_offsets = reverse_offsets
+        self.reverse_targets = reverse_targets
+
+    @staticmethod
+    def _pack(node_ids: List[str], index: Dict[str, int], adjacency) -> tuple:
+        offsets = array("l", [0])
+        targets = array("l")
+        for node_id in node_ids:
+            targets.extend(sorted(index[n] for n in adjacency(node_id)))
+            offsets.append(len(targets))
+        return offsets, targets
+
+    @classmethod
+    def from_trail(cls, trail: Trail) -> "CSRTrail":
+        node_ids = list(trail.edges)
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        offsets, targets = cls._pack(node_ids, index, trail.get_children)
+        reverse_offsets, reverse_targets = cls._pack(node_ids, index, trail.get_parents)
+        return cls(trail.trail_id, trail.title, node_ids, offsets, targets, reverse_offsets, reverse_targets)
+
+    def contains_node(self, node_id: str) -> bool:
+        return node_id in self.index
+
+    def get_number_nodes(self):
+        return len(self.node_ids)
+
+    def get_children(self, node_id: str) -> List[str]:
+        i = self.index[node_id]
+        return [self.node_ids[j] for j in self.targets[self.offsets[i]:self.offsets[i + 1]]]
+
+    def get_parents(self, node_id: str) -> List[str]:
+        i = self.index[node_id]
+        return [self.node_ids[j] for j in self.reverse_targets[self.reverse_offsets[i]:self.reverse_offsets[i + 1]]]
+
+    def ancestors(self, node_id: str, depth: int = None) -> Dict[str, int]:
+        return bfs_distances(self.get_parents, node_id, depth)
+
+    def descendants(self, node_id: str, depth: int = None) -> Dict[str, int]:
+        return bfs_distances(self.get_children, node_id, depth)
+
+    def to_trail(self) -> Trail:
+        trail = Trail(self.trail_id, self.title)
+        for node_id in self.node_ids:
+            trail.edges.setdefault(node_id, set())
+            trail.parents.setdefault(node_id, set())
+            for child in self.get_children(node_id):
+                trail.add_edge(node_id, child)
+        return trail
@@ -0,0 +1,101 @@
+# Bulk loader for a hike's graph.
+#
+# Fetches all trails, edges and resources under one trailhead with `in_`
+# filters instead of one query per trail and per node. ID lists are chunked to
+# keep PostgREST URLs short, and the chunks of one step are fetched
+# concurrently, so loading costs three round-trip batches for most hikes.
+#
+# PostgREST caps every response at db-max-rows (1000 by default) without any
+# error, so each select is paged with order + range until a short page comes
+# back. A hike with more rows per chunk than that costs extra pages, not rows.
+
+import asyncio
+import os
+from typing import Callable, List, Tuple
+
+from graph import Node, Trail
+
+GRAPH_LOADER_CHUNK_SIZE = int(os.getenv("GRAPH_LOADER_CHUNK_SIZE", "200"))
+# Must not exceed the server's db-max-rows, or a capped page looks like the last one
+GRAPH_LOADER_PAGE_SIZE = int(os.getenv("GRAPH_LOADER_PAGE_SIZE", "1000"))
+# Resource columns loaded into each Node by default
+NODE_COLUMNS = "id, title, description"
+
+
+class GraphLoader:
+    def __init__(self, db, chunk_size: int = GRAPH_LOADER_CHUNK_SIZE, page_size: int = GRAPH_LOADER_PAGE_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.page_size = page_size
+        self.queries = 0
+
+    async def fetch_pages(self, build_query: Callable, order: Tuple[str, ...]) -> List[dict]:
+        """
+        Every row of the select `build_query()` returns, fetched page by page.
+        The `order` columns must identify a row uniquely, or pages may overlap.
+        """
+        rows = []
+        start = 0
+        while True:
+            query = build_query()
+            for column in order:
+                query = query.order(column)
+            self.queries += 1
+            response = await query.range(start, start + self.page_size - 1).execute()
+            page = response.data or []
+            rows += page
+
+            if len(page) < self.page_size:
+                return rows
+            start += self.page_size
+
+    async def fetch_in(self, table: str, column: str, values: List[str], columns: str = "*",
+                       order: Tuple[str, ...] = ("id",)) -> List[dict]:
+        """
+        Fetch every row of `table` whose `column` is in `values`, chunking large ID lists.
+        """
+        values = list(dict.fromkeys(v for v in values if v))
+        chunks = [values[i:i + self.chunk_size] for i in range(0, len(values), self.chunk_size)]
+
+        async def fetch_chunk(chunk: List[str]) -> List[dict]:
+            return await self.fetch_pages(lambda: self.db.from_(table).select(columns).in_(column, chunk), order)
+
+        results = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+        return [row for rows in results for row in rows]
+
+    async def load(self, hike, columns: str = NODE_COLUMNS) -> List[Trail]:
+        """
+        Load the trails, edges and nodes of `hike.trailhead_id` and store them
+        on the hike in one pass. Pass `columns` without "description" to load
+        lightweight nodes, e.g. "id, title, image_url" for drawing the graph.
+
+        Returns:
+            List[Trail]: The loaded trails, also assigned to `hike.trails`.
+        """
+        trail_rows = await self.fetch_pages(
+            lambda: self.db.from_("trails").select("id, trail_title").eq("trailhead_id", hike.trailhead_id),
+            ("id",),
+        )
+
+        # Edges are inserted without client IDs, so they are paged by their natural key
+        edge_rows = await self.fetch_in(
+            "edges", "trail_id", [row["id"] for row in trail_rows], "id_a, id_b, trail_id",
+            order=("trail_id", "id_a", "id_b"),
+        )
+
+        # Each resource is fetched once even if several trails share it
+        node_ids = {hike.trailhead_id}
+        for edge in edge_rows:
+            node_ids.add(edge["id_a"])
+            node_ids.add(edge["id_b"])
+        node_ids -= set(hike.nodes)
+
+        for row in await self.fetch_in("resources", "id", list(node_ids), columns):
+            hike.nodes[row["id"]] = Node(row["id"], row["title"], row.get("description"), row.get("image_url"))
+
+        trails = {row["id"]: Trail(row["id"], row["trail_title"]) for row in trail_rows}
+        for edge in edge_rows:
+            trails[edge["trail_id"]].add_edge(edge["id_a"], edge["id_b"])
+
+        hike.trails = list(trails.values())
+        return hike.trails
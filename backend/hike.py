@@ -1,71 +1,93 @@
 # python
 import os
 from dotenv import load_dotenv  # Ensure you've installed python-dotenv: pip install python-dotenv
-from supabase import create_client, Client
+from supabase import AsyncClient
 from pydantic import BaseModel
-from gpt import GPTInterface
-from perplexity import PerplexityInterface
+from gpt import AsyncGPTInterface
+from perplexity import AsyncPerplexityInterface
+import clients
+from resource_index import compatible, resource_index
+from write_buffer import WriteBuffer
+from graph import Node, Trail
+from graph_loader import GraphLoader, NODE_COLUMNS
+from context_builder import ContextBuilder
+from metrics import record_cache, traced
 import re
+import asyncio
 from typing import List
 
-class Node:
-    def __init__(self, node_id: str, title: str, description: str):
-        self.id = node_id
-        self.title = title
-        self.description = description
+load_dotenv()
 
-class Trail:
-    def __init__(self, trail_id: str, title: str):
-        self.trail_id = trail_id
-        self.title = title
-
-        self.edges = {}
-
-    def contains_node(self, node_id: str) -> bool:
-        return node_id in self.edges
-
-    def get_number_nodes(self):
-        return len(self.edges)
-
-    def add_edge(self, start_node: str, end_node: str):
-        if start_node not in self.edges:
-            self.edges[start_node] = {end_node}
-        else:
-            self.edges[start_node].add(end_node)
-
-        if end_node not in self.edges:
-            self.edges[end_node] = set()
+# Maximum number of trails of one hike that are built at the same time
+HIKE_TRAIL_CONCURRENCY = int(os.getenv("HIKE_TRAIL_CONCURRENCY", "3"))
+# Maximum number of generate_node calls in flight across one hike
+HIKE_NODE_CONCURRENCY = int(os.getenv("HIKE_NODE_CONCURRENCY", "6"))
+# Cosine similarity of two titles above which a new topic is treated as a rewording of an existing resource
+VECTOR_DEDUPE_THRESHOLD = float(os.getenv("VECTOR_DEDUPE_THRESHOLD", "0.85"))
+# Closest titles checked for one that is also compatible with the hike's preferences
+VECTOR_DEDUPE_CANDIDATES = 5
 
 class Hike:
-    def __init__(self, user_response):
-        self.topic = user_response.topic
-        self.prereqs = user_response.satisfied_prereqs
-        self.preferred_media = user_response.preferred_media_types
-        self.preferred_difficulty = user_response.preferred_difficulty
-        self.db = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
-        self.gpt = GPTInterface(api_key=os.getenv("OPENAI_KEY"), model="gpt-4o-mini")
-        self.perplexity = PerplexityInterface(api_key=os.getenv("PERPLEXITY_KEY"))
+    def __init__(self, db: AsyncClient, gpt: AsyncGPTInterface, perplexity: AsyncPerplexityInterface):
+        self.db = db
+        self.gpt = gpt
+        self.perplexity = perplexity
+        self.trailhead_id = None
+        self.topic = None
+        self.prereqs = []
+        self.preferred_media = []
+        self.preferred_difficulty = None
         self.nodes = {}
         self.trails = []
 
-        self.generate_initial_node(user_response)
-
-    def create_from_trailhead(self, trailhead_id: str, url: str = None, key: str = None):
-        self.trailhead_id = trailhead_id
-
+        # trail_id -> {"title", "status"}; lets background jobs report partial progress
+        self.trail_status = {}
+        self.trail_concurrency = HIKE_TRAIL_CONCURRENCY
+        self.node_semaphore = asyncio.Semaphore(HIKE_NODE_CONCURRENCY)
+        self.resource_index = resource_index
+        self.vector_index = clients.get_vector_index()
+        # Trails, resources and edges are buffered here and written in bulk by flush()
+        self.writes = WriteBuffer(db)
+        # Keeps the topic lists in extend_topic / extend_summit prompts within a token budget
+        self.context = ContextBuilder()
+
+    @staticmethod
+    async def create_clients(url: str = None, key: str = None):
         if not url or not key:
             load_dotenv()
-            self.db = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
-        else:
-            self.db = create_client(url, key)
+            url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
 
-        self.gpt = GPTInterface(api_key=os.getenv("OPENAI_KEY"), model="gpt-4o-mini")
-        self.perplexity = PerplexityInterface(api_key=os.getenv("PERPLEXITY_KEY"))
-        self.nodes = {}
-        self.nodes = {self.trailhead_id : self.create_node_from_id(self.trailhead_id)}
+        db = await clients.get_db(url, key)
+        return db, clients.get_gpt("gpt-4o-mini"), clients.get_perplexity()
+
+    @classmethod
+    async def create(cls, user_response, build_trails: bool = True) -> "Hike":
+        """
+        Build a new hike from the synthesized onboarding response.
+
+        With build_trails=False only the trailhead node is created, so the caller
+        can hand the slow generate_trails step to a background job.
+        """
+        hike = cls(*await cls.create_clients())
+        hike.topic = user_response.topic
+        hike.prereqs = user_response.satisfied_prereqs
+        hike.preferred_media = user_response.preferred_media_types
+        hike.preferred_difficulty = user_response.preferred_difficulty
+
+        await hike.generate_initial_node(user_response)
+        if build_trails:
+            await hike.generate_trails(user_response)
+        return hike
+
+    @classmethod
+    async def create_from_trailhead(cls, trailhead_id: str, url: str = None, key: str = None) -> "Hike":
+        hike = cls(*await cls.create_clients(url, key))
+        hike.trailhead_id = trailhead_id
+        hike.nodes = {trailhead_id: await hike.create_node_from_id(trailhead_id)}
+        return hike
     
-    def create_node_from_id(self, node_id: str) -> Node:
-        response = self.db.from_("xresources").select("*").eq("id", node_id).execute()
+    async def create_node_from_id(self, node_id: str) -> Node:
+        response = await self.db.from_("resources").select("*").eq("id", node_id).execute()
         data = response.data[0] if response.data else None
 
         if data:
@@ -75,27 +97,30 @@ class Hike:
         else:
             return None
 
-    def get_trails(self) -> list:
-        response = self.db.from_("trails").select("*").eq("trailhead_id", self.trailhead_id).execute()
-        rows = response.data if response.data else []
-
-        trails = []
-        
-        for row in rows:
-            trail = Trail(row["id"], row["trail_title"])
-            edges = self.db.from_("edges").select("*").eq("trail_id", row["id"]).execute().data
-            
-            for edge in edges:
-                trail.add_edge(edge["id_a"], edge["id_b"])
-            
-            for node in trail.edges:
-                self.nodes[node] = self.create_node_from_id(node)
-
-            trails.append(trail)
-
-        self.trails += trails
+    @traced("get_trails")
+    async def get_trails(self, columns: str = NODE_COLUMNS) -> list:
+        """
+        Load every trail of this hike, with its edges and nodes, in a constant
+        number of bulk queries. `columns` picks the resource fields loaded per node.
+        """
+        loader = GraphLoader(self.db)
+        trails = await loader.load(self, columns)
+        print(f"Loaded {len(trails)} trails and {len(self.nodes)} nodes in {loader.queries} queries")
         return trails
 
+    async def restore_preferences(self, node_ids: List[str]):
+        """
+        Recover the preferred media of a hike loaded from the database (rather than
+        built from an onboarding response) from the resources it generated.
+        """
+        response = await self.db.from_("resources").select("resource_type").in_("id", node_ids[:50]).execute()
+        for row in response.data or []:
+            if row.get("resource_type"):
+                self.preferred_media = row["resource_type"]
+                break
+        # The onboarding difficulty label is not stored; resources only carry a random score
+        self.preferred_difficulty = self.preferred_difficulty or "medium"
+
     def extract_topics(self, topics_str: str) -> list:
         # Use regular expression to find all occurrences of text within double brackets
         topics = re.findall(r'\[\[(.*?)\]\]', topics_str)
@@ -106,41 +131,16 @@ class Hike:
         return re.sub(pattern, '', description)
 
     def find_node_parents(self, node: Node, trail: Trail, depth: int = 6) -> list:
-        prev_nodes = []
-        q = []
-
-        q.append(node.id)
-
-        for i in range(depth):
-            if not q:
-                break
-
-            current_node = q.pop(0)
-            for start_node in trail.edges:
-                if current_node in trail.edges[start_node]:
-                    prev_nodes.append(start_node)
-                    q.append(start_node)
-
-        return prev_nodes
+        # Nearest ancestors first, each listed once
+        return list(trail.ancestors(node.id, depth))
 
     def find_node_children(self, node: Node, trail: Trail, depth: int = 8) -> list:
-        next_nodes = []
-        q = []
-
-        q.append(node.id)
+        if not trail.contains_node(node.id):
+            return []
+        return list(trail.descendants(node.id, depth))
 
-        for i in range(depth):
-            if not q:
-                break
-
-            current_node = q.pop(0)
-            for next_node in trail.edges[current_node]:
-                next_nodes.append(next_node)
-                q.append(next_node)
-
-        return next_nodes
-
-    def extend_topic(self, focus: Node, current_trail: Trail) -> str:
+    @traced("extend_topic")
+    async def extend_topic(self, focus: Node, current_trail: Trail) -> str:
         class Output(BaseModel):
             topics: List[str]
 
@@ -160,23 +160,22 @@ class Hike:
         for the given topic. Make sure that the topics are specific enough.
         """
 
+        # Nearest ancestors first, so the closest prerequisites keep their full descriptions
         prev_nodes = self.find_node_parents(focus, current_trail)
-        prerequisites = []
-
-        for node in prev_nodes:
-            prerequisites.append(f"The next topic is called {self.nodes[node].title}, which is about {self.nodes[node].description}.")
+        prerequisites = self.context.build([self.nodes[node] for node in prev_nodes if node in self.nodes])
 
-        topics = self.gpt.run_prompt(
+        topics = (await self.gpt.run_prompt(
             prompt=prompt,
             data=prerequisites,
             schema_model=Output,
             system_role=system_role,
-        ).topics
+        )).topics
 
 
         return topics
 
-    def extend_summit(self, focus: Node, current_trail: Trail) -> str:
+    @traced("extend_summit")
+    async def extend_summit(self, focus: Node, current_trail: Trail) -> str:
         class Output(BaseModel):
             found_connection: bool
             new_topic: str
@@ -198,20 +197,25 @@ class Hike:
         The following is the list of topics and descriptions that the user has already learned.
         """
 
-        all_paths = []
-        for trail in self.trails:
-            if trail.trail_id == current_trail.trail_id:
-                continue
-
-            prev_nodes = self.find_node_children(focus, current_trail)
-            prerequisites = []
+        # Every other trail gets an equal share of the context budget
+        other_trails = [trail for trail in self.trails if trail.trail_id != current_trail.trail_id]
+        trail_budget = self.context.budget // max(1, len(other_trails))
 
-            for node in prev_nodes:
-                prerequisites.append(f"The next topic is called {self.nodes[node].title}, which is about {self.nodes[node].description}.")
+        all_paths = []
+        for trail in other_trails:
+            # Describe the other trail from its roots down, visiting each node once
+            try:
+                order = trail.topological_order()
+            except ValueError as e:
+                # Loaded trails may share edges with other hikes and so contain cycles
+                print(f"{e}; describing it breadth first instead")
+                order = trail.breadth_first_order()
+            nodes = [self.nodes[node] for node in order if node in self.nodes]
+            prerequisites = self.context.build(nodes, budget=trail_budget)
 
             all_paths.append(f"This is the start of a new trail description. This trail contains the following information: {prerequisites}")
 
-        response = self.gpt.run_prompt(
+        response = await self.gpt.run_prompt(
             prompt=prompt,
             data=all_paths,
             schema_model=Output,
@@ -222,7 +226,37 @@ class Hike:
             return response.new_topic, response.related_indices
 
 
-    def generate_node(self, title: str) -> Node:
+    @traced("generate_node")
+    async def generate_node(self, title: str) -> Node:
+
+        # Link a compatible resource another hike already generated instead of searching again
+        self.resource_index.refresh(self.db)
+        existing = self.resource_index.lookup(title, self.preferred_media, self.preferred_difficulty)
+        # The index only holds titles; the description is fetched for the match alone
+        node = await self.create_node_from_id(existing["id"]) if existing else None
+        if node:
+            print(f"Reusing existing resource: {node.title}")
+            return node
+
+        # Same check by meaning, for topics that exist under slightly different wording.
+        # Skipped until the index has been built in the background
+        self.vector_index.refresh(self.db)
+        if self.vector_index.ready:
+            try:
+                matches = await self.vector_index.search_titles(title, k=VECTOR_DEDUPE_CANDIDATES)
+            except Exception as e:
+                # Dedupe is only an optimization; generate the topic if embeddings are down
+                print(f"Vector dedupe failed for {title}: {e}")
+                matches = []
+            match = next((
+                (row, score) for row, score in matches
+                if score >= VECTOR_DEDUPE_THRESHOLD and compatible(row, self.preferred_media, self.preferred_difficulty)
+            ), None)
+            record_cache("vector_dedupe", match is not None)
+            if match:
+                existing, score = match
+                print(f"Reusing similar resource: {existing['title']} for {title} (similarity {score:.2f})")
+                return Node(existing["id"], existing["title"], existing["description"])
 
         class Output(BaseModel):
             article: str
@@ -244,7 +278,7 @@ class Hike:
             Also, do not include any summary of the topic. Go straight into how to do the specified task.
             """
         
-        response = self.perplexity.run_prompt(
+        response = await self.perplexity.run_prompt(
             prompt=prompt,
             schema_model=Output,
             system_role= system_role,
@@ -262,27 +296,30 @@ class Hike:
             "resource_type": self.preferred_media,
         }
 
-        response = self.db.from_("resources").insert(payload).execute()
-        new_resource = response.data[0] if response.data else {}
-        new_node_id = new_resource.get("id")
-        return Node(new_node_id, title, description)
-
-    def generate_initial_node(self, user_response: dict) -> Node:
-
-        class Output(BaseModel):
-            topics: List[str]
+        new_resource = self.writes.add("resources", payload)
+        return Node(new_resource["id"], title, description)
 
+    @traced("generate_initial_node")
+    async def generate_initial_node(self, user_response: dict) -> Node:
         payload = {
             "title": user_response.topic,
             "description": user_response.topic_description,
         }
 
-        response = self.db.from_("resources").insert(payload).execute()
-        new_resource = response.data[0] if response.data else {}
-        new_node_id = new_resource.get("id")
+        # The trailhead is written right away since its ID is handed back to the client
+        new_resource = self.writes.add("resources", payload)
+        await self.flush()
+        new_node_id = new_resource["id"]
 
         self.trailhead_id = new_node_id
         self.nodes[new_node_id] = Node(new_node_id, user_response.topic, user_response.topic_description)
+        return self.nodes[new_node_id]
+
+    @traced("generate_trails")
+    async def generate_trails(self, user_response: dict):
+
+        class Output(BaseModel):
+            topics: List[str]
 
         system_role = f"""
         You are currently helping a user with this objective: {user_response.objective}. To do so, you need to find a wide range of topics that can build up to this objective.
@@ -297,53 +334,149 @@ class Hike:
         The following is the list of topics and descriptions that the user has already learned.
         """
 
-        trail_topics = self.gpt.run_prompt(
+        trail_topics = (await self.gpt.run_prompt(
             prompt=prompt,
             data= (user_response.additional_info + user_response.notes),
             schema_model=Output,
             system_role=system_role,
-        ).topics
-
-        for topic in trail_topics:
-            payload = {
-                "trail_title": topic,
-                "trailhead_id": self.trailhead_id,
-            }
-
-            response = self.db.from_("trails").insert(payload).execute()
-            new_resource = response.data[0] if response.data else {}
-            trail_id = new_resource.get("id")
+        )).topics
+
+        # Trails are independent until extend_summit merges them, so build them concurrently
+        semaphore = asyncio.Semaphore(self.trail_concurrency)
+
+        async def build_trail(topic: str) -> Trail:
+            async with semaphore:
+                payload = {
+                    "trail_title": topic,
+                    "trailhead_id": self.trailhead_id,
+                }
+
+                trail_id = self.writes.add("trails", payload)["id"]
+
+                trail = Trail(trail_id, topic)
+                self.trail_status[trail_id] = {"title": topic, "status": "building"}
+                try:
+                    await self.extend_trail(self.nodes[self.trailhead_id], trail, 1)
+                except Exception as e:
+                    print(f"Trail {topic} failed: {e}")
+
+                # Rows a failed flush put back are retried here; the trail only
+                # counts as built once everything it holds is in the database
+                written = True
+                try:
+                    await self.flush()
+                except Exception as e:
+                    print(f"Trail {topic} could not be written: {e}")
+                    written = False
+
+                # A trail that got no nodes, or not all of them written, is removed rather than left half-written
+                if trail.get_number_nodes() == 0 or not written:
+                    self.trail_status[trail_id]["status"] = "failed"
+                    await self.abandon_trail(trail_id)
+                    return None
+
+                self.trail_status[trail_id]["status"] = "completed"
+                return trail
+
+        trails = await asyncio.gather(*(build_trail(topic) for topic in trail_topics))
+        self.trails += [trail for trail in trails if trail is not None]
+        await self.flush()
+
+        # Nodes only abandoned trails reached are not part of the hike in the database either
+        kept = {self.trailhead_id} | {node_id for trail in self.trails for node_id in trail.edges}
+        self.nodes = {node_id: node for node_id, node in self.nodes.items() if node_id in kept}
+
+        if trail_topics and not any(trails):
+            raise RuntimeError("Every trail of this hike failed to build")
+
+    async def abandon_trail(self, trail_id: str):
+        """
+        Delete a trail and its edges, whether they are still buffered or already written.
+        """
+        # Holding the buffer's lock keeps a concurrent flush from re-writing them afterwards
+        async with self.writes.lock:
+            self.writes.discard("trails", lambda row: row["id"] == trail_id)
+            self.writes.discard("edges", lambda row: row["trail_id"] == trail_id)
+            await self.db.from_("edges").delete().eq("trail_id", trail_id).execute()
+            await self.db.from_("trails").delete().eq("id", trail_id).execute()
+
+    @traced("flush")
+    async def flush(self):
+        """
+        Write all buffered rows to the database in bulk.
+        """
+        written = await self.writes.flush()
 
-            trail = Trail(trail_id, topic)
-            self.extend_trail(self.nodes[self.trailhead_id], trail, 1)
+        # Only resources that actually exist in the database are offered for reuse
+        for row in written["resources"]:
+            self.resource_index.add(row)
+        # Embedding is best-effort and must not fail a write that already succeeded
+        self.vector_index.add_in_background(written["resources"])
 
-            self.trails.append(trail)
+    def progress(self) -> dict:
+        """
+        Report which trails and nodes are finished so far.
+        """
+        return {
+            "trailheadId": self.trailhead_id,
+            "trails": [{"id": trail_id, **status} for trail_id, status in self.trail_status.items()],
+            "nodes": [node_id for node_id in self.nodes if node_id != self.trailhead_id],
+        }
 
-    def extend_trail(self, current_node: Node, trail: Trail, depth: int):
+    async def extend_trail(self, current_node: Node, trail: Trail, depth: int):
 
         if depth == 0:
             return
         
-        new_topics = self.extend_topic(current_node, trail)
+        try:
+            new_topics = await self.extend_topic(current_node, trail)
+        except Exception as e:
+            # An empty trail has nothing to keep, so let the caller give up on it
+            if trail.get_number_nodes() == 0:
+                raise
+            print(f"Not extending past {current_node.title}: {e}")
+            return
 
-        for topic in new_topics:
-            new_node = self.generate_node(topic)
+        # Siblings are generated in parallel, and each child starts extending as
+        # soon as its own node exists instead of waiting for the whole level.
+        async def extend_child(topic: str):
+            async with self.node_semaphore:
+                try:
+                    new_node = await self.generate_node(topic)
+                except Exception as e:
+                    # Upstream calls already retried; drop this branch instead of the whole trail
+                    print(f"Skipping topic {topic}: {e}")
+                    return
+
+            # A reused resource may already be on this trail; linking it again could form a cycle
+            if trail.contains_node(new_node.id):
+                return
             self.nodes[new_node.id] = new_node
 
             trail.add_edge(current_node.id, new_node.id)
 
-            # Insert a new record into the "edges" table
+            # Queue a new record for the "edges" table
             edge_payload = {
                 "id_a": current_node.id,
                 "id_b": new_node.id,
                 "trail_id": trail.trail_id,
             }
 
-            edge_response = self.db.from_("edges").insert(edge_payload).execute()
+            self.writes.add("edges", edge_payload)
 
             print(f"New node created: {topic}")
 
-            self.extend_trail(new_node, trail, depth - 1)
+            await self.extend_trail(new_node, trail, depth - 1)
+
+        await asyncio.gather(*(extend_child(topic) for topic in new_topics))
+
+        # End of this trail level: write its nodes and edges in one batch. If
+        # that fails the rows stay buffered, and whoever started the extension
+        # flushes again to find out whether they made it.
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Could not write the nodes below {current_node.title} yet: {e}")
 
 
 # poker_id = "5b212b56-5380-47a8-90d7-b25ef220c2be"
@@ -351,10 +484,10 @@ class Hike:
 
 # node_id = "277f0f80-f216-4377-82fd-c6804f8daed5"
 
-# hike = Hike(trailhead_id=trailhead_id)
-# curr_node = hike.create_node_from_id(node_id)
+# hike = await Hike.create_from_trailhead(trailhead_id)
+# curr_node = await hike.create_node_from_id(node_id)
 
-# trails = hike.get_trails()
+# trails = await hike.get_trails()
 # curr_trail = trails[1]
 
-# hike.extend_trail(curr_node, curr_trail, 3)
\ No newline at end of file
+# await hike.extend_trail(curr_node, curr_trail, 3)
\ No newline at end of file
@@ -0,0 +1,180 @@
+# Process-wide cache of loaded hikes, keyed by trailhead ID.
+#
+# Loading a hike means building a Hike and running get_trails, which reads
+# every trail, edge and resource under the trailhead from Supabase. Requests
+# that touch the same hike in quick succession (drawing its graph, expanding
+# its nodes) share one loaded Hike from here instead.
+#
+# Entries are evicted least-recently-used first once their estimated memory
+# exceeds HIKE_CACHE_MEMORY_BYTES, and reloaded after HIKE_CACHE_TTL seconds so
+# writes from other processes (image generation, other workers) show up.
+# Growth through HikeCache.extend_trail is write-through: the new rows go to
+# the database and, because the cached Hike is the one being extended, into
+# the warm graph at the same time.
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import metrics
+from graph_loader import NODE_COLUMNS
+from hike import Hike
+
+HIKE_CACHE_MEMORY_BYTES = int(os.getenv("HIKE_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+HIKE_CACHE_TTL = float(os.getenv("HIKE_CACHE_TTL", "300"))
+# Every field a cached hike may be asked for: descriptions for prompts, image URLs for graphs
+HIKE_CACHE_COLUMNS = f"{NODE_COLUMNS}, image_url"
+
+# Rough per-object overhead of a node (Node, its hike.nodes entry, adjacency sets)
+# and of an edge (set entries in both directions), on top of the strings themselves
+NODE_OVERHEAD_BYTES = 600
+EDGE_OVERHEAD_BYTES = 200
+
+
+def hike_size(hike: Hike) -> int:
+    """
+    Estimated memory held by a hike's graph, in bytes.
+    """
+    size = 0
+    for node in hike.nodes.values():
+        size += NODE_OVERHEAD_BYTES + len(node.title or "") + len(node.description or "") + len(node.image_url or "")
+    for trail in hike.trails:
+        size += EDGE_OVERHEAD_BYTES * sum(len(children) for children in trail.edges.values())
+    return size
+
+
+class HikeCache:
+    def __init__(self, max_memory_bytes: int = HIKE_CACHE_MEMORY_BYTES, ttl: float = HIKE_CACHE_TTL):
+        self.max_memory_bytes = max_memory_bytes
+        self.ttl = ttl
+
+        # trailhead_id -> (loaded_at, size, hike)
+        self.entries: OrderedDict = OrderedDict()
+        self.memory_bytes = 0
+        # trail_id -> trailhead_id for every cached trail, so a trail ID finds its hike
+        self.trail_owners: Dict[str, str] = {}
+        # trailhead_id -> load in progress, shared by concurrent requests
+        self.loading: Dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, trailhead_id: str) -> bool:
+        return trailhead_id in self.entries
+
+    def trailhead_of(self, trail_id: str) -> Optional[str]:
+        return self.trail_owners.get(trail_id)
+
+    async def get(self, trailhead_id: str) -> Optional[Hike]:
+        """
+        The loaded hike for a trailhead, from the cache or freshly loaded.
+
+        Returns:
+            Optional[Hike]: The hike, or None if the trailhead does not exist.
+        """
+        entry = self.entries.get(trailhead_id)
+        if entry is not None and time.time() - entry[0] <= self.ttl:
+            self.entries.move_to_end(trailhead_id)
+            self.hits += 1
+            metrics.record_cache("hike", True)
+            return entry[2]
+
+        self.misses += 1
+        metrics.record_cache("hike", False)
+        task = self.loading.get(trailhead_id)
+        if task is None:
+            task = asyncio.create_task(self.load(trailhead_id))
+            self.loading[trailhead_id] = task
+
+            def forget(done: asyncio.Task):
+                # Unless an invalidation already replaced or dropped it
+                if self.loading.get(trailhead_id) is done:
+                    del self.loading[trailhead_id]
+
+            task.add_done_callback(forget)
+        return await asyncio.shield(task)
+
+    async def load(self, trailhead_id: str) -> Optional[Hike]:
+        hike = Hike(*await Hike.create_clients())
+        hike.trailhead_id = trailhead_id
+        await hike.get_trails(columns=HIKE_CACHE_COLUMNS)
+        if trailhead_id not in hike.nodes:
+            return None
+        # An invalidation that arrived while we loaded means this may already be stale
+        if self.loading.get(trailhead_id) is asyncio.current_task():
+            self.put(hike)
+        return hike
+
+    def put(self, hike: Hike):
+        """
+        Cache a hike that is complete in memory, e.g. one that just finished building.
+        """
+        self.invalidate(hike.trailhead_id)
+        size = hike_size(hike)
+        # A hike bigger than the whole budget would only evict everything else
+        if size > self.max_memory_bytes:
+            return
+
+        self.entries[hike.trailhead_id] = (time.time(), size, hike)
+        self.memory_bytes += size
+        for trail in hike.trails:
+            self.trail_owners[trail.trail_id] = hike.trailhead_id
+        self.evict()
+
+    def resize(self, trailhead_id: str):
+        """
+        Re-measure a cached hike whose graph grew, and evict others if needed.
+        """
+        entry = self.entries.get(trailhead_id)
+        if entry is None:
+            return
+        loaded_at, size, hike = entry
+        new_size = hike_size(hike)
+        self.entries[trailhead_id] = (loaded_at, new_size, hike)
+        self.memory_bytes += new_size - size
+        for trail in hike.trails:
+            self.trail_owners[trail.trail_id] = trailhead_id
+        self.evict()
+
+    def invalidate(self, trailhead_id: str):
+        """
+        Drop a hike, so the next request reloads it from the database.
+        """
+        self.loading.pop(trailhead_id, None)
+        entry = self.entries.pop(trailhead_id, None)
+        if entry is None:
+            return
+        self.memory_bytes -= entry[1]
+        for trail in entry[2].trails:
+            self.trail_owners.pop(trail.trail_id, None)
+
+    def evict(self):
+        while self.memory_bytes > self.max_memory_bytes and self.entries:
+            trailhead_id = next(iter(self.entries))
+            self.invalidate(trailhead_id)
+            self.evictions += 1
+
+    async def extend_trail(self, hike: Hike, node, trail, depth: int = 1):
+        """
+        Grow a cached hike write-through: extend_trail writes the new nodes and
+        edges to the database, and the cached graph is the one that grows.
+
+        If the extension fails partway, or its rows cannot all be written, the
+        hike is dropped instead, since its graph may then hold edges that never
+        reached the database.
+        """
+        try:
+            await hike.extend_trail(node, trail, depth)
+            # extend_trail keeps rows it could not write buffered; this raises if they still fail
+            await hike.flush()
+        except BaseException:
+            self.invalidate(hike.trailhead_id)
+            raise
+        self.resize(hike.trailhead_id)
+
+
+# Shared by every request in the process
+hike_cache = HikeCache()
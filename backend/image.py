@@ -1,34 +1,174 @@
-from lumaai import LumaAI
-import requests
+# Image generation for resources, through Luma's generations API.
+#
+# ImagePipeline submits generations for many resources at once under a
+# concurrency cap, polls each one with exponential backoff until it finishes or
+# its deadline passes, and writes the resulting image_url values back to the
+# resources table in batches. Point LUMAAI_BASE_URL at a local fake of the
+# generations API to run it without Luma; tests use benchmarks.fakes.FakeLuma.
+
+import argparse
+import asyncio
+import os
+import random
 import time
+from typing import Dict, List
 
 from dotenv import load_dotenv
 load_dotenv()
 
-import os
-import supabase
+from lumaai import AsyncLumaAI
+
+import clients
+from context_builder import summarize
+
+# Generations submitted or polling at the same time
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", "4"))
+# Seconds a single generation may take before it is abandoned
+IMAGE_DEADLINE = float(os.getenv("IMAGE_DEADLINE", "300"))
+IMAGE_POLL_INITIAL = float(os.getenv("IMAGE_POLL_INITIAL", "2"))
+IMAGE_POLL_MAX = float(os.getenv("IMAGE_POLL_MAX", "15"))
+IMAGE_WRITE_BATCH = int(os.getenv("IMAGE_WRITE_BATCH", "20"))
+IMAGE_MODEL = os.getenv("IMAGE_MODEL", "photon-1")
+# Token budget of the description summary used as the image prompt
+IMAGE_PROMPT_TOKENS = 60
+
+
+def resource_prompt(resource: dict) -> str:
+    description = summarize(resource.get("description") or "", IMAGE_PROMPT_TOKENS)
+    return f"{resource['title']}. {description}".strip()
+
+
+class ImagePipeline:
+    def __init__(self,
+                 luma=None,
+                 db=None,
+                 concurrency: int = IMAGE_CONCURRENCY,
+                 deadline: float = IMAGE_DEADLINE,
+                 poll_initial: float = IMAGE_POLL_INITIAL,
+                 poll_max: float = IMAGE_POLL_MAX,
+                 write_batch: int = IMAGE_WRITE_BATCH):
+        self.luma = luma or clients.get_async_luma()
+        self.db = db
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.write_batch = write_batch
+        self.pending_writes: List[dict] = []
+        self.stats = {"completed": 0, "failed": 0, "timed_out": 0, "writes": 0}
+
+    async def generate(self, prompt: str) -> str:
+        """
+        Create one image generation and wait for it.
+
+        Returns:
+            str: URL of the generated image.
 
+        Raises:
+            RuntimeError: If the generation failed.
+            TimeoutError: If it did not finish within the deadline.
+        """
+        deadline = time.monotonic() + self.deadline
+        generation = await self.luma.generations.image.create(prompt=prompt, model=IMAGE_MODEL)
+
+        interval = self.poll_initial
+        while generation.state != "completed":
+            if generation.state == "failed":
+                raise RuntimeError(f"Generation failed: {generation.failure_reason}")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Generation {generation.id} did not finish in {self.deadline}s")
+
+            # Jittered exponential backoff, never sleeping past the deadline
+            await asyncio.sleep(min(interval * random.uniform(0.8, 1.2), remaining))
+            interval = min(interval * 1.5, self.poll_max)
+            generation = await self.luma.generations.get(id=generation.id)
+
+        return generation.assets.image
+
+    async def generate_for(self, resource: dict, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                image_url = await self.generate(resource_prompt(resource))
+            except TimeoutError as e:
+                self.stats["timed_out"] += 1
+                print(f"Image for {resource['id']} timed out: {e}")
+                return
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"Image for {resource['id']} failed: {e}")
+                return
+
+        self.stats["completed"] += 1
+        # Title and description ride along so the upsert is a complete row
+        self.pending_writes.append({
+            "id": resource["id"],
+            "title": resource["title"],
+            "description": resource.get("description"),
+            "image_url": image_url,
+        })
+        if len(self.pending_writes) >= self.write_batch:
+            await self.flush()
+
+    async def flush(self):
+        """
+        Write buffered image URLs back with one upsert.
+        """
+        rows, self.pending_writes = self.pending_writes, []
+        if rows and self.db is not None:
+            await self.db.from_("resources").upsert(rows).execute()
+            self.stats["writes"] += 1
+
+    async def run(self, resources: List[dict]) -> Dict[str, int]:
+        """
+        Generate images for `resources` (rows with id, title and description).
+
+        Returns:
+            Dict[str, int]: Counts of completed, failed and timed-out generations,
+                and the number of batched writes.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            await asyncio.gather(*(self.generate_for(resource, semaphore) for resource in resources))
+        finally:
+            # Keep whatever finished even if the batch was cancelled
+            await self.flush()
+        return self.stats
+
+    async def fill_missing(self, limit: int = 100) -> Dict[str, int]:
+        """
+        Generate images for up to `limit` resources that do not have one yet.
+        """
+        response = await self.db.from_("resources") \
+            .select("id, title, description") \
+            .is_("image_url", "null") \
+            .limit(limit) \
+            .execute()
+        resources = response.data or []
+        print(f"Generating images for {len(resources)} resources")
+        return await self.run(resources)
 
-client = LumaAI()
 
 def generate(desc):
     #desc is string of description
-    generation = client.generations.image.create(
-    prompt=desc,)
-
-    completed = False
-    while not completed:
-        generation = client.generations.get(id=generation.id)
-        if generation.state == "completed":
-            completed = True
-        elif generation.state == "failed":
-            raise RuntimeError(f"Generation failed: {generation.failure_reason}")
-        print("Dreaming")
-        time.sleep(2)
-    image_url = generation.assets.image
+    # A client of its own, since the pooled one is bound to the server's event loop
+    image_url = asyncio.run(ImagePipeline(luma=AsyncLumaAI()).generate(desc))
     print(image_url)
     return image_url
 
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate images for resources without one.")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=IMAGE_CONCURRENCY)
+    args = parser.parse_args()
+
+    async def main():
+        try:
+            pipeline = ImagePipeline(db=await clients.get_db(), concurrency=args.concurrency)
+            print(await pipeline.fill_missing(args.limit))
+        finally:
+            await clients.close_clients()
 
-#generate("dancing cats")
\ No newline at end of file
+    asyncio.run(main())
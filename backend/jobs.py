@@ -0,0 +1,132 @@
+# Background job engine for long-running work such as hike generation.
+#
+# Jobs run as asyncio tasks on the server's event loop, but at most
+# `max_workers` of them make progress at once; the rest wait in the queue.
+# Finished jobs are kept around (up to `max_history`) so clients can poll
+# their final status.
+
+import asyncio
+import os
+import time
+import traceback
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+import metrics
+
+HIKE_JOB_WORKERS = int(os.getenv("HIKE_JOB_WORKERS", "4"))
+HIKE_JOB_HISTORY = int(os.getenv("HIKE_JOB_HISTORY", "1000"))
+
+
+class Job:
+    def __init__(self, job_id: str, kind: str, progress: Callable[[], Dict] = None):
+        self.id = job_id
+        self.kind = kind
+        self.status = "queued"
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+        # Called on every status request so progress is always current
+        self.progress = progress
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "progress": self.progress() if self.progress else None,
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = HIKE_JOB_WORKERS, max_history: int = HIKE_JOB_HISTORY):
+        self.max_workers = max_workers
+        self.max_history = max_history
+        self.jobs = OrderedDict()
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._semaphore
+
+    def submit(self,
+               job_id: str,
+               kind: str,
+               run: Callable[[], Awaitable[Any]],
+               progress: Callable[[], Dict] = None) -> Job:
+        """
+        Queue a coroutine factory as a background job.
+
+        Args:
+            job_id (str): Identifier clients use to poll the job.
+            kind (str): Short label for the type of work.
+            run (Callable): Zero-argument function returning the coroutine to run.
+            progress (Callable): Optional function reporting partial progress.
+
+        Returns:
+            Job: The queued job.
+        """
+        existing = self.jobs.get(job_id)
+        if existing and not existing.done:
+            return existing
+
+        job = Job(job_id, kind, progress)
+        self.jobs[job_id] = job
+        self.jobs.move_to_end(job_id)
+        job.task = asyncio.create_task(self._run(job, run))
+        self._trim_history()
+        return job
+
+    def get(self, job_id: str) -> Job:
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: Job, run: Callable[[], Awaitable[Any]]):
+        # The task inherited the submitting request's context; a job is traced on its own
+        trace = metrics.start_trace(f"job:{job.kind}", job_id=job.id) if metrics.tracing_enabled() else metrics.clear_trace()
+        async with self.semaphore:
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                with metrics.span(f"job:{job.kind}"):
+                    await run()
+                job.status = "completed"
+            except asyncio.CancelledError:
+                job.status = "cancelled"
+                raise
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                traceback.print_exc()
+            finally:
+                job.finished_at = time.time()
+                if trace is not None:
+                    trace.attributes["status"] = job.status
+                    await trace.write()
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_history)]:
+            del self.jobs[job_id]
+
+    async def shutdown(self):
+        """
+        Cancel every unfinished job. Hooked into the FastAPI app lifespan.
+        """
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.done]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,275 @@
+# Server-side force-directed layout for trail graphs.
+#
+# The trails page used to run a full d3 force simulation in the browser on
+# every load. Positions are computed here instead, with NumPy, and cached by a
+# hash of the graph's content so repeat loads cost a dictionary lookup. When a
+# graph grows (extend_trail adding nodes), the previous layout is reused and
+# only the new nodes and their close neighbourhood are moved.
+#
+# The forces mirror the frontend's d3 settings: springs along edges, pairwise
+# repulsion capped at a maximum distance, and a pull towards the centre.
+# Repulsion is exact for small graphs; above LAYOUT_EXACT_LIMIT nodes it uses a
+# Barnes-Hut-style grid approximation, where nodes in other cells are felt
+# through their cell's centre of mass.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from graph import bfs_distances
+
+LAYOUT_WIDTH = 1200
+LAYOUT_HEIGHT = 800
+LAYOUT_ITERATIONS = int(os.getenv("LAYOUT_ITERATIONS", "200"))
+LAYOUT_UPDATE_ITERATIONS = int(os.getenv("LAYOUT_UPDATE_ITERATIONS", "80"))
+# Above this many nodes repulsion switches from exact pairs to the grid approximation
+LAYOUT_EXACT_LIMIT = int(os.getenv("LAYOUT_EXACT_LIMIT", "300"))
+# Nodes within this many hops of a new node may move during an incremental update
+LAYOUT_UPDATE_HOPS = 2
+LAYOUT_CACHE_SIZE = int(os.getenv("LAYOUT_CACHE_SIZE", "256"))
+
+LINK_DISTANCE = 100.0
+LINK_STRENGTH = 0.1
+REPULSION = 3000.0
+REPULSION_MIN_DISTANCE = 30.0
+REPULSION_MAX_DISTANCE = 300.0
+CENTER_STRENGTH = 0.01
+
+
+def graph_hash(node_ids: List[str], edges: List[Tuple[str, str]]) -> str:
+    """
+    Content hash of a graph, independent of node and edge order.
+    """
+    digest = hashlib.sha256()
+    for node_id in sorted(node_ids):
+        digest.update(node_id.encode() + b"\0")
+    digest.update(b"\1")
+    for id_a, id_b in sorted(set(edges)):
+        digest.update(f"{id_a}>{id_b}\0".encode())
+    return digest.hexdigest()
+
+
+def repulsion_from(delta: np.ndarray, masses: np.ndarray = None) -> np.ndarray:
+    """
+    Repulsive force for offsets `delta` (..., 2) pointing away from each source,
+    optionally weighted by the sources' masses.
+    """
+    squared = (delta ** 2).sum(axis=-1)
+    strength = REPULSION / np.maximum(squared, REPULSION_MIN_DISTANCE ** 2)
+    # Nothing beyond the cut-off, and coincident points (including each point
+    # with itself) push in no particular direction
+    strength *= (squared <= REPULSION_MAX_DISTANCE ** 2) & (squared > 1e-18)
+    if masses is not None:
+        strength *= masses
+    strength /= np.sqrt(np.maximum(squared, 1e-18))
+    return delta * strength[..., None]
+
+
+def pairwise_repulsion(positions: np.ndarray) -> np.ndarray:
+    """
+    Exact repulsion between every pair of nodes.
+    """
+    return repulsion_from(positions[:, None, :] - positions[None, :, :]).sum(axis=1)
+
+
+def grid_repulsion(positions: np.ndarray) -> np.ndarray:
+    """
+    Barnes-Hut-style approximation on a uniform grid: nodes in a node's own
+    and the 8 surrounding cells repel it exactly, and every farther cell acts
+    as one mass at its centre of mass.
+    """
+    count = len(positions)
+    # About n^(1/2) cells, so both the far field and the exact pairs cost about n^(3/2)
+    side = max(3, int(2 * count ** 0.25))
+    low = positions.min(axis=0)
+    size = np.maximum(positions.max(axis=0) - low, 1e-9)
+    cell_xy = np.minimum((positions - low) / size * side, side - 1).astype(np.int64)
+    cell = cell_xy[:, 0] * side + cell_xy[:, 1]
+
+    masses = np.bincount(cell, minlength=side * side).astype(np.float64)
+    centroids = np.stack([
+        np.bincount(cell, weights=positions[:, axis], minlength=side * side)
+        for axis in range(2)
+    ], axis=1) / np.maximum(masses, 1)[:, None]
+
+    # Node indices grouped by cell: the members of cell c are order[starts[c]:starts[c] + counts[c]]
+    order = np.argsort(cell, kind="stable")
+    counts = masses.astype(np.int64)
+    starts = np.cumsum(counts) - counts
+
+    # Far field from every cell...
+    forces = repulsion_from(positions[:, None, :] - centroids[None, :, :], masses[None, :]).sum(axis=1)
+
+    # ...with the neighbouring cells' approximations swapped for exact pairs
+    sources, neighbours = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            nx, ny = cell_xy[:, 0] + dx, cell_xy[:, 1] + dy
+            valid = np.flatnonzero((nx >= 0) & (nx < side) & (ny >= 0) & (ny < side))
+            sources.append(valid)
+            neighbours.append(nx[valid] * side + ny[valid])
+    sources, neighbours = np.concatenate(sources), np.concatenate(neighbours)
+    forces -= np.stack([
+        np.bincount(sources, weights=axis_force, minlength=count)
+        for axis_force in repulsion_from(positions[sources] - centroids[neighbours], masses[neighbours]).T
+    ], axis=1)
+
+    # Expand (node, neighbouring cell) into one (node, other node) pair per cell member
+    pair_counts = counts[neighbours]
+    first = np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    pair_i = np.repeat(sources, pair_counts)
+    pair_j = order[np.repeat(starts[neighbours], pair_counts) + np.arange(pair_counts.sum()) - first]
+    forces += np.stack([
+        np.bincount(pair_i, weights=axis_force, minlength=count)
+        for axis_force in repulsion_from(positions[pair_i] - positions[pair_j]).T
+    ], axis=1)
+    return forces
+
+
+def force_layout(node_ids: List[str],
+                 edges: List[Tuple[str, str]],
+                 initial: Dict[str, Tuple[float, float]] = None,
+                 movable: set = None,
+                 iterations: int = LAYOUT_ITERATIONS,
+                 seed: int = 0) -> Dict[str, Tuple[float, float]]:
+    """
+    Run a force-directed layout.
+
+    Args:
+        node_ids (List[str]): Nodes to place.
+        edges (List[Tuple[str, str]]): (id_a, id_b) pairs; edges to unknown nodes are ignored.
+        initial (Dict[str, Tuple[float, float]]): Starting positions. Nodes without one start
+            next to their placed neighbours, or on a circle around the centre.
+        movable (set): If given, only these nodes move; the rest stay where `initial` put them.
+        iterations (int): Number of simulation steps.
+        seed (int): Seed for the random jitter, so the same input gives the same layout.
+
+    Returns:
+        Dict[str, Tuple[float, float]]: Node ID to (x, y) within a LAYOUT_WIDTH x LAYOUT_HEIGHT canvas.
+    """
+    count = len(node_ids)
+    if count == 0:
+        return {}
+
+    rng = np.random.default_rng(seed)
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    pairs = np.array([(index[a], index[b]) for a, b in edges if a in index and b in index and a != b], dtype=np.int64).reshape(-1, 2)
+    center = np.array([LAYOUT_WIDTH / 2, LAYOUT_HEIGHT / 2])
+
+    positions = np.zeros((count, 2))
+    placed = np.zeros(count, dtype=bool)
+    for node_id, xy in (initial or {}).items():
+        if node_id in index:
+            positions[index[node_id]] = xy
+            placed[index[node_id]] = True
+
+    # Unplaced nodes start on a circle, like the frontend did, then move next to a placed neighbour
+    angles = 2 * np.pi * np.arange(count) / count
+    radius = min(LAYOUT_WIDTH, LAYOUT_HEIGHT) / 4
+    circle = center + radius * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    positions[~placed] = circle[~placed]
+    for a, b in pairs:
+        for new, anchor in ((b, a), (a, b)):
+            if not placed[new] and placed[anchor]:
+                positions[new] = positions[anchor] + rng.normal(0, LINK_DISTANCE / 3, 2)
+                placed[new] = True
+    positions += rng.normal(0, 1e-3, positions.shape)
+
+    mask = np.ones(count, dtype=bool) if movable is None else np.array([node_id in movable for node_id in node_ids])
+    if not mask.any():
+        return {node_id: (float(x), float(y)) for node_id, (x, y) in zip(node_ids, positions)}
+
+    repulsion = pairwise_repulsion if count <= LAYOUT_EXACT_LIMIT else grid_repulsion
+    max_step = LINK_DISTANCE / 2
+    for step in range(iterations):
+        forces = repulsion(positions)
+
+        if len(pairs):
+            delta = positions[pairs[:, 1]] - positions[pairs[:, 0]]
+            distance = np.maximum(np.sqrt((delta ** 2).sum(axis=1)), 1e-9)
+            spring = (LINK_STRENGTH * (distance - LINK_DISTANCE) / distance)[:, None] * delta
+            np.add.at(forces, pairs[:, 0], spring)
+            np.add.at(forces, pairs[:, 1], -spring)
+
+        forces += CENTER_STRENGTH * (center - positions)
+
+        # Cap how far a node moves per step; the cap cools down linearly
+        temperature = max_step * (1 - step / iterations) + 1.0
+        length = np.maximum(np.sqrt((forces ** 2).sum(axis=1)), 1e-9)
+        forces *= (np.minimum(length, temperature) / length)[:, None]
+        positions[mask] += forces[mask]
+
+    return {node_id: (round(float(x), 1), round(float(y), 1)) for node_id, (x, y) in zip(node_ids, positions)}
+
+
+class LayoutEngine:
+    """
+    Caches layouts per graph key (e.g. a trailhead ID), tagged with the hash of
+    the graph they were computed for.
+
+    Because a grown graph starts from its cached layout, positions depend on
+    what this engine laid out before, not only on the graph: two workers, or
+    one worker before and after an eviction, can place the same graph apart.
+    """
+    def __init__(self, max_entries: int = LAYOUT_CACHE_SIZE):
+        self.max_entries = max_entries
+        # key -> (graph hash, positions)
+        self.layouts: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.updates = 0
+        self.misses = 0
+        # Layouts are computed on worker threads (they are CPU-bound), so guard the cache
+        self.lock = threading.Lock()
+
+    def layout(self, key: str, node_ids: List[str], edges: List[Tuple[str, str]]) -> Dict[str, Tuple[float, float]]:
+        """
+        Positions for the graph stored under `key`. Unchanged graphs come from the
+        cache; a graph that gained nodes keeps its old positions and only the new
+        nodes and their neighbours within LAYOUT_UPDATE_HOPS move.
+        """
+        content_hash = graph_hash(node_ids, edges)
+        seed = int(content_hash[:8], 16)
+        with self.lock:
+            cached = self.layouts.get(key)
+            if cached and cached[0] == content_hash:
+                self.layouts.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+
+        previous = cached[1] if cached else {}
+        new_nodes = [node_id for node_id in node_ids if node_id not in previous]
+        if previous and len(new_nodes) < len(node_ids):
+            self.updates += 1
+            movable = self.neighbourhood(new_nodes, edges)
+            positions = force_layout(node_ids, edges, initial=previous, movable=movable,
+                                     iterations=LAYOUT_UPDATE_ITERATIONS, seed=seed)
+        else:
+            self.misses += 1
+            positions = force_layout(node_ids, edges, seed=seed)
+
+        with self.lock:
+            self.layouts[key] = (content_hash, positions)
+            self.layouts.move_to_end(key)
+            while len(self.layouts) > self.max_entries:
+                self.layouts.popitem(last=False)
+        return positions
+
+    @staticmethod
+    def neighbourhood(node_ids: List[str], edges: List[Tuple[str, str]]) -> set:
+        adjacency = {}
+        for id_a, id_b in edges:
+            adjacency.setdefault(id_a, set()).add(id_b)
+            adjacency.setdefault(id_b, set()).add(id_a)
+
+        nearby = set(node_ids)
+        for node_id in node_ids:
+            nearby.update(bfs_distances(lambda n: adjacency.get(n, ()), node_id, LAYOUT_UPDATE_HOPS))
+        return nearby
+
+
+# Shared by every request in the process
+layout_engine = LayoutEngine()
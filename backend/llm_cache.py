@@ -0,0 +1,214 @@
+# Content-addressed cache for structured LLM responses.
+#
+# Keys are a hash of everything that determines a completion (model, system
+# role, prompt, serialized data and response schema), so byte-identical
+# requests such as onboarding for popular topics are answered locally. There
+# are two tiers: an in-memory LRU and an optional SQLite file that survives
+# restarts and is shared between workers on the same machine. The async
+# interface (get_async / set_async) runs the SQLite tier in a worker thread so
+# it never blocks the event loop; memory hits are answered inline.
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Type
+
+from pydantic import BaseModel
+
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_BYTES = int(os.getenv("LLM_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+LLM_CACHE_DISK_BYTES = int(os.getenv("LLM_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+
+def schema_hash(schema_model: Type[BaseModel]) -> str:
+    schema = json.dumps(schema_model.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(schema.encode()).hexdigest()
+
+
+def make_key(model: str, system_role: str, prompt: str, data: Any, schema_model: Type[BaseModel]) -> str:
+    """
+    Hash every input that determines a structured completion into a cache key.
+    """
+    payload = json.dumps({
+        "model": model,
+        "system_role": system_role,
+        "prompt": prompt,
+        "data": data,
+        "schema": schema_hash(schema_model),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    def __init__(self,
+                 path: str = None,
+                 ttl: float = LLM_CACHE_TTL,
+                 max_memory_bytes: int = LLM_CACHE_MEMORY_BYTES,
+                 max_disk_bytes: int = LLM_CACHE_DISK_BYTES):
+        self.ttl = ttl
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+
+        # key -> (expires_at, value)
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # `lock` guards the memory tier and counters, `db_lock` the SQLite connection,
+        # so a memory lookup never waits behind disk I/O
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self.db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get_memory(key)
+        if value is None and self.db is not None:
+            value = self._get_disk(key)
+        if value is None:
+            self._record_miss()
+        return value
+
+    async def get_async(self, key: str) -> Optional[str]:
+        value = self._get_memory(key)
+        if value is None and self.db is not None:
+            value = await asyncio.to_thread(self._get_disk, key)
+        if value is None:
+            self._record_miss()
+        return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self.lock:
+            self._set_memory(key, value, now + self.ttl)
+        if self.db is not None:
+            self._set_disk(key, value, now)
+
+    async def set_async(self, key: str, value: str):
+        now = time.time()
+        with self.lock:
+            self._set_memory(key, value, now + self.ttl)
+        if self.db is not None:
+            await asyncio.to_thread(self._set_disk, key, value, now)
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                self._evict_memory(key)
+                return None
+            self.memory.move_to_end(key)
+            self.hits += 1
+            self.memory_hits += 1
+            return value
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.db_lock:
+            if self.db is None:
+                return None
+            row = self.db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.db.commit()
+
+        with self.lock:
+            self._set_memory(key, row[0], row[1])
+            self.hits += 1
+            self.disk_hits += 1
+        return row[0]
+
+    def _set_disk(self, key: str, value: str, now: float):
+        with self.db_lock:
+            if self.db is None:
+                return
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode()), now + self.ttl, now),
+            )
+            self._trim_disk(now)
+            self.db.commit()
+
+    def _record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def _set_memory(self, key: str, value: str, expires_at: float):
+        if key in self.memory:
+            self._evict_memory(key)
+        self.memory[key] = (expires_at, value)
+        self.memory_bytes += len(value.encode())
+
+        # Evict least recently used entries until we are back under budget
+        while self.memory_bytes > self.max_memory_bytes and self.memory:
+            self._evict_memory(next(iter(self.memory)))
+
+    def _evict_memory(self, key: str):
+        _, value = self.memory.pop(key)
+        self.memory_bytes -= len(value.encode())
+
+    def _trim_disk(self, now: float):
+        self.db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+
+        # Drop least recently accessed rows until we fit
+        excess = total - self.max_disk_bytes
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall()
+        stale = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+            }
+
+    def close(self):
+        with self.db_lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
@@ -0,0 +1,247 @@
+# Instrumentation for hike generation: Prometheus metrics plus per-request traces.
+#
+# `span("stage", **attributes)` times a block (or, as @traced, a coroutine) and
+# records it in the trailhead_stage_seconds histogram. Upstream LLM calls are
+# recorded separately with their provider, outcome and token usage, and cache
+# lookups are counted as hits or misses per cache. server.py serves all of it
+# on /metrics.
+#
+# When a trace is active (see start_trace), every span is also appended to it
+# with its parent, start offset and attributes, and the trace can be dumped as
+# JSON. Spans opened in tasks spawned from a traced request or job land in the
+# same trace, since asyncio tasks inherit context variables.
+#
+# prometheus_client is optional: without it the metrics are no-ops, and traces
+# still work.
+
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+# Directory that traces are written to. Everything is traced when it is set.
+TRACE_DIR = os.getenv("TRACE_DIR")
+# Whether clients may ask for a trace of one request with `X-Trace: 1`. Off by
+# default, since every trace is a file written to disk.
+TRACE_HEADER_ENABLED = os.getenv("TRACE_HEADER_ENABLED", "").lower() in ("1", "true", "yes")
+# Trace files kept per directory; the oldest are deleted beyond this
+TRACE_MAX_FILES = int(os.getenv("TRACE_MAX_FILES", "1000"))
+
+# Stages range from sub-millisecond cache hits to multi-minute hike builds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320)
+
+
+class NoOpMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+
+if prometheus_client is not None:
+    STAGE_SECONDS = prometheus_client.Histogram(
+        "trailhead_stage_seconds", "Time spent in each stage of hike generation and serving.",
+        ["stage", "outcome"], buckets=LATENCY_BUCKETS)
+    UPSTREAM_SECONDS = prometheus_client.Histogram(
+        "trailhead_upstream_seconds", "Latency of upstream API calls, including retries.",
+        ["provider", "operation", "outcome"], buckets=LATENCY_BUCKETS)
+    UPSTREAM_TOKENS = prometheus_client.Counter(
+        "trailhead_upstream_tokens_total", "Tokens reported by upstream API responses.",
+        ["provider", "operation", "kind"])
+    CACHE_LOOKUPS = prometheus_client.Counter(
+        "trailhead_cache_lookups_total", "Cache lookups by cache and result.",
+        ["cache", "result"])
+    HTTP_SECONDS = prometheus_client.Histogram(
+        "trailhead_http_request_seconds", "Latency of HTTP requests served by the backend.",
+        ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+else:
+    STAGE_SECONDS = UPSTREAM_SECONDS = UPSTREAM_TOKENS = CACHE_LOOKUPS = HTTP_SECONDS = NoOpMetric()
+
+
+class Trace:
+    def __init__(self, name: str, attributes: Dict = None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes or {}
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Dict] = []
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "attributes": self.attributes,
+            "startedAt": self.started_at,
+            "durationSeconds": time.perf_counter() - self.start,
+            "spans": self.spans,
+        }
+
+    def dump(self, directory: str = None) -> str:
+        """
+        Write the trace as JSON into `directory` (TRACE_DIR, or the temp directory
+        if that is not set).
+        """
+        directory = directory or TRACE_DIR or os.path.join(tempfile.gettempdir(), "trailhead-traces")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{int(self.started_at)}-{self.name.replace('/', '_')}-{self.id}.json")
+        with open(path, "w") as fout:
+            json.dump(self.to_dict(), fout, default=str)
+        prune_traces(directory)
+        return path
+
+    async def write(self, directory: str = None) -> str:
+        """
+        dump() in a worker thread, so file I/O stays off the event loop.
+        """
+        return await asyncio.to_thread(self.dump, directory)
+
+
+def prune_traces(directory: str, max_files: int = TRACE_MAX_FILES):
+    """
+    Delete the oldest trace files in `directory` beyond `max_files`.
+    """
+    # Names start with the trace's start time, so they sort oldest first
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    for name in names[:max(0, len(names) - max_files)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # Another worker pruned it first
+            pass
+
+
+_trace = contextvars.ContextVar("trace", default=None)
+_parent_span = contextvars.ContextVar("parent_span", default=None)
+
+
+def tracing_enabled() -> bool:
+    return TRACE_DIR is not None
+
+
+def trace_requested(headers) -> bool:
+    """
+    Whether an HTTP request asked to be traced, and is allowed to.
+    """
+    return TRACE_HEADER_ENABLED and headers.get("x-trace") == "1"
+
+
+def start_trace(name: str, **attributes) -> Trace:
+    """
+    Make a new trace current for this context and the tasks it spawns.
+    """
+    trace = Trace(name, attributes)
+    _trace.set(trace)
+    _parent_span.set(None)
+    return trace
+
+
+def clear_trace():
+    _trace.set(None)
+    _parent_span.set(None)
+
+
+def current_trace() -> Trace:
+    return _trace.get()
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Time a block as a stage. Yields a dict that the block can add attributes to.
+    """
+    trace = _trace.get()
+    span_id = uuid.uuid4().hex[:16]
+    token = _parent_span.set(span_id) if trace is not None else None
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield attributes
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=stage, outcome=outcome).observe(duration)
+        if trace is not None:
+            _parent_span.reset(token)
+            trace.spans.append({
+                "id": span_id,
+                "parent": _parent_span.get(),
+                "stage": stage,
+                "offsetSeconds": start - trace.start,
+                "durationSeconds": duration,
+                "outcome": outcome,
+                **attributes,
+            })
+
+
+def traced(stage: str):
+    """
+    Decorator form of span() for coroutine functions.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(stage):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_upstream(provider: str, operation: str, outcome: str, seconds: float, usage=None, **attributes):
+    """
+    Record one upstream call, with its token usage if the response reported any.
+    """
+    UPSTREAM_SECONDS.labels(provider=provider, operation=operation, outcome=outcome).observe(seconds)
+
+    tokens = {}
+    for kind in ("prompt_tokens", "completion_tokens"):
+        count = getattr(usage, kind, None)
+        if count:
+            tokens[kind] = count
+            UPSTREAM_TOKENS.labels(provider=provider, operation=operation, kind=kind.split("_")[0]).inc(count)
+
+    trace = _trace.get()
+    if trace is not None:
+        trace.spans.append({
+            "id": uuid.uuid4().hex[:16],
+            "parent": _parent_span.get(),
+            "stage": f"upstream:{provider}:{operation}",
+            "offsetSeconds": time.perf_counter() - seconds - trace.start,
+            "durationSeconds": seconds,
+            "outcome": outcome,
+            **tokens,
+            **attributes,
+        })
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache=cache, result="hit" if hit else "miss").inc()
+    trace = _trace.get()
+    if trace is not None:
+        trace.attributes.setdefault("cache", {}).setdefault(cache, {"hit": 0, "miss": 0})["hit" if hit else "miss"] += 1
+
+
+def latest() -> tuple:
+    """
+    The Prometheus exposition body and its content type.
+    """
+    if prometheus_client is None:
+        return b"# prometheus_client is not installed\n", "text/plain; charset=utf-8"
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
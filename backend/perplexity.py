@@ -1,19 +1,45 @@
 from typing import Type, Any, Dict
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from resilience import UpstreamCaller
+
+PERPLEXITY_BASE_URL = "https://api.perplexity.ai"
+DEFAULT_SYSTEM_ROLE = "You are working to help find online resources to learn more about a topic"
 
 class AnswerFormat(BaseModel):
     content_links: str
 
+
+def build_prompt_request(prompt: str, schema_model: Type[BaseModel], system_role: str) -> Dict:
+    """
+    Build the keyword arguments for a Perplexity chat completion.
+    Shared by the sync and async interfaces so both send identical requests.
+    """
+    # Generate the JSON schema from the Pydantic model
+    json_schema = schema_model.schema()
+    json_schema_with_name = {"name": schema_model.__name__, "schema": json_schema}
+
+    return {
+        "messages": [
+            {"role": "system", "content": system_role},
+            {"role": "user", "content": f"Ask: {prompt}"}
+        ],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": json_schema_with_name
+        },
+    }
+
+
 class PerplexityInterface:
     def __init__(self, api_key: str = None, model: str = "sonar"):
-        self.client = OpenAI(api_key=api_key, base_url="https://api.perplexity.ai")
+        self.client = OpenAI(api_key=api_key, base_url=PERPLEXITY_BASE_URL)
         self.model = model
 
     def run_prompt(self, 
                    prompt: str,
                    schema_model: Type[BaseModel], 
-                   system_role: str = "You are working to help find online resources to learn more about a topic",
+                   system_role: str = DEFAULT_SYSTEM_ROLE,
                    ) -> BaseModel:
         """
         Run a Perplexity prompt with a specified schema model and return parsed results.
@@ -26,22 +52,48 @@ class PerplexityInterface:
         Returns:
             BaseModel: Parsed results as per the schema model.
         """
-        # Generate the JSON schema from the Pydantic model
-        json_schema = schema_model.schema()
-        json_schema_with_name = {"name": schema_model.__name__, "schema": json_schema}
-
         # Send the request to Perplexity
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "system", "content": system_role},
-                {"role": "user", "content": f"Ask: {prompt}"}
-            ],
-            response_format={
-                "type": "json_schema",
-                "json_schema": json_schema_with_name
-            }
+            **build_prompt_request(prompt, schema_model, system_role)
         )
 
         # Parse and return the response
         return response.choices[0].message.content
+
+
+class AsyncPerplexityInterface:
+    """
+    Async counterpart of PerplexityInterface.
+    """
+    def __init__(self, api_key: str = None, model: str = "sonar", http_client=None, caller: UpstreamCaller = None):
+        # With a caller, retries are its job; the SDK's own retries would multiply them
+        self.client = AsyncOpenAI(api_key=api_key, base_url=PERPLEXITY_BASE_URL, http_client=http_client,
+                                  **({"max_retries": 0} if caller else {}))
+        self.model = model
+        self.caller = caller
+
+    async def run_prompt(self, 
+                         prompt: str,
+                         schema_model: Type[BaseModel], 
+                         system_role: str = DEFAULT_SYSTEM_ROLE,
+                         ) -> BaseModel:
+        """
+        Run a Perplexity prompt with a specified schema model and return parsed results.
+
+        Args:
+            prompt (str): The prompt to guide the Perplexity response.
+            schema_model (Type[BaseModel]): Pydantic model to parse the response.
+            system_role (str): Role of the Perplexity assistant.
+
+        Returns:
+            BaseModel: Parsed results as per the schema model.
+        """
+        def request():
+            return self.client.chat.completions.create(
+                model=self.model,
+                **build_prompt_request(prompt, schema_model, system_role)
+            )
+
+        response = await (self.caller.call(request) if self.caller else request())
+        return response.choices[0].message.content
@@ -0,0 +1,236 @@
+# Shared call layer for upstream LLM requests.
+#
+# A single bare chat.completions.create call can hang a hike build for minutes
+# or kill it halfway. UpstreamCaller wraps each request with:
+#   - an overall deadline, and a timeout per attempt,
+#   - jittered exponential retries on errors worth retrying (timeouts,
+#     connection errors, 408/409/429 and 5xx responses),
+#   - an optional hedged second request once an attempt has run longer than
+#     the provider's recent p95 latency, keeping whichever answers first,
+#   - a circuit breaker per provider, so a provider that keeps failing is
+#     skipped for a while instead of being waited on by every request.
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict
+
+import httpx
+import openai
+
+import metrics
+
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "120"))
+UPSTREAM_ATTEMPT_TIMEOUT = float(os.getenv("UPSTREAM_ATTEMPT_TIMEOUT", "60"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.5"))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "8"))
+# Hedging sends duplicate (billed) requests, so it is opt-in
+UPSTREAM_HEDGE = os.getenv("UPSTREAM_HEDGE", "").lower() in ("1", "true", "yes")
+# Latency samples needed before the p95 is trusted as a hedge delay
+UPSTREAM_HEDGE_MIN_SAMPLES = 20
+UPSTREAM_LATENCY_WINDOW = 200
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive retryable failures. While open,
+    calls fail fast; after `reset_timeout` one trial call is let through, which
+    closes the breaker again if it succeeds.
+    """
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half-open" and self.trial_in_flight):
+            raise CircuitOpenError(f"Circuit for {self.name} is open after {self.failures} failures")
+        if state == "half-open":
+            self.trial_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def release_trial(self):
+        """
+        End a call that says nothing about the provider's health, e.g. a
+        rejected request, leaving the failure count and state as they were.
+        A half-open breaker lets the next call through as its trial.
+        """
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # A failed trial call re-opens the breaker for another reset_timeout
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    def __init__(self, window: int = UPSTREAM_LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class UpstreamCaller:
+    def __init__(self,
+                 breaker: CircuitBreaker,
+                 deadline: float = UPSTREAM_DEADLINE,
+                 attempt_timeout: float = UPSTREAM_ATTEMPT_TIMEOUT,
+                 max_retries: int = UPSTREAM_MAX_RETRIES,
+                 base_delay: float = UPSTREAM_RETRY_BASE_DELAY,
+                 max_delay: float = UPSTREAM_RETRY_MAX_DELAY,
+                 hedge: bool = UPSTREAM_HEDGE):
+        self.breaker = breaker
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.latency = LatencyTracker()
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+
+    def hedge_delay(self):
+        if not self.hedge or len(self.latency.samples) < UPSTREAM_HEDGE_MIN_SAMPLES:
+            return None
+        return self.latency.percentile(0.95)
+
+    async def attempt(self, request: Callable[[], Awaitable]):
+        """
+        One attempt, plus a hedged duplicate if the first runs past the p95.
+        """
+        delay = self.hedge_delay()
+        tasks = [asyncio.ensure_future(request())]
+        try:
+            if delay is None:
+                return await tasks[0]
+
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.stats["hedges"] += 1
+                tasks.append(asyncio.ensure_future(request()))
+
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    if succeeded[0] is not tasks[0]:
+                        self.stats["hedge_wins"] += 1
+                    return succeeded[0].result()
+                # An error only counts once both requests have failed
+                if not pending:
+                    return done.pop().result()
+        finally:
+            # Whichever request lost (or everything, if we were cancelled) is abandoned
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(self, request: Callable[[], Awaitable], operation: str = "chat"):
+        """
+        Run `request` (a function returning a fresh awaitable) under the deadline,
+        retry, hedging and circuit-breaker policy. The call is recorded in the
+        upstream metrics under the breaker's provider name and `operation`.
+
+        Raises:
+            CircuitOpenError: If the provider's breaker is open.
+            asyncio.TimeoutError: If the overall deadline passes.
+            Exception: The last error, once it is not retryable or retries run out.
+        """
+        self.stats["calls"] += 1
+        started = time.monotonic()
+        deadline = started + self.deadline
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                metrics.record_upstream(self.breaker.name, operation, "circuit_open", time.monotonic() - started)
+                raise
+            remaining = deadline - time.monotonic()
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(self.attempt(request), timeout=min(self.attempt_timeout, remaining))
+            except asyncio.CancelledError:
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # The provider answered, but a rejected request is no proof that it is healthy
+                    self.breaker.release_trial()
+                    metrics.record_upstream(self.breaker.name, operation, "error", time.monotonic() - started, retries=attempt)
+                    raise
+                self.breaker.record_failure()
+
+                # Full jitter, and never sleep past the deadline
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if attempt == self.max_retries or time.monotonic() + backoff >= deadline:
+                    self.stats["failures"] += 1
+                    metrics.record_upstream(self.breaker.name, operation, "timeout" if isinstance(e, asyncio.TimeoutError) else "error",
+                                            time.monotonic() - started, retries=attempt)
+                    raise
+                self.stats["retries"] += 1
+                print(f"Retrying {self.breaker.name} call after {type(e).__name__} (attempt {attempt + 1})")
+                await asyncio.sleep(backoff)
+                continue
+
+            self.breaker.record_success()
+            self.latency.record(time.monotonic() - start)
+            metrics.record_upstream(self.breaker.name, operation, "ok", time.monotonic() - started,
+                                    usage=getattr(result, "usage", None), retries=attempt)
+            return result
+
+
+# One breaker per provider, shared by every model and client of that provider
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    if provider not in _breakers:
+        _breakers[provider] = CircuitBreaker(provider)
+    return _breakers[provider]
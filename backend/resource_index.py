@@ -0,0 +1,163 @@
+# In-memory lookup index over existing rows of the `resources` table.
+#
+# Hike.generate_node checks this before paying for a Perplexity search, so a
+# topic that some other hike already produced (same normalized title,
+# compatible resource type and difficulty) is linked instead of regenerated.
+# The index is loaded from Supabase in the background at startup, refreshed in
+# the background once stale, and kept warm by adding every resource the backend
+# creates. Requests never wait for a load: until the first one finishes,
+# lookups simply miss. Only the columns lookup filters on are kept in memory;
+# a match's description is fetched by the caller.
+
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+import metrics
+
+RESOURCE_INDEX_REFRESH = float(os.getenv("RESOURCE_INDEX_REFRESH", "600"))
+RESOURCE_INDEX_PAGE_SIZE = 1000
+RESOURCE_INDEX_COLUMNS = ("id", "title", "resource_type", "difficulty")
+
+# Preferred difficulty labels from onboarding mapped onto the 0-1 difficulty scale
+DIFFICULTY_TARGETS = {
+    "light": 0.3,
+    "easy": 0.3,
+    "medium": 0.5,
+    "heavy": 0.7,
+    "hard": 0.7,
+}
+DIFFICULTY_TOLERANCE = 0.25
+
+
+def normalize_title(title: str) -> str:
+    title = re.sub(r"[^\w\s]", " ", (title or "").lower())
+    return " ".join(title.split())
+
+
+def normalize_types(resource_type) -> set:
+    if not resource_type:
+        return set()
+    if isinstance(resource_type, str):
+        resource_type = [resource_type]
+    return {str(t).strip().lower() for t in resource_type if t}
+
+
+def compatible(row: dict, resource_type=None, preferred_difficulty: str = None) -> bool:
+    """
+    Whether an existing resource suits a hike with these preferences: it was
+    generated for a hike, its resource types overlap the preferred ones, and
+    its difficulty is within DIFFICULTY_TOLERANCE of the preferred label's target.
+    """
+    # Only generate_node scores difficulty; trailheads and seed articles have none
+    difficulty = row.get("difficulty")
+    if difficulty is None:
+        return False
+
+    wanted_types = normalize_types(resource_type)
+    row_types = normalize_types(row.get("resource_type"))
+    if wanted_types and row_types and not wanted_types & row_types:
+        return False
+
+    target = DIFFICULTY_TARGETS.get((preferred_difficulty or "").strip().lower())
+    if target is not None and abs(difficulty - target) > DIFFICULTY_TOLERANCE:
+        return False
+    return True
+
+
+class ResourceIndex:
+    def __init__(self, refresh_interval: float = RESOURCE_INDEX_REFRESH):
+        self.refresh_interval = refresh_interval
+        # normalized title -> resource rows with that title
+        self.by_title: Dict[str, List[dict]] = {}
+        self.loaded_at = None
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.added_during_load: List[dict] = []
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def stale(self) -> bool:
+        return self.loaded_at is None or time.time() - self.loaded_at > self.refresh_interval
+
+    def refresh(self, db) -> Optional[asyncio.Task]:
+        """
+        Start reloading the index in the background if it is stale. Never waits
+        for the load; lookups keep using the current index until it finishes.
+        """
+        if self.stale and (self.refresh_task is None or self.refresh_task.done()):
+            self.refresh_task = asyncio.create_task(self.load(db))
+            self.refresh_task.add_done_callback(report_refresh_error)
+        return self.refresh_task
+
+    async def load(self, db):
+        """
+        Page through the resources table and rebuild the index.
+        """
+        by_title = {}
+        start = 0
+        while True:
+            response = await db.from_("resources") \
+                .select(", ".join(RESOURCE_INDEX_COLUMNS)) \
+                .order("id") \
+                .range(start, start + RESOURCE_INDEX_PAGE_SIZE - 1) \
+                .execute()
+            rows = response.data or []
+            for row in rows:
+                by_title.setdefault(normalize_title(row.get("title")), []).append(row)
+
+            if len(rows) < RESOURCE_INDEX_PAGE_SIZE:
+                break
+            start += RESOURCE_INDEX_PAGE_SIZE
+
+        # Resources added while we paged may have landed behind the page we were on
+        added, self.added_during_load = self.added_during_load, []
+        self.by_title = by_title
+        for row in added:
+            self.add(row)
+        self.loaded_at = time.time()
+
+    def add(self, row: dict):
+        row = {column: row.get(column) for column in RESOURCE_INDEX_COLUMNS}
+        if self.refresh_task is not None and not self.refresh_task.done():
+            self.added_during_load.append(row)
+        rows = self.by_title.setdefault(normalize_title(row["title"]), [])
+        if not any(existing.get("id") == row["id"] for existing in rows):
+            rows.append(row)
+
+    def lookup(self, title: str, resource_type=None, preferred_difficulty: str = None) -> Optional[dict]:
+        """
+        Find an existing resource with the same normalized title that is
+        compatible with the requested resource type and difficulty.
+
+        Args:
+            title (str): Title of the topic about to be generated.
+            resource_type: Preferred media type(s) of the hike.
+            preferred_difficulty (str): Onboarding difficulty label, e.g. "medium".
+
+        Returns:
+            Optional[dict]: The matching resource's RESOURCE_INDEX_COLUMNS, or None.
+        """
+        for row in self.by_title.get(normalize_title(title), []):
+            if not compatible(row, resource_type, preferred_difficulty):
+                continue
+
+            self.hits += 1
+            metrics.record_cache("resource_index", True)
+            return row
+
+        self.misses += 1
+        metrics.record_cache("resource_index", False)
+        return None
+
+
+def report_refresh_error(task: asyncio.Task):
+    # The next stale access starts another refresh, so a failure is only logged
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Resource index refresh failed: {task.exception()}")
+
+
+# Shared by every Hike in the process so the index stays warm between requests
+resource_index = ResourceIndex()
@@ -1,55 +1,483 @@
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 
 from dotenv import load_dotenv
 
 load_dotenv()
 from pydantic import BaseModel
-from typing import List
+from typing import List, Tuple
 
-from gpt import GPTInterface
 from hike import Hike
+from jobs import JobManager
+from expansion import TrailNotFound, trail_expander
+from hike_cache import hike_cache
+from sessions import Session, session_store
+from layout import layout_engine
+from resource_index import resource_index
+import clients
+import metrics
+import asyncio
+import hashlib
+import json
 import os
+import time
 
 load_dotenv()
 # Load API key from environment variables instead of hardcoding
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-app = FastAPI()
+# Hike generation runs here so the final chat turn can return immediately
+jobs = JobManager()
+
+async def warm_indexes():
+    """
+    Start loading the resource and vector indexes in the background, so the
+    first hike build does not run with cold ones for longer than necessary.
+    """
+    try:
+        db = await clients.get_db()
+        resource_index.refresh(db)
+        clients.get_vector_index().refresh(db)
+    except Exception as e:
+        print(f"Could not start loading the resource indexes: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_indexes()
+    yield
+    await jobs.shutdown()
+    await trail_expander.shutdown()
+    session_store.close()
+    # Release pooled upstream connections on shutdown
+    await clients.close_clients()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    """
+    Time every request by route template, and trace it when TRACE_DIR is set or
+    the client sent `X-Trace: 1` (if TRACE_HEADER_ENABLED allows that). The
+    trace is written out as JSON and its ID returned in the X-Trace-Id header.
+    Streaming responses are timed up to their first byte; background jobs they
+    start are traced separately.
+    """
+    trace = None
+    if request.url.path != "/metrics" and (metrics.tracing_enabled() or metrics.trace_requested(request.headers)):
+        trace = metrics.start_trace(f"{request.method} {request.url.path}")
+
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_SECONDS.labels(
+            method=request.method,
+            # Templates rather than raw paths, so IDs do not become label values
+            route=route.path if route is not None else "unmatched",
+            status=str(status),
+        ).observe(time.perf_counter() - start)
+        if trace is not None:
+            trace.attributes["status"] = status
+            await trace.write()
+
+    if trace is not None:
+        response.headers["X-Trace-Id"] = trace.id
+    return response
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    body, content_type = metrics.latest()
+    return Response(content=body, media_type=content_type)
+
 @app.post("/api/chat")
 async def chat(request: Request):
-    chat_history = await request.json()
+    """
+    One onboarding turn. Send {"session_id", "message"} with only the newest
+    message (no session_id on the first turn; the reply carries `sessionId`).
+    Clients that send the whole transcript as a list are still supported.
+    """
+    body = await request.json()
+    # Clients that accept Server-Sent Events get onboarding replies token by token
+    stream = "text/event-stream" in request.headers.get("accept", "")
+
+    if isinstance(body, dict):
+        return await session_chat(body, stream)
+
+    chat_history = body
+    if not is_transcript(chat_history):
+        raise HTTPException(status_code=400, detail="Expected {session_id, message} or a list of chat messages")
+
+    if stream:
+        return sse_response(stream_chat(
+            onboarding_step(chat_history),
+            lambda: generate_query_from_transcript(chat_history),
+        ))
     
     if len(chat_history) <= 1:
-        return generate_prereqs(chat_history[0]['content'])
+        return await generate_prereqs(chat_history[0]['content'])
 
     if len(chat_history) <= 3:
-        return get_learning_goal(chat_history)
+        return await get_learning_goal(chat_history)
 
     if len(chat_history) <= 5:
-        return gather_additional_info(chat_history)
+        return await gather_additional_info(chat_history)
 
     # Submit the final request
-    return generate_query_from_transcript(chat_history)
+    return await generate_query_from_transcript(chat_history)
+
+def is_transcript(chat_history) -> bool:
+    return isinstance(chat_history, list) and len(chat_history) > 0 and all(
+        isinstance(message, dict) and isinstance(message.get("content"), str) for message in chat_history
+    )
 
-def generate_prereqs(data):
+async def session_chat(body: dict, stream: bool):
+    message = body.get("message")
+    if not isinstance(message, str) or not message.strip():
+        raise HTTPException(status_code=400, detail="Expected a non-empty message")
+
+    session_id = body.get("session_id")
+    if session_id:
+        session = await session_store.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+    else:
+        session = session_store.create()
+    extra = {"sessionId": session.id}
+
+    # The hike was already submitted; a retried last turn gets the same answer
+    if session.result is not None:
+        if stream:
+            async def stored_result():
+                return session.result
+            return sse_response(stream_chat(None, stored_result, extra))
+        return {**session.result, **extra}
+
+    # Only stored once the turn succeeds, so a failed turn can simply be retried
+    turn = session.with_message(message.strip())
+
+    async def finish():
+        # Only one request per session builds the hike, whichever worker it reaches
+        if not await session_store.claim(turn.id):
+            raise HTTPException(status_code=409, detail="This session's hike is already being built")
+        try:
+            # A retry that waited for the claim gets the hike the other request built
+            current = await session_store.get(turn.id)
+            if current is not None and current.result is not None:
+                return current.result
+            turn.result = await generate_query_from_transcript(turn.summary())
+            await session_store.save(turn)
+            return turn.result
+        finally:
+            await session_store.release(turn.id)
+
+    async def on_reply(content: str):
+        turn.record_reply(content)
+        await session_store.save(turn)
+
+    step = session_step(turn)
+    if stream:
+        return sse_response(stream_chat(step, finish, extra, on_reply))
+    if step is None:
+        return {**await finish(), **extra}
+
+    prompt, data = step
+    reply = await onboarding_reply(prompt, data)
+    await on_reply(reply.content)
+    return {**reply.model_dump(), **extra}
+
+def onboarding_step(chat_history):
     """
-    Determine what user wants to learn. Generate up to 5 prerequisites for the particular skill.
+    Pick the prompt and data for the current onboarding turn.
+    Returns None once the transcript is complete and the hike should be built.
     """
-    class Output(BaseModel):
-        content: str
-        role: str = "assistant"
+    if len(chat_history) <= 1:
+        return prereqs_prompt(chat_history[0]['content']), chat_history[0]['content']
+
+    if len(chat_history) <= 3:
+        return LEARNING_GOAL_PROMPT, chat_history
+
+    if len(chat_history) <= 5:
+        return ADDITIONAL_INFO_PROMPT, chat_history
+
+    return None
+
+def session_step(session: Session):
+    """
+    Same as onboarding_step, for a session that has just been given its newest
+    message. Prompts get the session's state summary instead of a transcript.
+    """
+    if session.last_field == "topic":
+        return prereqs_prompt(session.state["topic"]), session.state["topic"]
+
+    if session.last_field == "known_prereqs":
+        return LEARNING_GOAL_PROMPT, session.summary()
+
+    if session.last_field == "objective":
+        return ADDITIONAL_INFO_PROMPT, session.summary()
+
+    return None
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def stream_chat(step, finish, extra: dict = None, on_reply=None):
+    """
+    Stream one chat turn as Server-Sent Events: a `token` event per chunk of
+    the reply, then a `done` event carrying the same message the JSON endpoint
+    would have returned. The final turn (`step` is None) has nothing to stream,
+    so it only sends `done` with the result of `finish()`.
+    """
+    extra = extra or {}
+    try:
+        if step is None:
+            yield sse_event("done", {**await finish(), **extra})
+            return
+
+        prompt, data = step
+        content = ""
+        async for token in clients.get_gpt().stream_prompt(prompt=prompt, data=data):
+            content += token
+            yield sse_event("token", {"content": token})
+
+        if on_reply is not None:
+            await on_reply(content)
+        yield sse_event("done", {"content": content, "role": "assistant", **extra})
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    """
+    Poll a background job. For hike generation the job ID is the trailhead ID,
+    and progress lists the trails and nodes finished so far.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+# Resource fields sent per graph node; descriptions are fetched lazily from /api/resources/{id}
+GRAPH_NODE_COLUMNS = "id, title, image_url"
+GRAPH_PAGE_LIMIT = 100
+
+def json_body(payload) -> bytes:
+    return json.dumps(payload, separators=(",", ":"), sort_keys=True).encode()
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_headers(etag: str) -> dict:
+    # no-cache lets browsers keep the response but makes them revalidate it every time
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def etag_matches(request: Request, etag: str) -> bool:
+    client_etags = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    return etag in client_etags or "*" in client_etags
+
+def etag_response(request: Request, payload, etag: str = None) -> Response:
+    """
+    JSON response tagged with `etag`, by default a hash of its body. Answers 304
+    with no body if the client already holds this version (If-None-Match).
+    """
+    body = json_body(payload)
+    etag = etag or make_etag(body)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=etag_headers(etag))
+    return Response(body, media_type="application/json", headers=etag_headers(etag))
+
+async def page_trailheads(db, limit: int, offset: int) -> Tuple[List[dict], int]:
+    """
+    One page of trailheads ({"id", "title"}, by ID) and how many there are.
+    A trailhead is a resource that trails point at, so an inner join on trails
+    pages distinct trailheads in the database, whatever the size of the tables.
+    """
+    response = await db.from_("resources") \
+        .select("id, title, trails!inner(trailhead_id)", count="exact") \
+        .limit(1, foreign_table="trails") \
+        .order("id") \
+        .range(offset, offset + limit - 1) \
+        .execute()
+    page = [{"id": row["id"], "title": row["title"]} for row in response.data or []]
+    return page, response.count or 0
+
+async def load_hike_graph(trailhead_id: str) -> Hike:
+    """
+    The hike's graph, or None if there is no such trailhead. Comes from the
+    hike cache unless the hike is still being built; then the database has
+    the newest partial graph.
+    """
+    job = jobs.get(trailhead_id)
+    if job is None or job.done:
+        return await hike_cache.get(trailhead_id)
+
+    hike = Hike(*await Hike.create_clients())
+    hike.trailhead_id = trailhead_id
+    await hike.get_trails(columns=GRAPH_NODE_COLUMNS)
+    return hike
+
+def graph_payload(hikes: List[Hike]) -> dict:
+    """
+    Compact graph of one or more hikes: node summaries without descriptions,
+    and edges as [id_a, id_b, trail index] triples.
+    """
+    trailhead_ids = {hike.trailhead_id for hike in hikes}
+    nodes, trails, edges = {}, [], []
+
+    for hike in hikes:
+        for node in hike.nodes.values():
+            nodes[node.id] = {
+                "id": node.id,
+                "title": node.title,
+                "trailhead": node.id in trailhead_ids,
+                "hasImage": bool(node.image_url),
+            }
+        for trail in hike.trails:
+            trails.append({"id": trail.trail_id, "title": trail.title, "trailheadId": hike.trailhead_id})
+            edges += [[id_a, id_b, len(trails) - 1] for id_a in trail.edges for id_b in trail.get_children(id_a)]
+
+    # Sorted so the same graph always serializes (and hashes) the same way
+    return {
+        "trails": trails,
+        "nodes": sorted(nodes.values(), key=lambda node: node["id"]),
+        "edges": sorted(edges),
+    }
 
-    gpt_interface = GPTInterface(api_key=os.getenv("OPENAI_KEY"))
-    prompt = f"""
+async def with_layout(key: str, payload: dict) -> dict:
+    """
+    Add precomputed x/y positions to the nodes of a graph payload.
+    """
+    node_ids = [node["id"] for node in payload["nodes"]]
+    edges = [(id_a, id_b) for id_a, id_b, _ in payload["edges"]]
+    # The layout is CPU-bound, so keep it off the event loop
+    positions = await asyncio.to_thread(layout_engine.layout, key, node_ids, edges)
+    for node in payload["nodes"]:
+        node["x"], node["y"] = positions[node["id"]]
+    return payload
+
+async def graph_response(request: Request, key: str, payload: dict) -> Response:
+    """
+    etag_response for a graph payload, with positions laid out under `key`.
+
+    Positions depend on which layouts this worker has cached, not only on the
+    graph, so the ETag covers the graph alone. A client that already holds the
+    graph gets a 304 before any layout is computed.
+    """
+    etag = make_etag(json_body(payload))
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=etag_headers(etag))
+    return etag_response(request, await with_layout(key, payload), etag)
+
+@app.get("/api/trailheads")
+async def trailheads(request: Request, limit: int = 20, offset: int = 0):
+    """
+    Page through every trailhead, with its title.
+    """
+    limit = max(1, min(limit, GRAPH_PAGE_LIMIT))
+    offset = max(0, offset)
+    page, total = await page_trailheads(await clients.get_db(), limit, offset)
+
+    return etag_response(request, {
+        "trailheads": page,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+    })
+
+@app.get("/api/trailheads/{trailhead_id}/graph")
+async def trailhead_graph(request: Request, trailhead_id: str):
+    hike = await load_hike_graph(trailhead_id)
+    if hike is None or trailhead_id not in hike.nodes:
+        raise HTTPException(status_code=404, detail="Trailhead not found")
+    return await graph_response(request, trailhead_id, {"trailheadId": trailhead_id, **graph_payload([hike])})
+
+@app.get("/api/graph")
+async def combined_graph(request: Request, trailhead_ids: str = None, limit: int = 20, offset: int = 0):
+    """
+    Merged graph of several trailheads: the comma-separated `trailhead_ids`,
+    or else one page of all trailheads.
+    """
+    limit = max(1, min(limit, GRAPH_PAGE_LIMIT))
+    offset = max(0, offset)
+    if trailhead_ids:
+        selected = list(dict.fromkeys(filter(None, trailhead_ids.split(","))))
+        total = len(selected)
+        selected = selected[offset:offset + limit]
+    else:
+        page, total = await page_trailheads(await clients.get_db(), limit, offset)
+        selected = [trailhead["id"] for trailhead in page]
+
+    hikes = await asyncio.gather(*(load_hike_graph(trailhead_id) for trailhead_id in selected))
+    hikes = [hike for hike in hikes if hike is not None]
+    return await graph_response(request, "graph:" + ",".join(selected), {
+        "trailheadIds": selected,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        **graph_payload(hikes),
+    })
+
+@app.post("/api/trails/{trail_id}/nodes/{node_id}/expand")
+async def expand_node(trail_id: str, node_id: str):
+    """
+    Grow a trail below a node the user opened: generate the node's children if
+    it has none yet, and start expanding the likeliest next ones in the background.
+    """
+    try:
+        return await trail_expander.expand(trail_id, node_id)
+    except TrailNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/api/resources/{resource_id}")
+async def resource(request: Request, resource_id: str):
+    """
+    Full resource row, including the description left out of graph payloads.
+    """
+    db = await clients.get_db()
+    response = await db.from_("resources").select("*").eq("id", resource_id).execute()
+    if not response.data:
+        raise HTTPException(status_code=404, detail="Resource not found")
+    return etag_response(request, response.data[0])
+
+@app.get("/api/resources/{resource_id}/similar")
+async def similar_resources(resource_id: str, k: int = 10):
+    """
+    Resources whose title and description are closest to this one, most similar first.
+    """
+    index = clients.get_vector_index()
+    index.refresh(await clients.get_db())
+    if not index.ready:
+        raise HTTPException(status_code=503, detail="The similarity index is still being built", headers={"Retry-After": "60"})
+    if resource_id not in index:
+        raise HTTPException(status_code=404, detail="Resource not found")
+
+    k = max(1, min(k, 100))
+    return {
+        "resourceId": resource_id,
+        "similar": [{**row, "score": score} for row, score in index.similar(resource_id, k)],
+    }
+
+def prereqs_prompt(data):
+    return f"""
     The user wants to learn about: {data}.
     Generate a list of up to 5 of the most important prerequisites for this particular skill.
     e.g. "Which of the following prereqs are you familiar with?
@@ -62,65 +490,60 @@ def generate_prereqs(data):
         Use no more than five words per line.
     You should use markdown and a numbered list.
     """.strip()
-    response = gpt_interface.run_prompt(
-        prompt=prompt,
-        data=data,
-        schema_model=Output,
-    )
-
-    return response
 
-
-def get_learning_goal(data):
-    """
-    Obtaining user's overall learning goal.
-    """
-    class Output(BaseModel):
-        content: str
-        role: str = "assistant"
-
-    gpt_interface = GPTInterface(api_key=os.getenv("OPENAI_KEY"))
-    prompt = """
-    You are given the chat transcript of a user who wants to learn something.
+LEARNING_GOAL_PROMPT = """
+    You are given what a user who wants to learn something has told you so far,
+        as a chat transcript or a summary of it.
     Now, ask why they want to learn about this subject or what their main objective is.
         You may choose the wording depending on the user's topic.
     Be very concise. You may use markdown.
     """.strip()
-    response = gpt_interface.run_prompt(
-        prompt=prompt,
-        data=data,
-        schema_model=Output,
-    )
 
-    return response
-
-
-def gather_additional_info(data):
-    """
-    Extracting additional info from user.
-    """
-    class Output(BaseModel):
-        content: str
-        role: str = "assistant"
-
-    gpt_interface = GPTInterface(api_key=os.getenv("OPENAI_KEY"))
-    prompt = """
-    You are given the chat transcript of a user who wants to learn something.
+ADDITIONAL_INFO_PROMPT = """
+    You are given what a user who wants to learn something has told you so far,
+        as a chat transcript or a summary of it.
     Now, ask for any additional information the user wants to give. Ask for:
         - preferred media type? (websites, videos, books, podcasts, etc.))
         - preferred intensity? (light, medium, heavy)
     Be very concise. You should use markdown for lists but NOT to bold.
     """.strip()
-    response = gpt_interface.run_prompt(
+
+class OnboardingReply(BaseModel):
+    content: str
+    role: str = "assistant"
+
+
+async def onboarding_reply(prompt: str, data) -> OnboardingReply:
+    gpt_interface = clients.get_gpt()
+    return await gpt_interface.run_prompt(
         prompt=prompt,
         data=data,
-        schema_model=Output,
+        schema_model=OnboardingReply,
     )
 
-    return response
 
+async def generate_prereqs(data):
+    """
+    Determine what user wants to learn. Generate up to 5 prerequisites for the particular skill.
+    """
+    return await onboarding_reply(prereqs_prompt(data), data)
+
+
+async def get_learning_goal(data):
+    """
+    Obtaining user's overall learning goal.
+    """
+    return await onboarding_reply(LEARNING_GOAL_PROMPT, data)
 
-def generate_query_from_transcript(data):
+
+async def gather_additional_info(data):
+    """
+    Extracting additional info from user.
+    """
+    return await onboarding_reply(ADDITIONAL_INFO_PROMPT, data)
+
+
+async def generate_query_from_transcript(data):
     class Output(BaseModel):
         topic: str
         topic_description: str
@@ -131,24 +554,37 @@ def generate_query_from_transcript(data):
         preferred_difficulty: str
         notes: str
 
-    gpt_interface = GPTInterface(api_key=os.getenv("OPENAI_KEY"))
+    gpt_interface = clients.get_gpt()
     prompt = """
-    You are given the chat transcript of a user who wants to learn something.
-    Synthesize the information given in the transcript into one JSON file with the given schema.
+    You are given what a user who wants to learn something has told you, as a chat transcript or a summary of it.
+    Synthesize this information into one JSON file with the given schema.
     The topic and description should be light-hearted and engaging.
     """.strip()
-    response = gpt_interface.run_prompt(
+    response = await gpt_interface.run_prompt(
         prompt=prompt,
         data=data,
         schema_model=Output,
     )
     
-    hike = Hike(response)
-    print(hike)
+    # Only the trailhead is created inline; trails are built in the background
+    hike = await Hike.create(response, build_trails=False)
+
+    async def build_trails():
+        await hike.generate_trails(response)
+        # The finished hike is complete in memory, so later requests start warm
+        hike_cache.put(hike)
+
+    jobs.submit(
+        hike.trailhead_id,
+        "hike",
+        build_trails,
+        progress=hike.progress,
+    )
 
     return {
         "content": "Success!",
         "trailheadId": hike.trailhead_id,
+        "jobId": hike.trailhead_id,
         "role": "assistant"
     }
 
@@ -0,0 +1,251 @@
+# Server-side onboarding sessions for /api/chat.
+#
+# Instead of re-sending the whole transcript every turn, a client sends a
+# session ID and its newest message. The session keeps what onboarding has
+# gathered so far as structured fields (topic, prerequisites, objective,
+# preferences) and each answer fills the next one, so the turn is picked from
+# the session's state rather than from the length of a client-supplied list.
+# Prompts get a compact summary of those fields instead of the raw history.
+#
+# Sessions live in an in-memory LRU, or, if SESSION_DB_PATH is set, in a SQLite
+# file, so they survive restarts and are shared between workers on the same
+# machine. With SQLite every read goes to the file: a copy cached by one worker
+# would go stale as soon as another worker handled the next turn, and its next
+# answer would land in the wrong field. SQLite calls run in a worker thread,
+# so one turn's disk I/O never blocks the event loop for the others.
+#
+# Building the hike on the final turn is guarded by a claim, so two retries of
+# that turn (on any worker) cannot both build one.
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from context_builder import summarize
+
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+SESSION_MEMORY_ENTRIES = int(os.getenv("SESSION_MEMORY_ENTRIES", "10000"))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH")
+# Token cap per field in the state summary, so a pasted essay cannot blow up every prompt
+SESSION_FIELD_TOKENS = int(os.getenv("SESSION_FIELD_TOKENS", "150"))
+# A claim left behind by a worker that died is taken over after this long
+SESSION_CLAIM_TTL = float(os.getenv("SESSION_CLAIM_TTL", "600"))
+
+# The user's answers, in the order onboarding asks for them
+ONBOARDING_FIELDS = ("topic", "known_prereqs", "objective", "preferences")
+SUMMARY_LABELS = {
+    "topic": "Topic",
+    "offered_prereqs": "Prerequisites we asked about",
+    "known_prereqs": "Prerequisites the user says they know",
+    "objective": "Why they want to learn it",
+    "preferences": "Preferred media and intensity",
+}
+
+
+class Session:
+    def __init__(self, session_id: str = None, state: Dict[str, str] = None, result: dict = None,
+                 created_at: float = None, updated_at: float = None):
+        self.id = session_id or uuid.uuid4().hex
+        self.state = state or {}
+        # The final response, once the hike has been submitted
+        self.result = result
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+
+    @property
+    def last_field(self) -> Optional[str]:
+        answered = [field for field in ONBOARDING_FIELDS if field in self.state]
+        return answered[-1] if answered else None
+
+    @property
+    def complete(self) -> bool:
+        return all(field in self.state for field in ONBOARDING_FIELDS)
+
+    def with_message(self, message: str) -> "Session":
+        """
+        A copy of the session with `message` as the answer to the next question.
+        The copy is only stored once the turn succeeds, so a failed turn can be retried.
+        """
+        state = dict(self.state)
+        for field in ONBOARDING_FIELDS:
+            if field not in state:
+                state[field] = message
+                break
+        return Session(self.id, state, self.result, self.created_at)
+
+    def record_reply(self, content: str):
+        # Of the assistant's replies only the prerequisite list matters later:
+        # the next answer says which of those the user knows
+        if self.last_field == "topic":
+            self.state["offered_prereqs"] = content
+
+    def summary(self) -> Dict[str, str]:
+        """
+        The gathered state, each field cut to SESSION_FIELD_TOKENS, for use as prompt data.
+        """
+        return {
+            label: summarize(self.state[field], SESSION_FIELD_TOKENS)
+            for field, label in SUMMARY_LABELS.items() if self.state.get(field)
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "result": self.result,
+            "createdAt": self.created_at,
+            "updatedAt": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Session":
+        return cls(data["id"], data["state"], data.get("result"), data["createdAt"], data["updatedAt"])
+
+
+class SessionStore:
+    def __init__(self, path: str = None, ttl: float = SESSION_TTL, max_memory_entries: int = SESSION_MEMORY_ENTRIES):
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        # session_id -> Session, least recently used first; only without SQLite
+        self.memory: OrderedDict = OrderedDict()
+        # session_id -> expiry of its claim; only without SQLite
+        self.claims: Dict[str, float] = {}
+
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS session_claims (
+                    id TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self.db.commit()
+
+    def create(self) -> Session:
+        return Session()
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        """
+        The session, or None if it does not exist or has expired.
+        """
+        if self.db is not None:
+            return await asyncio.to_thread(self._get_db, session_id)
+        return self._get_memory(session_id)
+
+    async def save(self, session: Session):
+        session.updated_at = time.time()
+        if self.db is not None:
+            await asyncio.to_thread(self._save_db, session)
+        else:
+            with self.lock:
+                self._set_memory(session)
+
+    async def delete(self, session_id: str):
+        if self.db is not None:
+            await asyncio.to_thread(self._delete_db, session_id)
+        else:
+            with self.lock:
+                self.memory.pop(session_id, None)
+
+    async def claim(self, session_id: str) -> bool:
+        """
+        Mark a session as busy, e.g. building its hike. Returns False if it
+        already is, here or on another worker sharing the SQLite file.
+        """
+        if self.db is not None:
+            return await asyncio.to_thread(self._claim_db, session_id)
+
+        now = time.time()
+        with self.lock:
+            if self.claims.get(session_id, 0) > now:
+                return False
+            self.claims[session_id] = now + SESSION_CLAIM_TTL
+            return True
+
+    async def release(self, session_id: str):
+        if self.db is not None:
+            await asyncio.to_thread(self._release_db, session_id)
+        else:
+            with self.lock:
+                self.claims.pop(session_id, None)
+
+    def _get_memory(self, session_id: str) -> Optional[Session]:
+        with self.lock:
+            session = self.memory.get(session_id)
+            if session is None:
+                return None
+            if session.updated_at + self.ttl <= time.time():
+                del self.memory[session_id]
+                return None
+            self.memory.move_to_end(session_id)
+            return session
+
+    def _get_db(self, session_id: str) -> Optional[Session]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT data FROM sessions WHERE id = ? AND expires_at > ?", (session_id, time.time())
+            ).fetchone()
+        return Session.from_dict(json.loads(row[0])) if row is not None else None
+
+    def _save_db(self, session: Session):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                (session.id, json.dumps(session.to_dict()), session.updated_at + self.ttl),
+            )
+            self.db.execute("DELETE FROM sessions WHERE expires_at <= ?", (session.updated_at,))
+            self.db.commit()
+
+    def _delete_db(self, session_id: str):
+        with self.lock:
+            self.db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self.db.commit()
+
+    def _claim_db(self, session_id: str) -> bool:
+        now = time.time()
+        with self.lock:
+            self.db.execute("DELETE FROM session_claims WHERE id = ? AND expires_at <= ?", (session_id, now))
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO session_claims (id, expires_at) VALUES (?, ?)",
+                (session_id, now + SESSION_CLAIM_TTL),
+            )
+            self.db.commit()
+            return cursor.rowcount == 1
+
+    def _release_db(self, session_id: str):
+        with self.lock:
+            self.db.execute("DELETE FROM session_claims WHERE id = ?", (session_id,))
+            self.db.commit()
+
+    def _set_memory(self, session: Session):
+        self.memory[session.id] = session
+        self.memory.move_to_end(session.id)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+# Shared by every request in the process
+session_store = SessionStore(path=SESSION_DB_PATH)
@@ -0,0 +1,9 @@
+# Tests import backend modules the way the server does, by their flat names,
+# and the dataset scripts from dummy_datagen/.
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "dummy_datagen"))
+sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,73 @@
+# ImagePipeline against benchmarks.fakes.FakeLuma: the concurrency cap, polling
+# backoff, deadlines and batched write-back.
+
+import asyncio
+import time
+
+import pytest
+
+import image
+from benchmarks.fakes import FakeLuma, FakeSupabase, Latency
+from image import ImagePipeline
+
+
+def resources(*titles):
+    return [{"id": f"r{i}", "title": title, "description": f"About {title}."} for i, title in enumerate(titles)]
+
+
+def test_concurrency_is_capped_and_urls_are_written_in_batches():
+    luma = FakeLuma(Latency(0.002), polls=3)
+    db = FakeSupabase()
+    db.tables["resources"] = [{**row, "image_url": None} for row in resources(*(f"Topic {i}" for i in range(10)))]
+    pipeline = ImagePipeline(luma=luma.client, db=db, concurrency=3, poll_initial=0.005, poll_max=0.01, write_batch=4)
+
+    stats = asyncio.run(pipeline.fill_missing(limit=100))
+
+    assert stats == {"completed": 10, "failed": 0, "timed_out": 0, "writes": 3}
+    assert luma.peak_active == 3
+    assert luma.active == 0
+    assert all(row["image_url"].startswith("https://luma.fake/") for row in db.tables["resources"])
+    assert db.round_trips["upsert:resources"] == 3
+
+
+def test_polling_backs_off_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(image.random, "uniform", lambda low, high: 1.0)
+    luma = FakeLuma(polls=6)
+    pipeline = ImagePipeline(luma=luma.client, poll_initial=0.02, poll_max=0.05)
+
+    stats = asyncio.run(pipeline.run(resources("Topic")))
+
+    assert stats["completed"] == 1
+    (generation,) = luma.generations.values()
+    times = [generation["created_at"]] + generation["polled_at"]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    # 0.02 growing by 1.5x, capped at 0.05
+    for gap, expected in zip(gaps, [0.02, 0.03, 0.045, 0.05, 0.05, 0.05]):
+        assert gap >= expected - 0.002
+    assert len(gaps) == 6
+
+
+def test_failures_and_deadlines_do_not_stop_the_batch():
+    luma = FakeLuma(polls=2)
+    pipeline = ImagePipeline(luma=luma.client, concurrency=3, deadline=0.2, poll_initial=0.01, poll_max=0.02)
+
+    start = time.monotonic()
+    stats = asyncio.run(pipeline.run(resources("fail", "stall", "Topic")))
+
+    assert stats == {"completed": 1, "failed": 1, "timed_out": 1, "writes": 0}
+    assert time.monotonic() - start < 1.0
+
+    stalled = next(g for g in luma.generations.values() if "stall" in g["prompt"])
+    # Never polled past the deadline, and the last sleep was cut short to meet it
+    assert stalled["polled_at"][-1] - stalled["created_at"] < 0.2 + 0.05
+    assert stalled["state"] == "dreaming"
+
+
+def test_expired_deadline_raises_without_polling():
+    luma = FakeLuma(polls=2)
+    pipeline = ImagePipeline(luma=luma.client, deadline=0.0)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(pipeline.generate("stall"))
+    (generation,) = luma.generations.values()
+    assert generation["polled_at"] == []
@@ -0,0 +1,138 @@
+# CircuitBreaker state changes and UpstreamCaller's retry, deadline and
+# breaker handling, with in-process requests standing in for a provider.
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, UpstreamCaller
+
+
+def flaky_request(failures: int, error=httpx.ConnectError("connection refused")):
+    """
+    A request function that raises `error` on its first `failures` calls, then returns "ok".
+    """
+    calls = []
+
+    async def request():
+        calls.append(time.monotonic())
+        await asyncio.sleep(0)
+        if len(calls) <= failures:
+            raise error
+        return "ok"
+
+    return request, calls
+
+
+def caller(breaker: CircuitBreaker = None, **options) -> UpstreamCaller:
+    options = {"deadline": 5.0, "attempt_timeout": 1.0, "max_retries": 3, "base_delay": 0.001, "max_delay": 0.01, **options}
+    return UpstreamCaller(breaker or CircuitBreaker("test"), hedge=False, **options)
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    # One trial call is let through; others fail fast while it runs
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    breaker.before_call()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+
+
+def test_caller_retries_retryable_errors_then_succeeds():
+    breaker = CircuitBreaker("test", failure_threshold=10)
+    request, calls = flaky_request(failures=2)
+    upstream = caller(breaker)
+
+    assert asyncio.run(upstream.call(request)) == "ok"
+
+    assert len(calls) == 3
+    assert upstream.stats["retries"] == 2
+    assert breaker.failures == 0
+
+
+def test_caller_gives_up_after_max_retries():
+    request, calls = flaky_request(failures=10)
+    upstream = caller(CircuitBreaker("test", failure_threshold=10), max_retries=2)
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(upstream.call(request))
+
+    assert len(calls) == 3
+    assert upstream.stats["failures"] == 1
+
+
+def test_caller_respects_its_deadline():
+    async def hang():
+        await asyncio.sleep(10)
+
+    upstream = caller(deadline=0.1, attempt_timeout=1.0)
+    start = time.monotonic()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(upstream.call(hang))
+
+    assert time.monotonic() - start < 1.0
+
+
+def test_non_retryable_error_leaves_the_breaker_alone():
+    breaker = CircuitBreaker("test", failure_threshold=3)
+    breaker.record_failure()
+    request, calls = flaky_request(failures=1, error=ValueError("bad request"))
+
+    with pytest.raises(ValueError):
+        asyncio.run(caller(breaker).call(request))
+
+    # Not retried, and neither counted as a failure nor as proof of health
+    assert len(calls) == 1
+    assert breaker.failures == 1
+    assert breaker.state == "closed"
+
+
+def test_non_retryable_error_on_a_trial_keeps_the_breaker_half_open():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    request, _ = flaky_request(failures=1, error=ValueError("bad request"))
+
+    with pytest.raises(ValueError):
+        asyncio.run(caller(breaker).call(request))
+
+    assert breaker.state == "half-open"
+    assert not breaker.trial_in_flight
+
+
+def test_open_breaker_fails_fast_without_calling():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    request, calls = flaky_request(failures=0)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(caller(breaker).call(request))
+
+    assert calls == []
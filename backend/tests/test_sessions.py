@@ -0,0 +1,51 @@
+# SessionStore's final-turn claim, on the in-memory and the SQLite backend.
+
+import asyncio
+
+import pytest
+
+from sessions import SessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = SessionStore(path=str(tmp_path / "sessions.sqlite") if request.param == "sqlite" else None)
+    yield store
+    store.close()
+
+
+def test_only_the_first_claim_succeeds(store):
+    async def claim_twice():
+        return [await store.claim("session"), await store.claim("session")]
+
+    assert asyncio.run(claim_twice()) == [True, False]
+
+
+def test_concurrent_claims_let_one_through(store):
+    async def race():
+        return await asyncio.gather(*(store.claim("session") for _ in range(5)))
+
+    assert sorted(asyncio.run(race())) == [False] * 4 + [True]
+
+
+def test_released_claim_can_be_taken_again(store):
+    async def claim_release_claim():
+        first = await store.claim("session")
+        await store.release("session")
+        return first, await store.claim("session"), await store.claim("other")
+
+    assert asyncio.run(claim_release_claim()) == (True, True, True)
+
+
+def test_claim_is_shared_between_workers_on_one_sqlite_file(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    worker_a, worker_b = SessionStore(path=path), SessionStore(path=path)
+
+    async def claim_on_both():
+        return await worker_a.claim("session"), await worker_b.claim("session")
+
+    try:
+        assert asyncio.run(claim_on_both()) == (True, False)
+    finally:
+        worker_a.close()
+        worker_b.close()
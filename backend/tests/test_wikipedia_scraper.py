@@ -0,0 +1,218 @@
+# WikipediaCrawler against a small fixture site served from a local HTTP server:
+# the response cache, checkpoint/resume and the per-level thread pool.
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pytest
+
+from wikipedia_scraper import WikipediaCrawler
+
+# title -> (first paragraph, linked titles); None marks a disambiguation page
+ARTICLES = {
+    "Python": ("Python is a language.", ["Guido", "Bytecode", "Indentation", "Monty", "Help:Contents"]),
+    "Guido": ("Guido wrote Python.", ["Python", "Netherlands"]),
+    "Bytecode": ("Bytecode is run by an interpreter.", ["Interpreter", "Python"]),
+    "Indentation": ("Indentation is significant.", ["Whitespace", "Missing"]),
+    "Monty": None,
+    "Interpreter": ("An interpreter runs code.", []),
+    "Netherlands": ("A country.", []),
+    "Whitespace": ("Blank characters.", []),
+}
+
+
+def article_html(title: str) -> str:
+    if ARTICLES[title] is None:
+        return f'<html><body><table id="disambigbox"></table><p>{title} may refer to:</p></body></html>'
+    description, links = ARTICLES[title]
+    anchors = "".join(f'<a href="/wiki/{link.replace(" ", "_")}">{link}</a>' for link in links)
+    return f'<html><body><div class="mw-parser-output"><p>{description}</p><p>{anchors}</p></div></body></html>'
+
+
+class FixtureSite:
+    """
+    Serves ARTICLES and a search API over HTTP, counting requests per path and
+    the most requests in flight at once.
+    """
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.requests = Counter()
+        self.active = 0
+        self.peak_active = 0
+        self.lock = threading.Lock()
+
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with site.lock:
+                    site.active += 1
+                    site.peak_active = max(site.peak_active, site.active)
+                try:
+                    time.sleep(site.delay)
+                    status, body = site.respond(self.path)
+                finally:
+                    with site.lock:
+                        site.active -= 1
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def respond(self, path: str):
+        url = urlparse(path)
+        with self.lock:
+            self.requests[url.path] += 1
+
+        if url.path == "/w/api.php":
+            query = parse_qs(url.query)["srsearch"][0]
+            results = [{"title": title} for title in ARTICLES if title.lower() in query.lower()]
+            return 200, json.dumps({"query": {"search": results}}).encode()
+
+        title = unquote(url.path.removeprefix("/wiki/")).replace("_", " ")
+        if title not in ARTICLES:
+            return 404, b"Not found"
+        return 200, article_html(title).encode()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def site():
+    site = FixtureSite()
+    yield site
+    site.close()
+
+
+def crawler(site: FixtureSite, tmp_path, **options) -> WikipediaCrawler:
+    return WikipediaCrawler(base_url=site.url, requests_per_second=0, cache_dir=str(tmp_path / "cache"), **options)
+
+
+def edges_by_title(graph: dict) -> set:
+    titles = {node["id"]: node["title"] for node in graph["nodes"]}
+    return {(titles[parent], titles[child]) for parent, child in graph["edges"]}
+
+
+def test_crawl_builds_graph_breadth_first(site, tmp_path):
+    graph = crawler(site, tmp_path).crawl("python", max_depth=2, max_degree=5)
+
+    difficulties = {node["title"]: node["difficulty"] for node in graph["nodes"]}
+    assert difficulties == {
+        "Python": 0.0,
+        "Guido": 0.5, "Bytecode": 0.5, "Indentation": 0.5,
+        "Interpreter": 1.0, "Netherlands": 1.0, "Whitespace": 1.0,
+    }
+    assert edges_by_title(graph) == {
+        ("Python", "Guido"), ("Python", "Bytecode"), ("Python", "Indentation"),
+        ("Guido", "Python"), ("Guido", "Netherlands"),
+        ("Bytecode", "Interpreter"), ("Bytecode", "Python"),
+        ("Indentation", "Whitespace"),
+    }
+    python = next(node for node in graph["nodes"] if node["title"] == "Python")
+    assert python["description"] == "Python is a language."
+    assert python["link"] == site.url + "/wiki/Python"
+    # Every article is fetched once, however many pages link to it
+    assert all(count == 1 for count in site.requests.values())
+
+
+def test_cache_serves_a_repeat_crawl_without_requests(site, tmp_path):
+    first = crawler(site, tmp_path).crawl("python", max_depth=2, max_degree=5)
+    assert sum(site.requests.values()) == 10
+    site.requests.clear()
+
+    second = crawler(site, tmp_path).crawl("python", max_depth=2, max_degree=5)
+
+    assert edges_by_title(second) == edges_by_title(first)
+    # Only the 404 is requested again: non-200 responses are not cached
+    assert site.requests == {"/wiki/Missing": 1}
+
+
+def test_interrupted_crawl_resumes_from_checkpoint(site, tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    complete = crawler(site, tmp_path / "reference").crawl("python", max_depth=2, max_degree=5)
+    site.requests.clear()
+
+    interrupted = crawler(site, tmp_path, checkpoint_path=checkpoint_path)
+    fetch_article = interrupted.fetch_article
+
+    def crash_at_depth_two(title, max_degree):
+        if title == "Netherlands":
+            raise RuntimeError("crawler killed")
+        return fetch_article(title, max_degree)
+
+    interrupted.fetch_article = crash_at_depth_two
+    with pytest.raises(RuntimeError):
+        interrupted.crawl("python", max_depth=2, max_degree=5)
+
+    with open(checkpoint_path) as fin:
+        assert json.load(fin)["depth"] == 2
+
+    # Resume without the cache, so every request the resumed crawl makes is visible
+    resumed = WikipediaCrawler(base_url=site.url, requests_per_second=0, checkpoint_path=checkpoint_path)
+    site.requests.clear()
+    graph = resumed.crawl("python", max_depth=2, max_degree=5)
+
+    assert edges_by_title(graph) == edges_by_title(complete)
+    # Neither the search nor the levels finished before the crash are repeated
+    assert "/w/api.php" not in site.requests
+    assert not {"/wiki/Python", "/wiki/Guido", "/wiki/Bytecode"} & set(site.requests)
+    assert site.requests["/wiki/Netherlands"] == 1
+
+
+def test_finished_crawl_leaves_no_checkpoint_to_resume(site, tmp_path):
+    checkpoint_path = tmp_path / "checkpoint.json"
+    crawler(site, tmp_path, checkpoint_path=str(checkpoint_path)).crawl("python", max_depth=2, max_degree=5)
+    assert not checkpoint_path.exists()
+
+    # Without the cache, so the second crawl's requests are visible
+    site.requests.clear()
+    rerun = WikipediaCrawler(base_url=site.url, requests_per_second=0, checkpoint_path=str(checkpoint_path))
+    graph = rerun.crawl("python", max_depth=2, max_degree=5)
+
+    assert site.requests["/w/api.php"] == 1
+    assert len(graph["nodes"]) == 7
+
+
+def test_checkpoint_from_other_parameters_is_ignored(site, tmp_path):
+    checkpoint_path = tmp_path / "checkpoint.json"
+    interrupted = crawler(site, tmp_path, checkpoint_path=str(checkpoint_path))
+    fetch_article = interrupted.fetch_article
+
+    def crash_at_depth_two(title, max_degree):
+        if title == "Netherlands":
+            raise RuntimeError("crawler killed")
+        return fetch_article(title, max_degree)
+
+    interrupted.fetch_article = crash_at_depth_two
+    with pytest.raises(RuntimeError):
+        interrupted.crawl("python", max_depth=2, max_degree=5)
+    assert checkpoint_path.exists()
+
+    graph = crawler(site, tmp_path, checkpoint_path=str(checkpoint_path)).crawl("python", max_depth=1, max_degree=5)
+
+    assert {node["title"] for node in graph["nodes"]} == {"Python", "Guido", "Bytecode", "Indentation"}
+
+
+def test_one_level_is_fetched_concurrently_up_to_max_workers(tmp_path):
+    site = FixtureSite(delay=0.1)
+    try:
+        graph = crawler(site, tmp_path, max_workers=2).crawl("python", max_depth=1, max_degree=5)
+    finally:
+        site.close()
+
+    # The seed and three of its four links (Monty is a disambiguation page), fetched two at a time
+    assert len(graph["nodes"]) == 4
+    assert site.peak_active == 2
@@ -0,0 +1,90 @@
+# WriteBuffer against benchmarks.fakes.FakeSupabase, including a flush whose
+# insert fails partway.
+
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeSupabase
+from write_buffer import WriteBuffer
+
+
+class FlakySupabase(FakeSupabase):
+    """
+    FakeSupabase whose `fail_at`-th insert raises, after running `during_failure`.
+    """
+    def __init__(self, fail_at: int, during_failure=None):
+        super().__init__()
+        self.fail_at = fail_at
+        self.during_failure = during_failure
+        self.inserts = 0
+
+    def from_(self, table: str):
+        query = super().from_(table)
+        execute = query.execute
+
+        async def flaky_execute():
+            if query.operation == "insert":
+                self.inserts += 1
+                if self.inserts == self.fail_at:
+                    if self.during_failure:
+                        self.during_failure()
+                    raise RuntimeError("insert failed")
+            return await execute()
+
+        query.execute = flaky_execute
+        return query
+
+
+def titles(rows):
+    return [row["title"] for row in rows]
+
+
+def test_flush_writes_tables_in_foreign_key_order_and_chunks():
+    db = FakeSupabase()
+    buffer = WriteBuffer(db, chunk_size=2)
+    for i in range(3):
+        buffer.add("resources", {"title": f"r{i}"})
+    buffer.add("trails", {"title": "t0"})
+    buffer.add("edges", {"title": "e0"})
+
+    written = asyncio.run(buffer.flush())
+
+    assert titles(written["resources"]) == ["r0", "r1", "r2"]
+    assert all(row["id"] for row in written["resources"] + written["trails"])
+    assert buffer.size == 0
+    assert buffer.round_trips == 4
+    assert titles(db.tables["resources"]) == ["r0", "r1", "r2"]
+
+
+def test_failed_flush_requeues_unwritten_rows_in_order():
+    buffer = None
+
+    def buffer_more_rows():
+        buffer.add("trails", {"title": "t-late"})
+        buffer.add("edges", {"title": "e-late"})
+
+    # Inserts: resources [r0, r1], resources [r2], trails [t0, t1] <- fails
+    db = FlakySupabase(fail_at=3, during_failure=buffer_more_rows)
+    buffer = WriteBuffer(db, chunk_size=2)
+    for i in range(3):
+        buffer.add("resources", {"title": f"r{i}"})
+    for i in range(3):
+        buffer.add("trails", {"title": f"t{i}"})
+    buffer.add("edges", {"title": "e0"})
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(buffer.flush())
+
+    # Resources were written and are not retried; everything from the failed
+    # chunk on goes back ahead of the rows buffered during the flush
+    assert titles(db.tables["resources"]) == ["r0", "r1", "r2"]
+    assert buffer.pending["resources"] == []
+    assert titles(buffer.pending["trails"]) == ["t0", "t1", "t2", "t-late"]
+    assert titles(buffer.pending["edges"]) == ["e0", "e-late"]
+
+    asyncio.run(buffer.flush())
+
+    assert titles(db.tables["trails"]) == ["t0", "t1", "t2", "t-late"]
+    assert titles(db.tables["edges"]) == ["e0", "e-late"]
+    assert buffer.size == 0
@@ -0,0 +1,396 @@
+# Embedding index over the `resources` table.
+#
+# Every resource is embedded from its title and description, and the vectors
+# are kept L2-normalized in one NumPy matrix, so a cosine top-k query is a
+# single matrix-vector product plus an argpartition. A second matrix holds each
+# resource's title alone, for dedupe: a topic about to be generated is only a
+# title, and is compared with titles embedded the same way. Resources can be added
+# and removed incrementally, and the index is persisted as an .npz file so a
+# restart only embeds resources created since the last save.
+#
+# Building the index embeds every resource, which for seeded databases can mean
+# millions of rows sent to the embeddings API, so it never happens on a request:
+# `refresh` syncs in a background task, and until the first sync (or a saved
+# file) has loaded, `ready` is False and callers skip the index. Resources the
+# backend writes are added incrementally. To build the file up front, run
+# `python vector_index.py` with VECTOR_INDEX_PATH set.
+#
+# The embedding function is pluggable: OpenAIEmbedder for production, and
+# HashingEmbedder, a deterministic local embedder that needs no network.
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+VECTOR_INDEX_REFRESH = float(os.getenv("VECTOR_INDEX_REFRESH", "600"))
+VECTOR_INDEX_PAGE_SIZE = 1000
+VECTOR_EMBED_BATCH_SIZE = int(os.getenv("VECTOR_EMBED_BATCH_SIZE", "256"))
+# Texts are cut to this many characters before embedding; descriptions are short articles
+VECTOR_EMBED_MAX_CHARS = 2000
+# Resource fields kept with each vector, so matches can be filtered and turned back into nodes
+VECTOR_ROW_COLUMNS = ("id", "title", "description", "resource_type", "difficulty")
+
+
+def resource_text(title: str, description: str) -> str:
+    return f"{title or ''}\n{description or ''}"[:VECTOR_EMBED_MAX_CHARS]
+
+
+def title_text(title: str) -> str:
+    return (title or "")[:VECTOR_EMBED_MAX_CHARS]
+
+
+def grow(matrix: Optional[np.ndarray], count: int, needed: int, dim: int) -> np.ndarray:
+    """
+    `matrix` with room for `needed` rows, of which the first `count` are kept.
+    """
+    if matrix is None:
+        return np.zeros((max(needed, 64), dim), dtype=np.float32)
+    if needed <= len(matrix):
+        return matrix
+    # Grow geometrically so a stream of single adds stays amortized O(1)
+    grown = np.zeros((max(2 * len(matrix), needed), matrix.shape[1]), dtype=np.float32)
+    grown[:count] = matrix[:count]
+    return grown
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class HashingEmbedder:
+    """
+    Deterministic bag-of-words embedder: word unigrams and bigrams are hashed
+    into `dim` signed buckets. No model or network needed, so it suits tests
+    and offline development, but it only captures shared wording.
+    """
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = re.findall(r"\w+", text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.embed_one(text) for text in texts])
+
+
+class OpenAIEmbedder:
+    def __init__(self, client, model: str = "text-embedding-3-small", caller=None):
+        # An AsyncOpenAI client, e.g. AsyncGPTInterface.client
+        self.client = client
+        self.model = model
+        self.name = model
+        # Optional resilience.UpstreamCaller for retries and deadlines
+        self.caller = caller
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        def request():
+            return self.client.embeddings.create(model=self.model, input=texts)
+
+        response = await (self.caller.call(request, operation="embeddings") if self.caller else request())
+        return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+
+class VectorIndex:
+    def __init__(self, embedder, path: str = None, refresh_interval: float = VECTOR_INDEX_REFRESH):
+        self.embedder = embedder
+        self.path = path
+        self.refresh_interval = refresh_interval
+
+        # Row i of `vectors` and `title_vectors` belongs to ids[i]; only the
+        # first len(ids) rows are in use
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.vectors: Optional[np.ndarray] = None
+        self.title_vectors: Optional[np.ndarray] = None
+        # id -> VECTOR_ROW_COLUMNS of the resource
+        self.rows: Dict[str, dict] = {}
+        self.loaded_at = None
+        # Whether the index covers the table, from a finished sync or a saved file
+        self.ready = False
+        self.refresh_task: Optional[asyncio.Task] = None
+        # Background adds in flight, held so they are not garbage collected
+        self.add_tasks: Set[asyncio.Task] = set()
+        self.dirty = False
+
+        if path and os.path.exists(path):
+            self.load_file(path)
+
+    @property
+    def stale(self) -> bool:
+        return self.loaded_at is None or time.time() - self.loaded_at > self.refresh_interval
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, resource_id: str) -> bool:
+        return resource_id in self.positions
+
+    def refresh(self, db) -> Optional[asyncio.Task]:
+        """
+        Start a background sync if the index is stale, without waiting for it.
+        """
+        if self.stale and (self.refresh_task is None or self.refresh_task.done()):
+            self.refresh_task = asyncio.create_task(self.sync(db))
+            self.refresh_task.add_done_callback(report_sync_error)
+        return self.refresh_task
+
+    async def sync(self, db):
+        """
+        Page through the resources table, embed every resource not yet indexed
+        and drop indexed resources that no longer exist.
+        """
+        indexed_before = set(self.ids)
+        seen = set()
+        start = 0
+        while True:
+            response = await db.from_("resources") \
+                .select(", ".join(VECTOR_ROW_COLUMNS)) \
+                .order("id") \
+                .range(start, start + VECTOR_INDEX_PAGE_SIZE - 1) \
+                .execute()
+            rows = response.data or []
+            seen.update(row["id"] for row in rows)
+            await self.add(rows)
+
+            if len(rows) < VECTOR_INDEX_PAGE_SIZE:
+                break
+            start += VECTOR_INDEX_PAGE_SIZE
+
+        # Resources added while we paged may be missing from `seen`, so only prune older ones
+        for resource_id in indexed_before - seen:
+            self.remove(resource_id)
+
+        self.loaded_at = time.time()
+        self.ready = True
+        self.save()
+
+    def add_in_background(self, rows: List[dict]) -> Optional[asyncio.Task]:
+        """
+        Start indexing `rows` without waiting for it. An embeddings failure is
+        only logged; the next sync picks the rows up.
+        """
+        if not rows:
+            return None
+        task = asyncio.create_task(self.add(rows))
+        self.add_tasks.add(task)
+        task.add_done_callback(self.add_tasks.discard)
+        task.add_done_callback(report_add_error)
+        return task
+
+    async def add(self, rows: List[dict]):
+        """
+        Embed and index resource rows. Rows that are already indexed are skipped.
+        """
+        rows = [row for row in {row["id"]: row for row in rows}.values() if row["id"] not in self.positions]
+        for start in range(0, len(rows), VECTOR_EMBED_BATCH_SIZE):
+            batch = rows[start:start + VECTOR_EMBED_BATCH_SIZE]
+            # Both texts of the batch in one embeddings request
+            texts = [resource_text(row.get("title"), row.get("description")) for row in batch]
+            texts += [title_text(row.get("title")) for row in batch]
+            embedded = np.asarray(await self.embedder.embed(texts), dtype=np.float32)
+            vectors, title_vectors = embedded[:len(batch)], embedded[len(batch):]
+
+            # Another add may have indexed some of these while we awaited the embedder
+            fresh = [i for i, row in enumerate(batch) if row["id"] not in self.positions]
+            self.append(
+                [batch[i] for i in fresh],
+                normalize_rows(vectors[fresh]),
+                normalize_rows(title_vectors[fresh]),
+            )
+
+    def append(self, rows: List[dict], vectors: np.ndarray, title_vectors: np.ndarray):
+        if not rows:
+            return
+        count = len(self.ids)
+        self.vectors = grow(self.vectors, count, count + len(rows), vectors.shape[1])
+        self.title_vectors = grow(self.title_vectors, count, count + len(rows), title_vectors.shape[1])
+
+        self.vectors[count:count + len(rows)] = vectors
+        self.title_vectors[count:count + len(rows)] = title_vectors
+        for i, row in enumerate(rows):
+            self.positions[row["id"]] = count + i
+            self.ids.append(row["id"])
+            self.rows[row["id"]] = {column: row.get(column) for column in VECTOR_ROW_COLUMNS}
+        self.dirty = True
+
+    def remove(self, resource_id: str):
+        """
+        Drop a resource by moving the last row into its slot.
+        """
+        position = self.positions.pop(resource_id, None)
+        if position is None:
+            return
+        last = len(self.ids) - 1
+        if position != last:
+            moved_id = self.ids[last]
+            self.vectors[position] = self.vectors[last]
+            self.title_vectors[position] = self.title_vectors[last]
+            self.ids[position] = moved_id
+            self.positions[moved_id] = position
+        self.ids.pop()
+        del self.rows[resource_id]
+        self.dirty = True
+
+    def search_vector(self, vector: np.ndarray, k: int = 10, exclude: set = (), titles: bool = False) -> List[Tuple[dict, float]]:
+        """
+        Cosine top-k against a query vector, over the title-and-description
+        vectors, or the title vectors if `titles` is set.
+
+        Returns:
+            List[Tuple[dict, float]]: (resource row, cosine similarity), most similar first.
+        """
+        count = len(self.ids)
+        if count == 0 or k <= 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = (self.title_vectors if titles else self.vectors)[:count] @ query
+
+        # Over-fetch by the number of excluded IDs so k results survive the filter
+        top = min(count, k + len(exclude))
+        candidates = np.argpartition(-scores, top - 1)[:top]
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        results = []
+        for i in candidates:
+            resource_id = self.ids[i]
+            if resource_id in exclude:
+                continue
+            results.append((self.rows[resource_id], float(scores[i])))
+            if len(results) == k:
+                break
+        return results
+
+    async def search(self, text: str, k: int = 10, exclude: set = ()) -> List[Tuple[dict, float]]:
+        if not self.ids:
+            return []
+        vector = (await self.embedder.embed([text]))[0]
+        return self.search_vector(vector, k, exclude)
+
+    async def search_titles(self, title: str, k: int = 10) -> List[Tuple[dict, float]]:
+        """
+        Resources whose titles are closest to `title`, most similar first.
+        """
+        if not self.ids:
+            return []
+        vector = (await self.embedder.embed([title_text(title)]))[0]
+        return self.search_vector(vector, k, titles=True)
+
+    def similar(self, resource_id: str, k: int = 10) -> List[Tuple[dict, float]]:
+        """
+        Resources most similar to an indexed resource, excluding itself.
+        """
+        position = self.positions.get(resource_id)
+        if position is None:
+            return []
+        return self.search_vector(self.vectors[position], k, exclude={resource_id})
+
+    def similarity(self, id_a: str, id_b: str) -> Optional[float]:
+        """
+        Cosine similarity of two indexed resources, or None if either is not indexed.
+        """
+        if id_a not in self.positions or id_b not in self.positions:
+            return None
+        return float(self.vectors[self.positions[id_a]] @ self.vectors[self.positions[id_b]])
+
+    def save(self, path: str = None):
+        """
+        Write the index to an .npz file (atomically), if it changed since the last save.
+        """
+        path = path or self.path
+        if not path or not self.dirty:
+            return
+        count = len(self.ids)
+        dim = self.vectors.shape[1] if self.vectors is not None else 0
+        rows = [self.rows[resource_id] for resource_id in self.ids]
+
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            embedder=np.array(self.embedder.name),
+            ids=np.array(self.ids, dtype=str),
+            titles=np.array([row["title"] or "" for row in rows], dtype=str),
+            descriptions=np.array([row["description"] or "" for row in rows], dtype=str),
+            resource_types=np.array([json.dumps(row["resource_type"]) for row in rows], dtype=str),
+            difficulties=np.array([np.nan if row["difficulty"] is None else row["difficulty"] for row in rows], dtype=np.float64),
+            vectors=self.vectors[:count] if count else np.zeros((0, dim), dtype=np.float32),
+            title_vectors=self.title_vectors[:count] if count else np.zeros((0, dim), dtype=np.float32),
+        )
+        os.replace(tmp_path, path)
+        self.dirty = False
+
+    def load_file(self, path: str):
+        with np.load(path) as data:
+            # Vectors from a different embedder are not comparable; start over instead
+            if str(data["embedder"]) != self.embedder.name:
+                print(f"Ignoring vector index at {path}: built with {data['embedder']}, not {self.embedder.name}")
+                return
+            if "title_vectors" not in data:
+                print(f"Ignoring vector index at {path}: it has no title vectors")
+                return
+            rows = [
+                {
+                    "id": resource_id,
+                    "title": title,
+                    "description": description,
+                    "resource_type": json.loads(resource_type),
+                    "difficulty": None if np.isnan(difficulty) else difficulty,
+                }
+                for resource_id, title, description, resource_type, difficulty in zip(
+                    data["ids"].tolist(), data["titles"].tolist(), data["descriptions"].tolist(),
+                    data["resource_types"].tolist(), data["difficulties"].tolist(),
+                )
+            ]
+            self.append(rows, data["vectors"].astype(np.float32), data["title_vectors"].astype(np.float32))
+        self.dirty = False
+        # Possibly behind the table, but a background sync only has to catch up
+        self.ready = True
+
+
+def report_sync_error(task: asyncio.Task):
+    # The next stale access starts another sync, so a failure is only logged
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Vector index sync failed: {task.exception()}")
+
+
+def report_add_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Vector index add failed: {task.exception()}")
+
+
+async def backfill():
+    """
+    Embed every resource into the index file at VECTOR_INDEX_PATH, so servers
+    start from it instead of embedding the whole table in the background.
+    """
+    import clients
+
+    index = clients.get_vector_index()
+    if not index.path:
+        raise SystemExit("Set VECTOR_INDEX_PATH to the index file to build")
+    try:
+        await index.sync(await clients.get_db())
+        print(f"Indexed {len(index)} resources into {index.path}")
+    finally:
+        await clients.close_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
@@ -0,0 +1,88 @@
+# Unit-of-work buffer for the rows a Hike writes to Supabase.
+#
+# Instead of one `.insert(...).execute()` per trail, resource and edge, rows are
+# collected here and written with bulk inserts whenever `flush` is called.
+# Resources and trails get client-generated UUIDs when they are buffered, so
+# edges can reference them before anything has reached the database.
+
+import asyncio
+import uuid
+from typing import Dict, List
+
+# Flush order respects foreign keys: trails point at their trailhead resource,
+# edges point at resources and trails.
+FLUSH_ORDER = ("resources", "trails", "edges")
+# Tables whose rows are referenced by other rows and so need an ID up front
+ID_TABLES = ("resources", "trails")
+WRITE_BUFFER_CHUNK_SIZE = 500
+
+
+class WriteBuffer:
+    def __init__(self, db, chunk_size: int = WRITE_BUFFER_CHUNK_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.pending: Dict[str, List[dict]] = {table: [] for table in FLUSH_ORDER}
+        self.round_trips = 0
+        self._lock = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created lazily so it binds to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def add(self, table: str, row: dict) -> dict:
+        """
+        Buffer a row for insertion, assigning it an ID if other rows may reference it.
+        """
+        if table in ID_TABLES and not row.get("id"):
+            row = {**row, "id": str(uuid.uuid4())}
+        self.pending[table].append(row)
+        return row
+
+    def discard(self, table: str, predicate) -> int:
+        """
+        Drop pending rows of `table` for which `predicate(row)` is true.
+        """
+        kept = [row for row in self.pending[table] if not predicate(row)]
+        dropped = len(self.pending[table]) - len(kept)
+        self.pending[table] = kept
+        return dropped
+
+    @property
+    def size(self) -> int:
+        return sum(len(rows) for rows in self.pending.values())
+
+    async def flush(self) -> Dict[str, List[dict]]:
+        """
+        Write every pending row with one bulk insert per table and chunk.
+
+        If an insert fails, the rows not yet written go back into the buffer,
+        ahead of anything buffered since, and the error is raised. The next
+        flush retries them, or the caller discards them.
+
+        Returns:
+            Dict[str, List[dict]]: The rows that were written, by table.
+        """
+        async with self.lock:
+            # Take everything pending at once so rows buffered while we await
+            # land in the next flush, never ahead of the rows they depend on.
+            batch = self.pending
+            self.pending = {table: [] for table in FLUSH_ORDER}
+            written = {table: 0 for table in FLUSH_ORDER}
+
+            try:
+                for table in FLUSH_ORDER:
+                    rows = batch[table]
+                    for start in range(0, len(rows), self.chunk_size):
+                        await self.db.from_(table).insert(rows[start:start + self.chunk_size]).execute()
+                        written[table] = min(len(rows), start + self.chunk_size)
+                        self.round_trips += 1
+            except BaseException:
+                # A bulk insert is one statement, so the failed chunk wrote nothing
+                for table in FLUSH_ORDER:
+                    self.pending[table] = batch[table][written[table]:] + self.pending[table]
+                raise
+
+            return batch
@@ -17,14 +17,71 @@ type ChatMessage = {
   content: string;
   role: 'user' | 'assistant';
   trailheadId?: string;
+  sessionId?: string;
 };
 
+// Send the newest message of an onboarding session and receive the reply as
+// Server-Sent Events, calling onToken with the reply so far as each token
+// arrives. The backend keeps the session's state, so only the new message is
+// sent; the first turn has no session ID and the reply carries one. Resolves
+// to the complete message once the `done` event is received.
+async function streamChat(
+  sessionId: string | null,
+  message: string,
+  onToken: (content: string) => void,
+): Promise<ChatMessage> {
+  const response = await fetch(
+    `${process.env.NEXT_PUBLIC_BACKEND_URL}/api/chat`,
+    {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      },
+      body: JSON.stringify({ session_id: sessionId, message }),
+    },
+  );
+  if (!response.ok) {
+    throw new Error(`Chat request failed: ${response.status}`);
+  }
+
+  const reader = response
+    .body!.pipeThrough(new TextDecoderStream())
+    .getReader();
+  let buffer = '';
+  let content = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) throw new Error('Chat stream ended unexpectedly');
+
+    buffer += value;
+    const events = buffer.split('\n\n');
+    buffer = events.pop() ?? '';
+
+    for (const raw of events) {
+      const event = raw.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] ?? 'null');
+
+      if (event === 'token') {
+        content += data.content;
+        onToken(content);
+      } else if (event === 'done') {
+        return data;
+      } else if (event === 'error') {
+        throw new Error(data.detail);
+      }
+    }
+  }
+}
+
 export default function Home() {
   const searchParams = useSearchParams();
 
   const [query, setQuery] = useState(searchParams.get('query') ?? '');
   const [isWaiting, setIsWaiting] = useState(false);
   const [chatHistory, setChatHistory] = useState<ChatMessage[]>([]);
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const queryInputRef = useRef<any>(null);
   const router = useRouter();
 
@@ -38,13 +95,13 @@ export default function Home() {
     ];
     setChatHistory(newChatHistory);
 
-    const response: ChatMessage = await (
-      await fetch(`${process.env.NEXT_PUBLIC_BACKEND_URL}/api/chat`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(newChatHistory),
-      })
-    ).json();
+    const response: ChatMessage = await streamChat(
+      sessionId,
+      query,
+      (content) =>
+        setChatHistory([...newChatHistory, { content, role: 'assistant' }]),
+    );
+    if (response.sessionId) setSessionId(response.sessionId);
 
     console.log(response);
     if (response.trailheadId) {
@@ -53,7 +110,10 @@ export default function Home() {
       return;
     }
 
-    setChatHistory([...newChatHistory, response]);
+    setChatHistory([
+      ...newChatHistory,
+      { content: response.content, role: response.role },
+    ]);
     setIsWaiting(false);
     setQuery('');
     setTimeout(() => queryInputRef.current?.focus(), 100);
@@ -176,7 +236,7 @@ export default function Home() {
                   {message.content}
                 </ChatMessage>
               ))}
-              {isWaiting && (
+              {isWaiting && chatHistory.at(-1)?.role === 'user' && (
                 <div className="flex flex-col gap-2" key="skeleton">
                   <Skeleton className="h-4 w-80 rounded-2xl delay-0" />
                   <Skeleton className="h-4 w-20 rounded-2xl delay-500" />
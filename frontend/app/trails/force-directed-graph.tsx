@@ -56,16 +56,23 @@ export const ForceDirectedGraph = ({ data }: { data: GraphData }) => {
 
     svg.call(zoom);
 
-    // Initialize node positions in a circular layout
+    // Positions precomputed by the backend are drawn as-is, without simulating
+    const precomputed = data.nodes.every(
+      (node) => node.x !== undefined && node.y !== undefined,
+    );
+
+    // Otherwise initialize node positions in a circular layout
     const radius = Math.min(width, height) / 4;
     const centerX = width / 2;
     const centerY = height / 2;
 
-    data.nodes.forEach((node, i) => {
-      const angle = (i * 2 * Math.PI) / data.nodes.length;
-      node.x = centerX + radius * Math.cos(angle);
-      node.y = centerY + radius * Math.sin(angle);
-    });
+    if (!precomputed) {
+      data.nodes.forEach((node, i) => {
+        const angle = (i * 2 * Math.PI) / data.nodes.length;
+        node.x = centerX + radius * Math.cos(angle);
+        node.y = centerY + radius * Math.sin(angle);
+      });
+    }
 
     // Create force simulation
     const simulation: any = d3
@@ -176,8 +183,13 @@ export const ForceDirectedGraph = ({ data }: { data: GraphData }) => {
         .on('end', dragended);
     }
 
-    // Run simulation for a while to warm it up
-    for (let i = 0; i < 300; i++) simulation.tick();
+    if (precomputed) {
+      // Already settled; the simulation only wakes up again when a node is dragged
+      simulation.alpha(0).stop();
+    } else {
+      // Run simulation for a while to warm it up
+      for (let i = 0; i < 300; i++) simulation.tick();
+    }
 
     return () => {
       simulation.stop();
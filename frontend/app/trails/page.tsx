@@ -2,12 +2,12 @@
 
 import { useCallback, useContext, useEffect, useRef, useState } from 'react';
 import { ForceDirectedGraph } from './force-directed-graph';
-import { supabase } from '@/utils/supabase/client';
 import { ThumbsDownIcon, ThumbsUpIcon, TreesIcon, XIcon } from 'lucide-react';
 import { cn } from '@/lib/utils';
 import { Button } from '@/components/ui/button';
 import { marked } from 'marked';
 import Link from 'next/link';
+import { useSearchParams } from 'next/navigation';
 
 import { AppContext } from '../layout';
 import { Toaster } from '@/components/ui/toaster';
@@ -16,12 +16,15 @@ import { useToast } from '@/hooks/use-toast';
 export default function TrailsPage() {
   const { appState, setAppState } = useContext(AppContext);
   const { toast } = useToast();
+  const searchParams = useSearchParams();
+  const trailheadId = searchParams.get('trailhead-id');
 
   const [graphData, setGraphData]: any = useState({ nodes: null, links: null });
   const [activeResource, setActiveResource]: any = useState(null);
   const [hoveredResource, setHoveredResource]: any = useState(null);
   const [showHoveredResource, setShowHoveredResource] =
     useState<boolean>(false);
+  const [jobStatus, setJobStatus] = useState<string | null>(null);
   const infoCardRef = useRef<any>(null);
 
   const handleMouseMove = useCallback(
@@ -40,66 +43,133 @@ export default function TrailsPage() {
     };
   }, [activeResource]);
 
-  // Fetch data from supabase
+  // Full resources (with descriptions) are fetched on demand and kept for the session
+  const resourceCache = useRef<Map<string, Promise<any>>>(new Map());
+  const fetchResource = useCallback((id: string) => {
+    if (!resourceCache.current.has(id)) {
+      const request = fetch(
+        `${process.env.NEXT_PUBLIC_BACKEND_URL}/api/resources/${id}`,
+      ).then((response) => {
+        if (!response.ok) throw new Error(`Failed to load resource ${id}`);
+        return response.json();
+      });
+      request.catch(() => resourceCache.current.delete(id));
+      resourceCache.current.set(id, request);
+    }
+    return resourceCache.current.get(id)!;
+  }, []);
+
+  // Fetch the compact graph (titles only) from the backend: just this hike's
+  // when one is selected, so a new hike shows up however many others exist
+  const loadGraph = useCallback(async () => {
+    const response = await fetch(
+      trailheadId
+        ? `${process.env.NEXT_PUBLIC_BACKEND_URL}/api/trailheads/${trailheadId}/graph`
+        : `${process.env.NEXT_PUBLIC_BACKEND_URL}/api/graph?limit=100`,
+    );
+    if (!response.ok) return;
+    const graph = await response.json();
+
+    setGraphData({
+      nodes: graph.nodes.map((node: any) => ({
+        id: node.id,
+        label: node.title,
+        x: node.x,
+        y: node.y,
+        color: node.trailhead ? '#648053' : node.hasImage ? '#71bf41' : null,
+        onClick: () => {
+          setActiveResource(node);
+          infoCardRef.current.style.cssText = `right: 15px; top: 15px;`;
+          fetchResource(node.id)
+            .then((resource) =>
+              setActiveResource((current: any) =>
+                current?.id === node.id ? resource : current,
+              ),
+            )
+            .catch(() => {});
+        },
+        onMouseenter: () => {
+          setHoveredResource(node);
+          setShowHoveredResource(true);
+          fetchResource(node.id)
+            .then((resource) =>
+              setHoveredResource((current: any) =>
+                current?.id === node.id ? resource : current,
+              ),
+            )
+            .catch(() => {});
+        },
+        onMouseout: () => {
+          setShowHoveredResource(false);
+        },
+      })),
+      links: graph.edges.map(([source, target]: string[]) => ({
+        source,
+        target,
+      })),
+    });
+  }, [trailheadId, fetchResource]);
+
   useEffect(() => {
     document.addEventListener('keydown', (e) => {
       if (e.key === 'Escape') setActiveResource(null);
     });
-
-    (async () => {
-      const trailhead_ids =
-        (await supabase.from('trails').select('trailhead_id'))?.data?.map(
-          ({ trailhead_id }) => trailhead_id,
-        ) ?? [];
-
-      // Get unique resource IDs
-      const edges = (await supabase.from('edges').select('*')).data ?? [];
-      const edgeIds =
-        (await supabase.from('edges').select('id_a, id_b')).data ?? [];
-      const allIds = [
-        ...new Set([
-          ...edgeIds.map((e) => e.id_a),
-          ...edgeIds.map((e) => e.id_b),
-        ]),
-      ];
-      const resources =
-        (await supabase.from('resources').select('*').in('id', allIds)).data ??
-        [];
-
-      setGraphData({
-        nodes: [
-          ...resources.map((resource) => ({
-            id: resource.id,
-            label: resource.title,
-            color: trailhead_ids.includes(resource.id)
-              ? '#648053'
-              : resource.image_url
-                ? '#71bf41'
-                : null,
-            onClick: () => {
-              setActiveResource(resource);
-              infoCardRef.current.style.cssText = `right: 15px; top: 15px;`;
-            },
-            onMouseenter: () => {
-              setHoveredResource(resource);
-              setShowHoveredResource(true);
-            },
-            onMouseout: () => {
-              setShowHoveredResource(false);
-            },
-          })),
-        ],
-        links: edges.map(({ id_a, id_b }) => ({ source: id_a, target: id_b })),
-      });
-    })();
   }, []);
 
+  useEffect(() => {
+    loadGraph();
+  }, [loadGraph]);
+
+  // Poll the hike generation job and redraw as new nodes are finished
+  useEffect(() => {
+    if (!trailheadId) return;
+
+    let cancelled = false;
+    let timeout: any = null;
+    let nodeCount = 0;
+
+    const poll = async () => {
+      const response = await fetch(
+        `${process.env.NEXT_PUBLIC_BACKEND_URL}/api/jobs/${trailheadId}`,
+      );
+      if (cancelled) return;
+      if (!response.ok) {
+        setJobStatus(null);
+        return;
+      }
+
+      const job = await response.json();
+      setJobStatus(job.status);
+
+      const finishedNodes = job.progress?.nodes?.length ?? 0;
+      if (finishedNodes !== nodeCount || job.status === 'completed') {
+        nodeCount = finishedNodes;
+        loadGraph();
+      }
+
+      if (job.status === 'queued' || job.status === 'running') {
+        timeout = setTimeout(poll, 2000);
+      }
+    };
+    poll();
+
+    return () => {
+      cancelled = true;
+      clearTimeout(timeout);
+    };
+  }, [trailheadId, loadGraph]);
+
   return (
     <div className="relative flex h-full">
       <Toaster />
 
       <p className="text-foreground absolute z-10 self-start rounded-br-md px-6 py-4 text-2xl font-medium">
         My Trails
+        {(jobStatus === 'queued' || jobStatus === 'running') && (
+          <span className="text-muted-foreground ml-3 text-sm">
+            Building trails...
+          </span>
+        )}
       </p>
 
       <div